@@ -3,33 +3,76 @@
 # ----------------------------------------------------------------------------#
 import json
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from babel import Locale
+from babel.dates import parse_pattern
+from functools import lru_cache
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort, \
+    stream_with_context, make_response, session
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
+from logging.handlers import RotatingFileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
-from operator import itemgetter  # for sorting lists of tuples
+from operator import attrgetter  # for grouping listing rows
+from itertools import groupby
+from pagination import keyset_page, sort_key, LINK_ARGS
+from search import Search, SearchVector, document_parts
+from genre_cache import GenreCache
 import re
+import click
+from itertools import chain
+from importer import copy_rows, run_import
+from cache import Cache
+from pool_metrics import PoolMetrics
+from booking import Bookings, MAX_SHOW_DURATION, free_gaps
+from heapq import merge
+from datetime import timedelta, timezone
+from calendar import Calendar
+from changes import ChangeLog
+from counters import ShowCounters
+from async_db import AsyncDatabase
+from request_metrics import RequestMetrics
+from replicas import ReplicaRouter, RoutingSQLAlchemy
+from areas import AreaIndex
+from matching import Matcher
+from jobs import JobQueue
+from read_model import ReadModel
+from facets import GenreFacets, Membership, members, popcount
+import ical
+import hashlib
+import threading
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
 
 app = Flask(__name__)
 moment = Moment(app)
-#app.config.from_object('config')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://sissi@localhost:5432/fyyur'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'any secret string'
-db = SQLAlchemy(app)
+# database URL, pool sizing and feature settings, overridable from the environment
+app.config.from_object('config')
+# GET requests read from SQLALCHEMY_REPLICA_URIS when any are configured
+db = RoutingSQLAlchemy(app)
+replica_router = ReplicaRouter(app, db)
+cache = Cache(app)
+pool_metrics = PoolMetrics()
+request_metrics = RequestMetrics(app)
+async_db = AsyncDatabase(app.config['SQLALCHEMY_DATABASE_URI'], app.config.get('SQLALCHEMY_REPLICA_URIS', []),
+                         instrument=request_metrics.instrument, **app.config['ASYNC_ENGINE_OPTIONS']) \
+    if app.config['ASYNC_DATABASE'] else None
 
 # connect to a local postgresql database
 migrate = Migrate(app, db)
 
 
+@app.before_request
+def instrument_engine():
+    # the engine is created lazily, so attach the pool and statement listeners on first use
+    pool_metrics.instrument(db.engine)
+    for engine in [db.engine] + replica_router.engines:
+        request_metrics.instrument(engine)
+
+
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
@@ -41,16 +84,22 @@ class Genre(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
 
+    # one row per genre name; genre_cache upserts against this index
+    __table_args__ = (db.Index('ix_Genre_name', 'name', unique=True),)
+
 
 # Association tables for Artist to Genre (many2many) and Venue to Genre (many2many)
+# The primary keys lead with genre_id; the second index serves "genres of this artist / venue".
 artist_genre_table = db.Table('artist_genre_table',
                               db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
-                              db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True)
+                              db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True),
+                              db.Index('ix_artist_genre_table_artist_id_genre_id', 'artist_id', 'genre_id')
                               )
 
 venue_genre_table = db.Table('venue_genre_table',
                              db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True),
-                             db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True)
+                             db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True),
+                             db.Index('ix_venue_genre_table_venue_id_genre_id', 'venue_id', 'genre_id')
                              )
 
 
@@ -74,6 +123,16 @@ class Venue(db.Model):
     seeking_description = db.Column(db.String(120))
 
     shows = db.relationship('Show', backref='venue', lazy=True)
+    # maintained by `show_counters` below
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # name, city, state and genre names; maintained by `search` below
+    search_vector = db.Column(SearchVector)
+
+    # area filters; the directory seeks on ix_Venue_listing (below)
+    __table_args__ = (db.Index('ix_Venue_state_city_name_id', 'state', 'city', 'name', 'id'),
+                      db.Index('ix_Venue_search_vector', 'search_vector', postgresql_using='gin'))
 
 
 class Artist(db.Model):
@@ -101,6 +160,27 @@ class Artist(db.Model):
     seeking_description = db.Column(db.String(120))
 
     shows = db.relationship('Show', backref='artist', lazy=True)
+    # maintained by `show_counters` below
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # name, city, state and genre names; maintained by `search` below
+    search_vector = db.Column(SearchVector)
+
+    # area filter of the API; the listing seeks on ix_Artist_listing (below)
+    __table_args__ = (db.Index('ix_Artist_state_city_id', 'state', 'city', 'id'),
+                      db.Index('ix_Artist_search_vector', 'search_vector', postgresql_using='gin'))
+
+
+# seek indexes of the venue directory and the artist listing, on the keys they sort by
+# (pagination.sort_key), so NULL names or areas do not end the listing early
+db.Index('ix_Venue_listing', *[sort_key(column) for column in (Venue.state, Venue.city, Venue.name, Venue.id)])
+db.Index('ix_Artist_listing', *[sort_key(column) for column in (Artist.name, Artist.id)])
+
+
+def default_end_time(context):
+    start_time = context.get_current_parameters()['start_time']
+    return start_time + timedelta(minutes=app.config['SHOW_DURATION_MINUTES'])
 
 
 # Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
@@ -109,26 +189,470 @@ class Show(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # bookings are the half-open interval [start_time, end_time), at most MAX_SHOW_DURATION long
+    end_time = db.Column(db.DateTime, nullable=False, default=default_end_time)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
 
+    # seek index for the paginated show listing, and range scans for booking conflicts.
+    # On Postgres, exclusion constraints (migration 5b0e93d7c1fa) also reject overlapping
+    # bookings of one venue or one artist.
+    __table_args__ = (db.Index('ix_Shows_start_time_id', 'start_time', 'id'),
+                      db.Index('ix_Shows_venue_id_start_time', 'venue_id', 'start_time'),
+                      db.Index('ix_Shows_artist_id_start_time', 'artist_id', 'start_time'))
+
+
+class Change(db.Model):
+    __tablename__ = 'Changes'
+
+    # one row per inserted, updated or deleted venue, artist or show; written by `change_log`
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    table_name = db.Column(db.String(40), nullable=False)
+    row_id = db.Column(db.Integer)
+    op = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # newest change of a table, and changes after a known id
+    __table_args__ = (db.Index('ix_Changes_table_name_id', 'table_name', 'id'),)
+
+
+class Area(db.Model):
+    __tablename__ = 'Area'
+
+    # one row per (state, city) with venues in it; maintained by `area_index` below
+    id = db.Column(db.Integer, primary_key=True)
+    state = db.Column(db.String(120), nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    venue_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.Index('ix_Area_state_city', 'state', 'city', unique=True),)
+
+
+class CounterWatermark(db.Model):
+    __tablename__ = 'CounterWatermark'
+
+    # single row: shows starting after rolled_at are counted as upcoming
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_at = db.Column(db.DateTime, nullable=False)
+
+
+class Match(db.Model):
+    __tablename__ = 'Matches'
+
+    # the best venues for each seeking artist (owner 'artist') and the best artists for each
+    # seeking venue (owner 'venue'); written by `flask refresh-matches`
+    owner = db.Column(db.String(6), primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    # one owner's list, in rank order
+    __table_args__ = (db.Index('ix_Matches_owner_artist_id_rank', 'owner', 'artist_id', 'rank'),
+                      db.Index('ix_Matches_owner_venue_id_rank', 'owner', 'venue_id', 'rank'))
+
+
+class MatchWatermark(db.Model):
+    __tablename__ = 'MatchWatermark'
+
+    # single row: the Matches table reflects the change log up to change_id
+    id = db.Column(db.Integer, primary_key=True)
+    change_id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime)
+
+
+class Job(db.Model):
+    __tablename__ = 'Jobs'
+
+    # follow-up work queued by writes and run by `flask worker`; see `jobs` below
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    key = db.Column(db.String(120))
+    args = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # workers claim the oldest due job; a key is unique among the jobs still waiting
+    __table_args__ = (db.Index('ix_Jobs_status_run_at', 'status', 'run_at'),
+                      db.Index('ix_Jobs_key', 'key', unique=True,
+                               postgresql_where=db.text("status = 'queued' AND locked_at IS NULL"),
+                               sqlite_where=db.text("status = 'queued' AND locked_at IS NULL")))
+
+
+search = Search(db, Venue, Artist)
+genre_cache = GenreCache(db, Genre)
+change_log = ChangeLog(db, Change, Venue, Artist, Show)
+show_counters = ShowCounters(db, Show, CounterWatermark, {Venue: 'venue_id', Artist: 'artist_id'})
+area_index = AreaIndex(db, Area, Venue)
+matcher = Matcher(db, Match, MatchWatermark, Change, Show, {
+    'artist': (Artist, Artist.seeking_venue, artist_genre_table),
+    'venue': (Venue, Venue.seeking_talent, venue_genre_table)
+}, k=app.config['MATCHES_PER_PAGE'])
+jobs = JobQueue(app, db, Job)
+# listings and searches served from memory, see read_model.py
+read_model = ReadModel(app, db, Change, Genre, Show, (Venue, venue_genre_table), (Artist, artist_genre_table)) \
+    if app.config['READ_MODEL'] else None
+genre_facets = GenreFacets(app, db, Change, Genre, {'venue': (Venue, venue_genre_table),
+                                                    'artist': (Artist, artist_genre_table)})
+
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+
+
+@lru_cache(maxsize=64)
+def compiled_format(format, locale='en'):
+    # babel pattern and locale, parsed once per (format, locale) instead of on every call
+    return parse_pattern(DATETIME_FORMATS.get(format, format)), Locale.parse(locale)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    # value is a datetime, or a string for dateutil to parse
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    pattern, locale = compiled_format(format, locale)
+    return pattern.apply(value, locale)
+
+
+def format_datetimes(values, format='medium', locale='en'):
+    # format a whole column of show times with one pattern lookup
+    pattern, locale = compiled_format(format, locale)
+    return [pattern.apply(value if isinstance(value, datetime) else dateutil.parser.parse(value), locale)
+            for value in values]
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
 
+# ----------------------------------------------------------------------------#
+# Normalization.
+# ----------------------------------------------------------------------------#
+# Shared by the create forms and the bulk import, so both store the same shapes.
+
+def _text(data, key):
+    return (data.get(key) or '').strip()
+
+
+def seeking_flag(value):
+    # BooleanField gives True/False; imported files may spell it Yes / y / true / 1
+    return value is True or str(value or '').strip().lower() in ('yes', 'y', 'true', '1')
+
+
+def split_genres(value):
+    # ['Alternative', 'Classical'] from a form or JSON list, or "Alternative;Classical" from a CSV cell
+    if isinstance(value, str):
+        value = re.split('[;,]', value)
+    return [genre.strip() for genre in value or [] if genre and genre.strip()]
+
+
+def required(values, *keys):
+    missing = [key for key in keys if not values.get(key)]
+    if missing:
+        raise ValueError('missing ' + ', '.join(missing))
+    return values
+
+
+def artist_values(data):
+    # Normalize DB.  Strip anything from phone that isn't a number
+    return {
+        "name": _text(data, 'name'),
+        "city": _text(data, 'city'),
+        "state": _text(data, 'state'),
+        "phone": re.sub(r'\D', '', data.get('phone') or ''),  # e.g. (819) 392-1234 --> 8193921234
+        "genres": split_genres(data.get('genres')),  # ['Alternative', 'Classical', 'Country']
+        "seeking_venue": seeking_flag(data.get('seeking_venue')),
+        "seeking_description": _text(data, 'seeking_description'),
+        "image_link": _text(data, 'image_link'),
+        "website": _text(data, 'website_link'),
+        "facebook_link": _text(data, 'facebook_link')
+    }
+
+
+def venue_values(data):
+    values = artist_values(data)
+    del values['seeking_venue']
+    values['address'] = _text(data, 'address')
+    values['seeking_talent'] = seeking_flag(data.get('seeking_talent'))
+    return values
+
+
+def _datetime(value):
+    return value if isinstance(value, datetime) else dateutil.parser.parse(str(value or ''))
+
+
+def show_times(data):
+    # (start, end) of a booking; the end defaults to SHOW_DURATION_MINUTES after the start
+    start_time = _datetime(data.get('start_time'))
+    if data.get('end_time'):
+        end_time = _datetime(data.get('end_time'))
+    else:
+        end_time = start_time + timedelta(minutes=int(data.get('duration_minutes') or app.config['SHOW_DURATION_MINUTES']))
+    if not start_time < end_time <= start_time + MAX_SHOW_DURATION:
+        raise ValueError('end_time must be after start_time and at most {:.0f} hours later'.format(
+            MAX_SHOW_DURATION.total_seconds() / 3600))
+    return start_time, end_time
+
+
+def show_values(data):
+    start_time, end_time = show_times(data)
+    return {
+        "artist_id": int(data['artist_id']),
+        "venue_id": int(data['venue_id']),
+        "start_time": start_time,
+        "end_time": end_time
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+
+def venues_with_upcoming_count():
+    # One row per venue: id, name, city, state and num_upcoming_shows, read from the venue's
+    # counter column (current as of the last counter roll)
+    return db.session.query(Venue.id, Venue.name, Venue.city, Venue.state,
+                            Venue.upcoming_shows_count.label('num_upcoming_shows'))
+
+
+# a genre selection with more matches than this is filtered with EXISTS instead of an id list
+FACET_ID_LIST_LIMIT = 1000
+
+
+def genre_filter(model, genre_table, key, selected, genres, match_all):
+    """Clause keeping the rows of model in selected, the bitset genre_facets gave for genres.
+
+    selected must come from a fresh select(), caught up with the change log, so the id list
+    and EXISTS paths see the same rows.
+    """
+    if popcount(selected) <= FACET_ID_LIST_LIMIT:
+        return model.id.in_(members(selected))
+    owned = getattr(genre_table.c, key) == model.id
+    genre_ids = [genre_facets.genre_ids[name] for name in genres if name in genre_facets.genre_ids]
+    if match_all:
+        return db.and_(*[db.exists().where(owned, genre_table.c.genre_id == genre_id) for genre_id in genre_ids])
+    return db.exists().where(owned, genre_table.c.genre_id.in_(genre_ids))
+
+
+def genre_facet_links(genres, counts):
+    # one link per genre with matches (or already chosen), adding it to or dropping it from ?genre=
+    args = {key: values for key, values in request.args.lists() if key in LINK_ARGS and key != 'genre'}
+    links = []
+    for name, count in counts:
+        chosen = name in genres
+        if count or chosen:
+            toggled = [genre for genre in genres if genre != name] if chosen else genres + [name]
+            links.append({"name": name, "count": count, "chosen": chosen, "args": dict(args, genre=toggled)})
+    return links
+
+
+# longest window the available-venue finder will sweep in one request
+MAX_SEARCH_WINDOW = timedelta(days=92)
+
+
+def booked_between(venue_ids, artist_ids, start_time, end_time):
+    """Bookings of the given venues and artists overlapping [start_time, end_time).
+
+    One range query over (venue_id, start_time) / (artist_id, start_time), returned as a
+    Bookings index per venue and per artist.
+    """
+    venues, artists = Bookings(), Bookings()
+    if not venue_ids and not artist_ids:
+        return venues, artists
+    rows = db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time) \
+        .filter(db.or_(Show.venue_id.in_(venue_ids), Show.artist_id.in_(artist_ids)),
+                Show.start_time > start_time - MAX_SHOW_DURATION,
+                Show.start_time < end_time,
+                Show.end_time > start_time)
+    for show_id, venue_id, artist_id, start, end in rows:
+        venues.add(venue_id, start, end, show_id)
+        artists.add(artist_id, start, end, show_id)
+    return venues, artists
+
+
+def slot_conflicts(venue_id, artist_id, start_time, end_time):
+    # bookings that keep the venue or the artist from taking [start_time, end_time); empty if free
+    venues, artists = booked_between([venue_id] if venue_id else [], [artist_id] if artist_id else [],
+                                     start_time, end_time)
+    conflicts = {}
+    for bookings, key in ((venues, venue_id), (artists, artist_id)):
+        for start, end, show_id in bookings.intervals(key):
+            if start < end_time and end > start_time:
+                conflicts[show_id] = (start, end)
+    return [{"show_id": show_id, "start_time": start.isoformat(), "end_time": end.isoformat()}
+            for show_id, (start, end) in sorted(conflicts.items(), key=lambda item: item[1])]
+
+
+def available_venues(artist_id, state, city, start_time, end_time, duration, match_genres=True):
+    """Venues in the area with gaps of at least `duration` in [start_time, end_time) when
+    neither the venue nor the artist is booked.
+
+    Three queries however many venues: the artist's genres, the area's venues with their
+    genre overlap, and every booking of those venues and the artist in the window. Free
+    gaps then come from one sweep over each venue's sorted bookings merged with the artist's.
+    """
+    genre_ids = [i for (i,) in db.session.query(artist_genre_table.c.genre_id)
+                 .filter(artist_genre_table.c.artist_id == artist_id)]
+    shared_genres = db.func.count(venue_genre_table.c.genre_id).label('shared_genres')
+    query = db.session.query(Venue.id, Venue.name, shared_genres) \
+        .outerjoin(venue_genre_table, db.and_(venue_genre_table.c.venue_id == Venue.id,
+                                              venue_genre_table.c.genre_id.in_(genre_ids))) \
+        .filter(Venue.state == state) \
+        .group_by(Venue.id)
+    if city:
+        query = query.filter(Venue.city == city)
+    if match_genres:
+        query = query.having(shared_genres > 0)
+    candidates = query.all()
+
+    venues, artists = booked_between([venue.id for venue in candidates], [artist_id], start_time, end_time)
+    results = []
+    for venue in candidates:
+        busy = merge(venues.intervals(venue.id), artists.intervals(artist_id))
+        gaps = free_gaps(busy, start_time, end_time, duration)
+        if gaps:
+            results.append({
+                "venue_id": venue.id,
+                "venue_name": venue.name,
+                "shared_genres": venue.shared_genres,
+                "free_slots": [{"start_time": start.isoformat(), "end_time": end.isoformat()} for start, end in gaps]
+            })
+    # best genre match first, then the venue with the most open time
+    results.sort(key=lambda venue: (-venue['shared_genres'], -len(venue['free_slots']), venue['venue_name'] or ''))
+    return results
+
+
+def shows_between(owner_column, owner_id, counterpart, upcoming, now):
+    # Shows of one venue (or artist) on one side of `now`, joined to the name and image of the
+    # counterpart artist (or venue), so a detail page costs one query per side however many shows
+    when = Show.start_time > now if upcoming else Show.start_time < now
+    prefix = counterpart.__tablename__.lower()
+    return db.select(getattr(Show, prefix + '_id'),
+                     counterpart.name.label(prefix + '_name'),
+                     counterpart.image_link.label(prefix + '_image_link'),
+                     Show.start_time) \
+        .join(counterpart, counterpart.id == getattr(Show, prefix + '_id')) \
+        .where(owner_column == owner_id, when) \
+        .order_by(Show.start_time)
+
+
+def shows_starting_between(start, end, owner_column=None, owner_id=None):
+    # Shows starting in [start, end), all or those of one venue (or artist), with the names
+    # and addresses a calendar shows: a range scan on ix_Shows_start_time_id, or on the
+    # owner's (owner_id, start_time) index
+    query = db.session.query(Show.id, Show.start_time, Show.end_time,
+                             Show.venue_id, Venue.name.label('venue_name'), Venue.address, Venue.city, Venue.state,
+                             Show.artist_id, Artist.name.label('artist_name')) \
+        .join(Venue, Venue.id == Show.venue_id) \
+        .join(Artist, Artist.id == Show.artist_id) \
+        .filter(Show.start_time >= start, Show.start_time < end)
+    if owner_column is not None:
+        query = query.filter(owner_column == owner_id)
+    return query.order_by(Show.start_time, Show.id)
+
+
+def detail_page(model, genre_table, key, owner_id, counterpart):
+    """(entity row or None, genre names, past shows, upcoming shows, matches) of a venue or artist page.
+
+    Five independent queries: run one after the other on the session, or concurrently on
+    the async engine when ASYNC_DATABASE is set (reading from the same replica as the session).
+    """
+    now = datetime.now()
+    owner_column = getattr(Show, key)
+    statements = [
+        db.select(*[column for column in model.__table__.c if column.key != 'search_vector'])
+        .where(model.id == owner_id),
+        db.select(Genre.name).join(genre_table, genre_table.c.genre_id == Genre.id)
+        .where(getattr(genre_table.c, key) == owner_id),
+        shows_between(owner_column, owner_id, counterpart, False, now),
+        shows_between(owner_column, owner_id, counterpart, True, now),
+        # recommended counterparts, precomputed by `flask refresh-matches`
+        matcher.statement(key[:-len('_id')], owner_id, counterpart)
+    ]
+    if async_db is not None:
+        entities, genres, past, upcoming, matches = async_db.all(*statements, bind=replica_router.read_engine())
+    else:
+        entities, genres, past, upcoming, matches = [db.session.execute(statement).all() for statement in statements]
+    shows = []
+    for rows in (past, upcoming):
+        start_times = format_datetimes([row.start_time for row in rows], 'full')
+        shows.append([dict(row._asdict(), start_time=start_time) for row, start_time in zip(rows, start_times)])
+    return (entities[0] if entities else None), [name for (name,) in genres], shows[0], shows[1], \
+        [row._asdict() for row in matches]
+
+
+# ----------------------------------------------------------------------------#
+# Cache invalidation.
+# ----------------------------------------------------------------------------#
+# Called after a successful commit with the pages the change shows up on.
+
+def invalidate_venue(venue_id, artist_ids=None):
+    # the venue's page, the listings naming it and the pages of artists who play there
+    if artist_ids is None:
+        artist_ids = [i for (i,) in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+    cache.invalidate('venues', 'shows', 'venue:{}'.format(venue_id), *['artist:{}'.format(i) for i in artist_ids])
+
+
+def invalidate_artist(artist_id):
+    venue_ids = [i for (i,) in db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+    cache.invalidate('artists', 'shows', 'artist:{}'.format(artist_id), *['venue:{}'.format(i) for i in venue_ids])
+
+
+def invalidate_show(show):
+    cache.invalidate('shows', 'venues', 'venue:{}'.format(show.venue_id), 'artist:{}'.format(show.artist_id))
+
+
+# ----------------------------------------------------------------------------#
+# Background jobs.
+# ----------------------------------------------------------------------------#
+# Queued by the write handlers before they commit, run by `flask worker` (or the
+# JOB_WORKER_THREADS in-process workers) once the write is committed. Cache invalidation
+# stays in the request: the writer must see its change, and a worker process could only
+# reach a shared cache.
+
+if app.config['JOB_WORKERS'] and not cache.shared:
+    raise RuntimeError('JOB_WORKERS needs a page cache shared with the worker processes: set REDIS_URL')
+
+
+def queue_follow_up():
+    """Queue the work a write leaves for later; call before the commit."""
+    if jobs.enabled and app.config['MATCHES_AUTO_REFRESH']:
+        jobs.enqueue('refresh-matches', key='refresh-matches')
+
+
+@jobs.task('refresh-matches')
+def refresh_matches(rebuild=False):
+    # commits itself, so the pages are invalidated only once the new lists are visible
+    refreshed = matcher.refresh(rebuild=rebuild)
+    db.session.commit()
+    cache.invalidate(*['artist:{}'.format(i) for i in refreshed['artist']],
+                     *['venue:{}'.format(i) for i in refreshed['venue']])
+    return refreshed
+
+
+def roll_counters():
+    changed = show_counters.roll()
+    change_log.record(Venue.__tablename__, changed.get(Venue, ()), 'counts')
+    db.session.commit()
+    if changed.get(Venue):
+        cache.invalidate('venues')
+    return changed
+
+
+if app.config['ROLL_COUNTERS_SECONDS']:
+    # with workers the counters roll themselves; without, run `flask roll-counters` from cron
+    jobs.every('roll-counters', app.config['ROLL_COUNTERS_SECONDS'])(roll_counters)
+
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
@@ -142,69 +666,83 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cache.cached('venues')
 def venues():
-    #  replace with real venues data.
-    #  num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-    venues = Venue.query.all()
+    #  num_upcoming_shows is a counter column: one query returns a page of venues
+    #  with their upcoming show count, already ordered by state then city.
+    #  ?state= (and &city=) narrow the directory to one state (or area); the area links
+    #  above it come from the Area table instead of the venues.
+    #  With READ_MODEL both come from memory instead.
+    #  ?genre= (repeatable, &match=any for either genre) filters by genre; the genre facets
+    #  count the venues of the area shown.
+    state, city = request.args.get('state'), request.args.get('city')
+    genres, match_all = request.args.getlist('genre'), request.args.get('match') != 'any'
+    selected, genre_counts = genre_facets.select('venue', genres, match_all, state, city,
+                                                 fresh=bool(genres) and read_model is None)
+    columns = [Venue.state, Venue.city, Venue.name, Venue.id]
+    area = tuple(filter(None, [state, state and city]))
+    if read_model is not None:
+        page = read_model.page('venue', columns, request.args, area,
+                               Membership(selected).__contains__ if genres else None)
+    else:
+        query = venues_with_upcoming_count()
+        if state:
+            query = query.filter(sort_key(Venue.state) == state)
+            if city:
+                query = query.filter(sort_key(Venue.city) == city)
+        if genres:
+            query = query.filter(genre_filter(Venue, venue_genre_table, 'venue_id', selected, genres, match_all))
+        page = keyset_page(query, columns, request.args, fixed=len(area))
+
+    if not state:
+        # one link per state
+        counts = read_model.area_counts() if read_model is not None else \
+            db.session.query(Area.state, db.func.sum(Area.venue_count)).group_by(Area.state).order_by(Area.state)
+        area_links = [{"label": area_state, "args": {"state": area_state}, "venue_count": count}
+                      for area_state, count in counts]
+    elif not city:
+        counts = read_model.area_counts(state) if read_model is not None else \
+            db.session.query(Area.city, Area.venue_count).filter(Area.state == state).order_by(Area.city)
+        area_links = [{"label": area_city, "args": {"state": state, "city": area_city}, "venue_count": count}
+                      for area_city, count in counts]
+    else:
+        area_links = []
 
     data = []
-
-    cities_states = set()
-    for venue in venues:
-        cities_states.add((venue.city, venue.state))
-
-    cities_states = list(cities_states)
-    # sort on second element which is state first, then sort on city
-    cities_states.sort(key=itemgetter(1, 0))
-
-    now = datetime.now()
-
-    for loc in cities_states:
-        # for this location, see if there are any venues
-        venues_list = []
-        for venue in venues:
-            if (venue.city == loc[0]) and (venue.state == loc[1]):
-                venue_shows = Show.query.filter_by(venue_id=venue.id).all()
-                num_upcoming = 0
-                for show in venue_shows:
-                    if show.start_time > now:
-                        num_upcoming += 1
-
-                venues_list.append({
-                    "id": venue.id,
-                    "name": venue.name,
-                    "num_upcoming_shows": num_upcoming
-                })
-
+    # rows arrive sorted, so each (city, state) area is a consecutive run
+    for (city, state), area_rows in groupby(page['items'], key=attrgetter('city', 'state')):
         data.append({
-            "city": loc[0],
-            "state": loc[1],
-            "venues": venues_list
+            "city": city,
+            "state": state,
+            "venues": [{
+                "id": venue.id,
+                "name": venue.name,
+                "num_upcoming_shows": venue.num_upcoming_shows
+            } for venue in area_rows]
         })
 
-    return render_template('pages/venues.html', areas=data)
+    return render_template('pages/venues.html', areas=data, page=page, area_links=area_links, state=state,
+                           facets=genre_facet_links(genres, genre_counts))
 
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-    # implement search on venues with partial string search. Ensure it is case-insensitive.
+    # full-text search on name, city, state and genres, matching word prefixes case-insensitively.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
     search_term = request.form.get('search_term', '').strip()
-    venues = Venue.query.filter(Venue.name.ilike('%' + search_term + '%')).all()
+    if read_model is not None:
+        venues = read_model.search('venue', search_term)
+    else:
+        match, rank = search.match(Venue, search_term, app.config['SEARCH_TRIGRAM'])
+        # matches and their upcoming show counts come back from a single query
+        venues = venues_with_upcoming_count().filter(match).order_by(rank.desc(), Venue.id).all()
     venue_list = []
-    now = datetime.now()
     for venue in venues:
-        venue_shows = Show.query.filter_by(venue_id=venue.id).all()
-        num_upcomping = 0
-        for show in venue_shows:
-            if show.start_time > now:
-                num_upcomping += 1
-
         venue_list.append({
             "id": venue.id,
             "name": venue.name,
-            "num_upcoming_shows": num_upcomping
+            "num_upcoming_shows": venue.num_upcoming_shows
         })
 
     response = {
@@ -216,36 +754,19 @@ def search_venues():
 
 
 @app.route('/venues/<int:venue_id>')
+@cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
     # replace with real venue data from the venues table, using venue_id
-    venue = Venue.query.get(venue_id)
+    # the venue, its genres, its past / upcoming shows and its recommended artists come from
+    # five independent queries
+    venue, genres, past_shows, upcoming_shows, matches = detail_page(Venue, venue_genre_table, 'venue_id', venue_id,
+                                                                     Artist)
     if not venue:
         return redirect(url_for('index'))
     else:
-        genres = [genre.name for genre in venue.genres]
-        past_shows = []
-        past_shows_count = 0
-        upcoming_shows = []
-        upcoming_shows_count = 0
-        now = datetime.now()
-        for show in venue.shows:
-            if show.start_time > now:
-                upcoming_shows_count += 1
-                upcoming_shows.append({
-                    "artist_id": show.artist_id,
-                    "artist_name": show.artist.name,
-                    "artist_image_link": show.artist.image_link,
-                    "start_time": format_datetime(str(show.start_time))
-                })
-            if show.start_time < now:
-                past_shows_count += 1
-                past_shows.append({
-                    "artist_id": show.artist_id,
-                    "artist_name": show.artist.name,
-                    "artist_image_link": show.artist.image_link,
-                    "start_time": format_datetime(str(show.start_time))
-                })
+        past_shows_count = len(past_shows)
+        upcoming_shows_count = len(upcoming_shows)
 
         data = {
             "id": venue_id,
@@ -264,7 +785,8 @@ def show_venue(venue_id):
             "past_shows": past_shows,
             "past_shows_count": past_shows_count,
             "upcoming_shows": upcoming_shows,
-            "upcoming_shows_count": upcoming_shows_count
+            "upcoming_shows_count": upcoming_shows_count,
+            "matches": matches
         }
 
     return render_template('pages/show_venue.html', venue=data)
@@ -282,40 +804,18 @@ def create_venue_form():
 @app.route('/venues/create', methods=['POST'])
 def create_venue_submission():
     form = VenueForm()
-
-    name = form.name.data.strip()
-    city = form.city.data.strip()
-    state = form.state.data
-    address = form.address.data.strip()
-    # Normalize DB.  Strip anything from phone that isn't a number
-    phone = form.phone.data
-    phone = re.sub('\D', '', phone)  # e.g. (819) 392-1234 --> 8193921234
-    genres = form.genres.data  # ['Alternative', 'Classical', 'Country']
-    seeking_talent = True if form.seeking_talent.data == 'Yes' else False
-    seeking_description = form.seeking_description.data.strip()
-    image_link = form.image_link.data.strip()
-    website = form.website_link.data.strip()
-    facebook_link = form.facebook_link.data.strip()
+    values = venue_values(form.data)
+    genres = values.pop('genres')
 
     try:
-        new_venue = Venue(name=name, city=city, state=state, address=address, phone=phone, \
-                          seeking_talent=seeking_talent, seeking_description=seeking_description, image_link=image_link, \
-                          website= website, facebook_link=facebook_link)
-        for genre in genres:
-            fetch_genre = Genre.query.filter_by(
-                name=genre).one_or_none()  # Throws an exception if more than one returned, returns None if none
-            if fetch_genre:
-                # if found a genre, append it to the list
-                new_venue.genres.append(fetch_genre)
-
-            else:
-                # fetch_genre was None. It's not created yet, so create it
-                new_genre = Genre(name=genre)
-                db.session.add(new_genre)
-                new_venue.genres.append(new_genre)  # Create a new Genre item and append it
+        new_venue = Venue(**values)
+        # cached genres cost nothing, missing ones are upserted in at most two statements
+        new_venue.genres = genre_cache.resolve(genres)
 
         db.session.add(new_venue)
+        queue_follow_up()
         db.session.commit()
+        cache.invalidate('venues')
         # on successful db insert, flash success
         flash('Venue' + request.form['name'] + 'was successfully added !')
 
@@ -365,21 +865,17 @@ def edit_venue_submission(venue_id):
     # take values from the form submitted, and update existing
     # venue record with ID <venue_id> using the new attributes
     form = VenueForm()
+    values = venue_values(form.data)
+    genres = values.pop('genres')
     try:
         venue = Venue.query.get(venue_id)
-        venue.name = request.form['name'],
-        venue.city = request.form['city'],
-        venue.state = request.form['state'],
-        venue.address = request.form['address'],
-        venue.phone = request.form['phone'],
-        venue.genres = request.form.getlist('genres'),
-        venue.image_link = request.form['image_link'],
-        venue.facebook_link = request.form['facebook_link'],
-        venue.website = request.form['website'],
-        venue.seeking_talent = json.loads(request.form['seeking_talent'].lower()),
-        venue.seeking_description = request.form['seeking_description']
+        for key, value in values.items():
+            setattr(venue, key, value)
+        venue.genres = genre_cache.resolve(genres)
 
+        queue_follow_up()
         db.session.commit()
+        invalidate_venue(venue_id)
         # on successful db insert, flash success
         flash('Venue' + request.form['name'] + 'was successfully added !')
 
@@ -407,33 +903,52 @@ def delete_venue(venue_id):
         return redirect(url_for('index'))
     else:
         try:
+            artist_ids = [i for (i,) in db.session.query(Show.artist_id).filter(Show.venue_id == venue.id).distinct()]
             db.session.delete(venue)
+            queue_follow_up()
             db.session.commit()
+            invalidate_venue(venue.id, artist_ids)
         except:
             db.session.rollback()
             flash('An error occurred deleting venue' + venue.name)
+            return jsonify({'success': False}), 500
         finally:
             db.session.close()
 
-    return None
+    return jsonify({'success': True})
 
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cache.cached('artists')
 def artists():
-    # replace with real data returned from querying the database
-    data = Artist.query.all()
-    return render_template('pages/artists.html', artists=data)
+    # ?genre= (repeatable) keeps artists with every genre given, or any of them with &match=any
+    genres, match_all = request.args.getlist('genre'), request.args.get('match') != 'any'
+    selected, genre_counts = genre_facets.select('artist', genres, match_all,
+                                                 fresh=bool(genres) and read_model is None)
+    if read_model is not None:
+        page = read_model.page('artist', [Artist.name, Artist.id], request.args,
+                               keep=Membership(selected).__contains__ if genres else None)
+    else:
+        query = db.session.query(Artist.id, Artist.name)
+        if genres:
+            query = query.filter(genre_filter(Artist, artist_genre_table, 'artist_id', selected, genres, match_all))
+        page = keyset_page(query, [Artist.name, Artist.id], request.args)
+    return render_template('pages/artists.html', artists=page['items'], page=page,
+                           facets=genre_facet_links(genres, genre_counts))
 
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-    # implement search on artists with partial string search. Ensure it is case-insensitive.
-    # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
+    # full-text search on name, city, state and genres, matching word prefixes case-insensitively.
     # search for "band" should return "The Wild Sax Band".
     search_term = request.form.get('search_term', '')
-    result = db.session.query(Artist).filter(Artist.name.ilike(f'%{search_term}%')).all()
+    if read_model is not None:
+        result = read_model.search('artist', search_term)
+    else:
+        match, rank = search.match(Artist, search_term, app.config['SEARCH_TRIGRAM'])
+        result = db.session.query(Artist).filter(match).order_by(rank.desc(), Artist.id).all()
     count = len(result)
     response = {
         "count": count,
@@ -443,35 +958,19 @@ def search_artists():
 
 
 @app.route('/artists/<int:artist_id>')
+@cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
     # replace with real artist data from the artist table, using artist_id
-    artist = Artist.query.get(artist_id)
-    genres = [genre.name for genre in artist.genres]
+    # the artist, its genres, its past / upcoming shows and its recommended venues come from
+    # five independent queries
+    artist, genres, past_shows, upcoming_shows, matches = detail_page(Artist, artist_genre_table, 'artist_id',
+                                                                      artist_id, Venue)
+    if not artist:
+        return redirect(url_for('index'))
 
-    past_shows = []
-    past_shows_count = 0
-    upcoming_shows = []
-    upcoming_shows_count = 0
-    now = datetime.now()
-
-    for show in artist.shows:
-        if show.start_time > now:
-            upcoming_shows_count += 1
-            upcoming_shows.append({
-                "venue_id": show.venue_id,
-                "venue_name": show.venue.name,
-                "venue_image_link": show.venue.image_link,
-                "start_time": format_datetime(str(show.start_time))
-            })
-        if show.start_time < now:
-            past_shows_count += 1
-            past_shows.append({
-                "venue_id": show.venue_id,
-                "venue_name": show.venue.name,
-                "venue_image_link": show.venue.image_link,
-                "start_time": format_datetime(str(show.start_time))
-            })
+    past_shows_count = len(past_shows)
+    upcoming_shows_count = len(upcoming_shows)
 
     data = {
         "id": artist_id,
@@ -490,12 +989,42 @@ def show_artist(artist_id):
         "past_shows": past_shows,
         "past_shows_count": past_shows_count,
         "upcoming_shows": upcoming_shows,
-        "upcoming_shows_count": upcoming_shows_count
+        "upcoming_shows_count": upcoming_shows_count,
+        "matches": matches
     }
 
     return render_template('pages/show_artist.html', artist=data)
 
 
+@app.route('/artists/<int:artist_id>/available-venues')
+def artist_available_venues(artist_id):
+    # ?state=CA[&city=...][&start_time=...&end_time=...][&duration_minutes=...][&match_genres=0]
+    state = request.args.get('state', '').strip()
+    if not state:
+        return jsonify({"error": "state is required"}), 400
+    try:
+        start_time = _datetime(request.args['start_time']) if request.args.get('start_time') else datetime.now()
+        end_time = _datetime(request.args['end_time']) if request.args.get('end_time') \
+            else start_time + timedelta(days=30)
+        duration = timedelta(minutes=request.args.get('duration_minutes', app.config['SHOW_DURATION_MINUTES'], type=int))
+    except (ValueError, OverflowError) as e:
+        return jsonify({"error": str(e)}), 400
+    if not start_time < end_time <= start_time + MAX_SEARCH_WINDOW:
+        return jsonify({"error": "the window must end after it starts and span at most {} days".format(
+            MAX_SEARCH_WINDOW.days)}), 400
+    if not timedelta(0) < duration <= MAX_SHOW_DURATION:
+        return jsonify({"error": "duration_minutes out of range"}), 400
+
+    venues = available_venues(artist_id, state, request.args.get('city', '').strip(), start_time, end_time,
+                              duration, request.args.get('match_genres', '1') != '0')
+    return jsonify({
+        "artist_id": artist_id,
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat(),
+        "venues": venues
+    })
+
+
 #  Create
 #  ----------------------------------------------------------------
 
@@ -511,36 +1040,17 @@ def create_artist_submission():
     # insert form data as a new Venue record in the db, instead
     # modify data to be the data object returned from db insertion
     form = ArtistForm()
-    name = form.name.data.strip()
-    city = form.city.data.strip()
-    state = form.state.data
-    phone = form.phone.data
-    phone = re.sub('\D', '', phone)
-    genres = form.genres.data  # ['Alternative', 'Classical', 'Country']
-    seeking_venue = True if form.seeking_venue.data == 'Yes' else False
-    seeking_description = form.seeking_description.data.strip()
-    image_link = form.image_link.data.strip()
-    website = form.website_link.data.strip()
-    facebook_link = form.facebook_link.data.strip()
+    values = artist_values(form.data)
+    genres = values.pop('genres')
 
     try:
-        new_artist = Artist(name=name, city=city, state=state, phone=phone, seeking_venue=seeking_venue,\
-                         seeking_description=seeking_description, image_link=image_link, \
-                          website= website, facebook_link=facebook_link)
-        for genre in genres:
-            fetch_genre = Genre.query.filter_by(
-               name=genre).one_or_none()  # Throws an exception if more than one returned, returns None if none
-            if fetch_genre:
-                # if found a genre, append it to the list
-                new_artist.genres.append(fetch_genre)
-
-            else:
-                # fetch_genre was None. It's not created yet, so create it
-                new_genre = Genre(name=genre)
-                db.session.add(new_genre)
-                new_artist.genres.append(new_genre)  # Create a new Genre item and append it
+        new_artist = Artist(**values)
+        # cached genres cost nothing, missing ones are upserted in at most two statements
+        new_artist.genres = genre_cache.resolve(genres)
         db.session.add(new_artist)
+        queue_follow_up()
         db.session.commit()
+        cache.invalidate('artists')
         # on successful db insert, flash success
         flash('Artist ' + request.form['name'] + ' was successfully listed!')
     # on unsuccessful db insert, flash an error instead.
@@ -590,18 +1100,17 @@ def edit_artist_submission(artist_id):
     # take values from the form submitted, and update existing
     # artist record with ID <artist_id> using the new attributes
     form = ArtistForm()
+    values = artist_values(form.data)
+    genres = values.pop('genres')
     try:
         artist = Artist.query.get(artist_id)
-        artist.name = request.form['name'],
-        artist.city = request.form['city'],
-        artist.state = request.form['state'],
-        artist.phone = request.form['phone'],
-        artist.genres = request.form.getlist('genres'),
-        artist.website = request.form['website'],
-        artist.seeking_venue = request.form['seeking_venue'],
-        artist.seeking_description = request.form['seeking_description']
+        for key, value in values.items():
+            setattr(artist, key, value)
+        artist.genres = genre_cache.resolve(genres)
 
+        queue_follow_up()
         db.session.commit()
+        invalidate_artist(artist_id)
 
     except Exception as e:
         print(f'Exception "{e}" in edit_artist_submission()')
@@ -616,22 +1125,48 @@ def edit_artist_submission(artist_id):
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cache.cached('shows')
 def shows():
-    # displays list of shows at /shows
-    # replace with real venues data.
-    data = Show.query.join(Artist, Artist.id == Show.artist_id).join(Venue, Venue.id == Show.venue_id).all()
-
+    # displays list of shows at /shows, one page at a time in start_time order
+    query = db.session.query(Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+                             Show.artist_id, Artist.name.label('artist_name'),
+                             Artist.image_link.label('artist_image_link')) \
+        .join(Artist, Artist.id == Show.artist_id) \
+        .join(Venue, Venue.id == Show.venue_id)
+    page = keyset_page(query, [Show.start_time, Show.id], request.args)
+
+    start_times = format_datetimes([show.start_time for show in page['items']], 'full')
     response = []
-    for show in data:
+    for show, start_time in zip(page['items'], start_times):
         response.append({
             "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
+            "venue_name": show.venue_name,
             "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": str(show.start_time)
+            "artist_name": show.artist_name,
+            "artist_image_link": show.artist_image_link,
+            "start_time": start_time
         })
-    return render_template('pages/shows.html', shows=response)
+    return render_template('pages/shows.html', shows=response, page=page)
+
+
+@app.route('/shows/availability')
+def show_availability():
+    # is the slot free? ?venue_id=&artist_id=&start_time=[&end_time= or &duration_minutes=]
+    try:
+        start_time, end_time = show_times(request.args)
+        venue_id = request.args.get('venue_id', type=int)
+        artist_id = request.args.get('artist_id', type=int)
+    except (ValueError, OverflowError) as e:
+        return jsonify({"error": str(e)}), 400
+    conflicts = slot_conflicts(venue_id, artist_id, start_time, end_time)
+    return jsonify({
+        "venue_id": venue_id,
+        "artist_id": artist_id,
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat(),
+        "free": not conflicts,
+        "conflicts": conflicts
+    })
 
 
 @app.route('/shows/create')
@@ -646,13 +1181,17 @@ def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
     # insert form data as a new Show record in the db, instead
     try:
-        show = Show(
-            artist_id=request.form['artist_id'],
-            venue_id=request.form['venue_id'],
-            start_time=request.form['start_time']
-        )
+        values = show_values(request.form)
+        show = Show(**values)
+        if slot_conflicts(show.venue_id, show.artist_id, show.start_time, show.end_time):
+            flash('The venue or the artist is already booked at that time. Show could not be listed.')
+            return render_template('pages/home.html')
         db.session.add(show)
+        # the venue's and the artist's show counters change in the same transaction
+        show_counters.add([values])
+        queue_follow_up()
         db.session.commit()
+        invalidate_show(show)
         # on successful db insert, flash success
         flash('Show was successfully listed!')
     # on unsuccessful db insert, flash an error instead.
@@ -665,6 +1204,267 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
+#  Calendar
+#  ----------------------------------------------------------------
+# A month / week view of the shows, and an iCalendar feed of each venue's and artist's shows.
+# Both read only the shows starting inside their window, with a range scan on a start_time
+# index, and answer conditional GETs from the change log before any show is read: a calendar
+# client polling an unchanged feed costs one indexed query and a 304.
+
+CALENDAR_FEED_PAST_DAYS = 30
+CALENDAR_FEED_DAYS = 365
+CALENDAR_FEED_MAX_DAYS = 731
+
+
+def conditional(render, *validators):
+    """render()'s response, or 304 Not Modified when the client's copy is still current.
+
+    The validators come from the newest change of the shows, venues and artists (event
+    names and places come from all three): an ETag of its id, the URL and validators, and
+    Last-Modified at its time. Last-Modified is never before the start of today, since the
+    default windows and the highlighted day move with the date.
+    """
+    change_id, changed_at = change_log.latest(Show.__tablename__, Venue.__tablename__, Artist.__tablename__)
+    etag = hashlib.sha1('|'.join(map(str, (change_id, request.full_path) + validators)).encode()).hexdigest()
+    midnight = datetime.combine(datetime.now().date(), datetime.min.time()).astimezone(timezone.utc) \
+        .replace(tzinfo=None)
+    # HTTP dates have whole seconds; a later change within the same second is caught by the ETag
+    last_modified = max(changed_at or midnight, midnight).replace(microsecond=0)
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        fresh = request.if_modified_since is not None and \
+            last_modified <= request.if_modified_since.replace(tzinfo=None)
+    # a pending flash message is rendered into the page, so it must not be skipped
+    if fresh and not session.get('_flashes'):
+        response = Response(status=304)
+    else:
+        response = make_response(render())
+    if response.status_code in (200, 304):
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def calendar_weeks(view, day):
+    """(weeks of dates shown, a day of the previous period, a day of the next) for the month / week of day."""
+    if view == 'week':
+        monday = day - timedelta(days=day.weekday())
+        return [[monday + timedelta(days=i) for i in range(7)]], monday - timedelta(days=7), \
+            monday + timedelta(days=7)
+    first = day.replace(day=1)
+    return Calendar().monthdatescalendar(day.year, day.month), (first - timedelta(days=1)).replace(day=1), \
+        (first + timedelta(days=32)).replace(day=1)
+
+
+@app.route('/shows/calendar')
+def shows_calendar():
+    # ?view=month (default) or week, ?date=YYYY-MM-DD: any day of the month / week to show
+    view = 'week' if request.args.get('view') == 'week' else 'month'
+    try:
+        day = _datetime(request.args['date']).date() if request.args.get('date') else datetime.now().date()
+        # around year 1 or 9999 the shown weeks or their neighbours leave the date range
+        weeks, previous, following = calendar_weeks(view, day)
+        start = datetime.combine(weeks[0][0], datetime.min.time())
+        end = datetime.combine(weeks[-1][-1] + timedelta(days=1), datetime.min.time())
+    except (ValueError, OverflowError):
+        abort(400)
+
+    def render():
+        rows = shows_starting_between(start, end).all()
+        times = format_datetimes([row.start_time for row in rows], 'h:mma')
+        by_day = {}
+        for row, time in zip(rows, times):
+            by_day.setdefault(row.start_time.date(), []).append(dict(row._asdict(), time=time))
+        title = format_datetime(start if view == 'week' else datetime.combine(day, datetime.min.time()),
+                                "'Week of' MMM d, y" if view == 'week' else 'MMMM y')
+        return render_template('pages/calendar.html', view=view, title=title, weeks=weeks, day=day, month=day.month,
+                               shows=by_day, today=datetime.now().date(), previous=previous, following=following)
+    return conditional(render, view, start.date(), datetime.now().date())
+
+
+def show_feed(model, key, owner_id):
+    # ?from= / ?to= (ISO) narrow the window; by default the last CALENDAR_FEED_PAST_DAYS and
+    # the next CALENDAR_FEED_DAYS
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    try:
+        start = _datetime(request.args['from']) if request.args.get('from') \
+            else today - timedelta(days=CALENDAR_FEED_PAST_DAYS)
+        end = _datetime(request.args['to']) if request.args.get('to') \
+            else today + timedelta(days=CALENDAR_FEED_DAYS)
+        if not start < end <= start + timedelta(days=CALENDAR_FEED_MAX_DAYS):
+            raise ValueError('to must be after from and at most {} days later'.format(CALENDAR_FEED_MAX_DAYS))
+    except (ValueError, OverflowError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    def render():
+        name = db.session.query(model.name).filter(model.id == owner_id).scalar()
+        if name is None:
+            abort(404)
+        # each event links to the other side of the show: the artist in a venue's feed, and so on
+        counterpart = 'artist_id' if key == 'venue_id' else 'venue_id'
+        endpoint = 'show_' + counterpart[:-len('_id')]
+        stamp = datetime.utcnow()
+        events = (ical.event('show-{}@{}'.format(row.id, request.host), row.start_time, row.end_time,
+                             '{} at {}'.format(row.artist_name, row.venue_name),
+                             ', '.join(filter(None, [row.venue_name, row.address, row.city, row.state])),
+                             url_for(endpoint, _external=True, **{counterpart: getattr(row, counterpart)}), stamp)
+                  for row in shows_starting_between(start, end, getattr(Show, key), owner_id))
+        return Response(''.join(ical.calendar('{} shows'.format(name), events)), mimetype=ical.MIME_TYPE)
+    return conditional(render, start, end)
+
+
+@app.route('/venues/<int:venue_id>/shows.ics')
+def venue_feed(venue_id):
+    return show_feed(Venue, 'venue_id', venue_id)
+
+
+@app.route('/artists/<int:artist_id>/shows.ics')
+def artist_feed(artist_id):
+    return show_feed(Artist, 'artist_id', artist_id)
+
+
+#  API
+#  ----------------------------------------------------------------
+# Read-only JSON listings under /api/v1. Rows are streamed from a server-side cursor, so a
+# full export never sits in memory: a JSON array by default, one object per line with
+# ?format=ndjson or Accept: application/x-ndjson. Responses carry an ETag built from the
+# change log, and a matching If-None-Match is answered with 304 before any row is read.
+
+API_BATCH_SIZE = 1000
+NDJSON = 'application/x-ndjson'
+
+
+def api_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def api_batches(query):
+    # lists of row dicts, API_BATCH_SIZE at a time, read through a server-side cursor
+    batch = []
+    for row in query.yield_per(API_BATCH_SIZE):
+        batch.append(row._asdict())
+        if len(batch) == API_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def with_genres(batches, genre_table, key):
+    # adds the genre names of each row, one query per batch
+    for batch in batches:
+        names = {row['id']: [] for row in batch}
+        links = db.session.query(getattr(genre_table.c, key), Genre.name) \
+            .join(Genre, Genre.id == genre_table.c.genre_id) \
+            .filter(getattr(genre_table.c, key).in_(names)) \
+            .order_by(Genre.name)
+        for owner_id, name in links:
+            names[owner_id].append(name)
+        for row in batch:
+            row['genres'] = names[row['id']]
+        yield batch
+
+
+def api_listing(version, batches):
+    """Streams batches as JSON or NDJSON, tagged with version (answers 304 when it matches)."""
+    if request.args.get('format') == 'ndjson':
+        mimetype = NDJSON
+    else:
+        mimetype = request.accept_mimetypes.best_match(['application/json', NDJSON]) or 'application/json'
+    etag = hashlib.sha1('{}|{}|{}'.format(version, mimetype, request.full_path).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        def generate():
+            if mimetype == NDJSON:
+                for batch in batches:
+                    yield ''.join(json.dumps(row, default=api_json) + '\n' for row in batch)
+                return
+            separator = '['
+            for batch in batches:
+                yield separator + ','.join(json.dumps(row, default=api_json) for row in batch)
+                separator = ','
+            yield '[]' if separator == '[' else ']'
+        response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept')
+    return response
+
+
+@app.route('/api/v1/genres')
+def api_genres():
+    # genres are only ever added, so the newest id versions the list
+    version = db.session.query(db.func.max(Genre.id)).scalar() or 0
+    return api_listing(version, api_batches(db.session.query(Genre.id, Genre.name).order_by(Genre.id)))
+
+
+@app.route('/api/v1/venues')
+def api_venues():
+    # ?state=&city= narrow the list
+    query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.phone,
+                             Venue.website, Venue.image_link, Venue.facebook_link, Venue.seeking_talent,
+                             Venue.seeking_description).order_by(Venue.id)
+    for column in ('state', 'city'):
+        if request.args.get(column):
+            query = query.filter(getattr(Venue, column) == request.args[column])
+    version, _ = change_log.latest(Venue.__tablename__)
+    return api_listing(version, with_genres(api_batches(query), venue_genre_table, 'venue_id'))
+
+
+@app.route('/api/v1/artists')
+def api_artists():
+    # ?state=&city= narrow the list
+    query = db.session.query(Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone, Artist.website,
+                             Artist.image_link, Artist.facebook_link, Artist.seeking_venue,
+                             Artist.seeking_description).order_by(Artist.id)
+    for column in ('state', 'city'):
+        if request.args.get(column):
+            query = query.filter(getattr(Artist, column) == request.args[column])
+    version, _ = change_log.latest(Artist.__tablename__)
+    return api_listing(version, with_genres(api_batches(query), artist_genre_table, 'artist_id'))
+
+
+@app.route('/api/v1/shows')
+def api_shows():
+    # ?venue_id=, ?artist_id= and an ISO ?from= / ?to= window on start_time narrow the list
+    query = db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time) \
+        .order_by(Show.start_time, Show.id)
+    try:
+        for column in ('venue_id', 'artist_id'):
+            if request.args.get(column):
+                query = query.filter(getattr(Show, column) == int(request.args[column]))
+        if request.args.get('from'):
+            query = query.filter(Show.start_time >= _datetime(request.args['from']))
+        if request.args.get('to'):
+            query = query.filter(Show.start_time < _datetime(request.args['to']))
+    except (ValueError, OverflowError) as e:
+        return jsonify({"error": str(e)}), 400
+    version, _ = change_log.latest(Show.__tablename__)
+    return api_listing(version, api_batches(query))
+
+
+#  Internal
+#  ----------------------------------------------------------------
+
+@app.route('/internal/metrics')
+def internal_metrics():
+    if request.remote_addr not in app.config['METRICS_ALLOWED_ADDRS']:
+        abort(404)
+    return jsonify({
+        "pool": pool_metrics.snapshot(),
+        "cache": cache.stats,
+        "replicas": dict(replica_router.stats, lag_seconds=[replica.lag for replica in replica_router.replicas]),
+        "jobs": dict(jobs.stats, **jobs.counts()),
+        "read_model": read_model.snapshot() if read_model is not None else None,
+        "genre_facets": dict(genre_facets.stats, change_id=genre_facets.change_id)
+    })
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -685,6 +1485,170 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+if app.config['REQUEST_METRICS'] and app.config['REQUEST_LOG']:
+    # one JSON object per line, for log shippers
+    request_handler = RotatingFileHandler(app.config['REQUEST_LOG'], maxBytes=app.config['REQUEST_LOG_MAX_BYTES'],
+                                          backupCount=app.config['REQUEST_LOG_BACKUPS'])
+    request_handler.setFormatter(Formatter('%(message)s'))
+    request_log = logging.getLogger('fyyur.requests')
+    request_log.setLevel(logging.INFO)
+    request_log.addHandler(request_handler)
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+def allocate_ids(model, count):
+    # Reserve primary keys up front so genre links can be written with the rows themselves
+    if db.engine.dialect.name == 'postgresql':
+        result = db.session.execute(
+            db.text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+            {'table': '"{}"'.format(model.__tablename__), 'count': count})
+        return [new_id for (new_id,) in result]
+    start = (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+    return list(range(start, start + count))
+
+
+def insert_catalog(model, genre_table, key):
+    # insert(rows) for run_import: venues or artists plus their genre links
+    def insert(rows):
+        genre_ids = genre_cache.ids_for(list(dict.fromkeys(chain.from_iterable(row['genres'] for row in rows))))
+        records, links = [], []
+        for new_id, row in zip(allocate_ids(model, len(rows)), rows):
+            record = dict(row, id=new_id)
+            genres = record.pop('genres')
+            record['search_vector'] = search.vector(document_parts(row['name'], row['city'], row['state'], genres))
+            records.append(record)
+            links.extend({'genre_id': genre_ids[genre], key: new_id} for genre in genres)
+        if db.engine.dialect.name == 'postgresql':
+            # one multi-row INSERT; the search vectors are computed by the database
+            db.session.execute(model.__table__.insert().values(records))
+        else:
+            db.session.execute(model.__table__.insert(), records)
+        if links:
+            db.session.execute(genre_table.insert(), links)
+        change_log.record(model.__tablename__, [record['id'] for record in records])
+        if model is Venue:
+            area_index.add(records)
+        return []
+    return insert
+
+
+def insert_shows(rows):
+    # insert(rows) for run_import: shows whose artist and venue exist and are free, COPYed in on Postgres
+    artist_ids = {row['artist_id'] for row in rows}
+    venue_ids = {row['venue_id'] for row in rows}
+    known_artists = {i for (i,) in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+    known_venues = {i for (i,) in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+    # existing bookings for the whole chunk in one query; accepted rows join them as we go
+    venues, artists = booked_between(venue_ids, artist_ids, min(row['start_time'] for row in rows),
+                                     max(row['end_time'] for row in rows))
+    refused, accepted = [], []
+    for i, row in enumerate(rows):
+        if row['artist_id'] not in known_artists:
+            refused.append((i, 'unknown artist_id {}'.format(row['artist_id'])))
+        elif row['venue_id'] not in known_venues:
+            refused.append((i, 'unknown venue_id {}'.format(row['venue_id'])))
+        elif venues.conflict(row['venue_id'], row['start_time'], row['end_time']):
+            refused.append((i, 'venue {} already booked at that time'.format(row['venue_id'])))
+        elif artists.conflict(row['artist_id'], row['start_time'], row['end_time']):
+            refused.append((i, 'artist {} already booked at that time'.format(row['artist_id'])))
+        else:
+            venues.add(row['venue_id'], row['start_time'], row['end_time'])
+            artists.add(row['artist_id'], row['start_time'], row['end_time'])
+            accepted.append(row)
+    if accepted:
+        columns = ['artist_id', 'venue_id', 'start_time', 'end_time']
+        if db.engine.dialect.name == 'postgresql':
+            copy_rows(db.session.connection(), Show.__tablename__, columns,
+                      [[row[column] for column in columns] for row in accepted])
+        else:
+            db.session.execute(Show.__table__.insert(), accepted)
+        # COPY returns no ids: one change row stands for the whole chunk
+        change_log.record(Show.__tablename__, [None])
+        show_counters.add(accepted)
+    return refused
+
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['artists', 'venues', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per insert and transaction.')
+def import_command(kind, path, chunk_size):
+    """Bulk load artists, venues or shows from a .csv or .jsonl file.
+
+    Fields use the names of the create forms (website_link, seeking_talent, ...); genres
+    may be a JSON list or a ;-separated CSV cell. Shows reference existing artist_id and
+    venue_id values, may give end_time or duration_minutes, and are rejected if the venue
+    or artist is already booked. Rejected rows are written to PATH.rejected.jsonl.
+    """
+    if kind == 'shows':
+        prepare, insert = show_values, insert_shows
+    elif kind == 'venues':
+        prepare = lambda record: required(venue_values(record), 'name', 'city', 'state')
+        insert = insert_catalog(Venue, venue_genre_table, 'venue_id')
+    else:
+        prepare = lambda record: required(artist_values(record), 'name', 'city', 'state')
+        insert = insert_catalog(Artist, artist_genre_table, 'artist_id')
+    run_import(db.session, path, prepare, insert, chunk_size, echo=click.echo)
+
+
+@app.cli.command('roll-counters')
+@click.option('--rebuild', is_flag=True, help='Recount every venue and artist from the shows table.')
+def roll_counters_command(rebuild):
+    """Move shows that have started from the upcoming to the past counters.
+
+    Job workers run it every ROLL_COUNTERS_SECONDS; without workers, run it every minute or
+    so (cron, a systemd timer): listings show upcoming counts as of the last run. --rebuild
+    recounts everything, e.g. after shows were edited by hand.
+    """
+    if rebuild:
+        show_counters.rebuild()
+        # logged so readers of the change log (the read model) reload the counts
+        change_log.record(Venue.__tablename__, [None], 'counts')
+        db.session.commit()
+        cache.invalidate('venues', 'artists')
+        click.echo('Counters rebuilt.')
+        return
+    changed = roll_counters()
+    click.echo('{} venues and {} artists updated.'.format(len(changed.get(Venue, ())), len(changed.get(Artist, ()))))
+
+
+@app.cli.command('refresh-matches')
+@click.option('--rebuild', is_flag=True, help='Recompute every list instead of replaying the change log.')
+def refresh_matches_command(rebuild):
+    """Update the recommended artists / venues shown on the detail pages.
+
+    Replays the change log since the last run and recomputes the lists it reaches (the first
+    run, bulk show imports and show deletes rebuild everything). Needs NumPy and SciPy.
+    """
+    refreshed = refresh_matches(rebuild)
+    click.echo('{} artist and {} venue lists refreshed.'.format(len(refreshed['artist']), len(refreshed['venue'])))
+
+
+@app.cli.command('worker')
+@click.option('--threads', default=1, show_default=True, help='Jobs run at the same time (Postgres only).')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of waiting for more.')
+def worker_command(threads, burst):
+    """Run queued background jobs (match refreshes, counter rolls)."""
+    if not app.config['JOB_WORKERS']:
+        click.echo('JOB_WORKERS is not set: the web processes queue no jobs for this worker.', err=True)
+    if db.engine.dialect.name != 'postgresql':
+        threads = 1
+    stop = threading.Event()
+    workers = jobs.start(threads, stop, burst)
+    try:
+        for thread in workers:
+            while thread.is_alive():
+                thread.join(1)
+    except KeyboardInterrupt:
+        # let running jobs finish
+        stop.set()
+        for thread in workers:
+            thread.join()
+    click.echo('{done} jobs done, {retried} retried, {failed} failed.'.format(**jobs.stats))
+
+
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
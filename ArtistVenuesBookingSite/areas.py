@@ -0,0 +1,61 @@
+from collections import Counter
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+
+# The (state, city) areas of the venue directory with their venue counts, kept in their own
+# table so the directory can list areas, and load one area's venues, without scanning every
+# venue. Venue inserts, deletes and moves are counted during the flush that writes them;
+# bulk inserts that bypass the ORM call add() themselves.
+
+
+class AreaIndex(object):
+
+    def __init__(self, db, area_model, venue_model):
+        self.db = db
+        self.model = area_model
+        self.venue = venue_model
+        event.listen(db.session, 'before_flush', self._before_flush)
+
+    def _before_flush(self, session, flush_context, instances):
+        deltas = Counter()
+        for venue in session.new:
+            if isinstance(venue, self.venue):
+                deltas[(venue.state, venue.city)] += 1
+        for venue in session.deleted:
+            if isinstance(venue, self.venue):
+                deltas[self._committed_area(venue)] -= 1
+        for venue in session.dirty:
+            if isinstance(venue, self.venue):
+                old, new = self._committed_area(venue), (venue.state, venue.city)
+                if old != new:
+                    deltas[old] -= 1
+                    deltas[new] += 1
+        self._apply(session, deltas)
+
+    @staticmethod
+    def _committed_area(venue):
+        state = inspect(venue)
+        values = []
+        for key in ('state', 'city'):
+            history = state.attrs[key].history
+            values.append(history.deleted[0] if history.deleted else getattr(venue, key))
+        return tuple(values)
+
+    def add(self, rows):
+        """Count bulk-inserted venue rows (dicts with state and city)."""
+        self._apply(self.db.session, Counter((row['state'], row['city']) for row in rows))
+
+    def _apply(self, session, deltas):
+        deltas = {area: delta for area, delta in deltas.items() if delta and all(area)}
+        if not deltas:
+            return
+        dialect = postgresql if self.db.engine.dialect.name == 'postgresql' else sqlite
+        table = self.model.__table__
+        statement = dialect.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['state', 'city'],
+            set_={'venue_count': table.c.venue_count + statement.excluded.venue_count})
+        session.execute(statement, [{'state': state, 'city': city, 'venue_count': delta}
+                                    for (state, city), delta in deltas.items()])
+        session.execute(table.delete().where(table.c.venue_count <= 0))
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import threading
+
+from sqlalchemy.engine import make_url
+
+# Optional async database access for pages whose queries do not depend on each other.
+#
+# This only runs the queries of one request concurrently; it does not make the views async.
+# They stay synchronous (Flask runs each in a worker thread, which is blocked until its page is
+# done), so the number of requests served at once is still set by the server's workers and
+# threads. An async engine lives on one event loop in a background thread; a view hands it
+# several SELECTs and waits once, while they run concurrently on separate pooled connections,
+# so the page waits for the slowest query instead of the sum of all of them. Needs asyncpg
+# (aiosqlite for local SQLite databases).
+#
+# There is one async engine for the primary and one per read replica, and a view passes the
+# engine ReplicaRouter picked for its request, so the queries read where the session would.
+# The statements run in a copy of the calling thread's context (run_coroutine_threadsafe
+# schedules them with it), so listeners that look at the Flask request (RequestMetrics) see them
+# as part of it. The engines and their loop thread are started on first use in each process, so
+# a server that imports the app and then forks its workers (gunicorn --preload) gives every
+# worker its own.
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def async_url(url):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def engine_key(url):
+    # the same database whatever driver the URL names
+    return async_url(url).render_as_string(hide_password=False)
+
+
+class AsyncDatabase(object):
+    """Async engines for url and each of replica_urls; instrument, when given, is called with
+    the sync_engine of every engine created (to attach cursor event listeners)."""
+
+    def __init__(self, url, replica_urls=(), timeout=30, instrument=None, **engine_options):
+        self.urls = [async_url(url)] + [async_url(replica_url) for replica_url in replica_urls]
+        # fail now, not on the first page, when the driver is missing
+        self.urls[0].get_dialect().dbapi()
+        self.primary = engine_key(url)
+        self.engine_options = engine_options
+        self.timeout = timeout
+        self.instrument = instrument
+        self.engines = {}  # engine_key -> AsyncEngine
+        self.loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self.engines = {}
+                for url in self.urls:
+                    engine = create_async_engine(url, **self.engine_options)
+                    if self.instrument is not None:
+                        self.instrument(engine.sync_engine)
+                    self.engines[engine_key(url)] = engine
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name='async-db', daemon=True).start()
+                self._pid = os.getpid()
+
+    async def _all(self, engine, statement):
+        async with engine.connect() as connection:
+            result = await connection.execute(statement)
+            return result.all()
+
+    async def _gather(self, engine, statements):
+        return await asyncio.gather(*(self._all(engine, statement) for statement in statements))
+
+    def all(self, *statements, bind=None):
+        """The rows of each statement, in order, with the statements run concurrently.
+
+        bind is the (sync) engine the request reads from, a replica from ReplicaRouter.read_engine;
+        None reads from the primary.
+        """
+        if self._pid != os.getpid():
+            self._start()
+        engine = self.engines[self.primary if bind is None else engine_key(bind.url)]
+        future = asyncio.run_coroutine_threadsafe(self._gather(engine, statements), self.loop)
+        return future.result(self.timeout)
+
+    def dispose(self):
+        if self._pid != os.getpid():
+            return
+        for engine in self.engines.values():
+            asyncio.run_coroutine_threadsafe(engine.dispose(), self.loop).result(self.timeout)
@@ -0,0 +1,218 @@
+import os
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+# The in-process pieces the views lean on, at sizes past what one page needs.
+
+# BENCH_LARGE=1 adds a million-item size (minutes per case, a few GB of memory)
+LARGE = os.environ.get('BENCH_LARGE') == '1'
+SIZES = [1000, 100000] + ([1000000] if LARGE else [])
+# bookings of one venue; BENCH_LARGE also adds five million, some 2,800 years of shows
+BOOKING_SIZES = SIZES + ([5000000] if LARGE else [])
+
+
+@pytest.fixture(scope='module')
+def times():
+    rng = random.Random(0)
+    start = datetime(2030, 1, 1)
+    return [start + timedelta(minutes=rng.randrange(525600)) for _ in range(max(SIZES))]
+
+
+@pytest.mark.parametrize('size', SIZES)
+def bench_format_datetimes(benchmark, fyyur, times, size):
+    benchmark(fyyur.format_datetimes, times[:size], 'full')
+
+
+@pytest.fixture(scope='module')
+def calendar():
+    # one venue's two-hour bookings, 0 to 6 hours apart, so any prefix is a realistic calendar
+    rng = random.Random(0)
+    start = datetime(2030, 1, 1)
+    busy = []
+    for _ in range(max(BOOKING_SIZES)):
+        busy.append((start, start + timedelta(hours=2)))
+        start += timedelta(hours=2, minutes=rng.randrange(361))
+    return busy
+
+
+@pytest.mark.parametrize('size', BOOKING_SIZES)
+def bench_booking_conflicts(benchmark, calendar, size):
+    # one venue with `size` bookings, then 1000 conflict lookups spread over them
+    from booking import Bookings
+
+    bookings = Bookings()
+    for i, (start, end) in enumerate(calendar[:size]):
+        bookings.add(1, start, end, i)
+    rng = random.Random(0)
+    first, span = calendar[0][0], calendar[size - 1][1] - calendar[0][0]
+    probes = [first + span * rng.random() for _ in range(1000)]
+    benchmark(lambda: [bookings.conflict(1, start, start + timedelta(hours=2)) for start in probes])
+
+
+@pytest.mark.parametrize('size', BOOKING_SIZES)
+def bench_free_gaps(benchmark, calendar, size):
+    from booking import free_gaps
+
+    busy = calendar[:size]
+    benchmark(free_gaps, busy, busy[0][0], busy[-1][1], timedelta(hours=2))
+
+
+def search_documents(size):
+    # (id, name, area, genres) of `size` seeded venue documents, the same for every backend
+    from seed import ADJECTIVES, AREAS, GENRES, VENUE_NOUNS
+
+    rng = random.Random(0)
+    for i in range(size):
+        city, state = rng.choice(AREAS)
+        name = '{} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(VENUE_NOUNS), i)
+        yield i, name, '{} {}'.format(city, state), ' '.join(rng.sample(GENRES, 2))
+
+
+@pytest.mark.parametrize('size', SIZES)
+def bench_search_index(benchmark, size):
+    # the pure-Python index behind search on SQLite
+    from search import SearchIndex
+
+    index = SearchIndex()
+    for i, name, area, genres in search_documents(size):
+        index.add(i, [('A', name), ('B', area), ('C', genres)])
+    index.search('warm')
+    benchmark(index.search, 'gold hall')
+
+
+@pytest.mark.parametrize('size', SIZES)
+def bench_search_tsvector(benchmark, fyyur, size):
+    # the same documents and search on Postgres: a GIN-indexed tsvector column, matched and
+    # ranked by search.match; the table is temporary and dropped when the case ends
+    from sqlalchemy import Column, Integer, MetaData, Table, Text, select
+    from sqlalchemy.dialects.postgresql import TSVECTOR
+    from search import tsvector_expression
+
+    with fyyur.app.app_context():
+        engine = fyyur.db.engine
+    if engine.dialect.name != 'postgresql':
+        pytest.skip('needs DATABASE_URL pointing at Postgres')
+    table = Table('bench_search', MetaData(), Column('id', Integer, primary_key=True), Column('name', Text),
+                  Column('area', Text), Column('genres', Text), Column('search_vector', TSVECTOR),
+                  prefixes=['TEMPORARY'], postgresql_on_commit='DROP')
+    with engine.begin() as connection:
+        table.create(connection)
+        documents = search_documents(size)
+        while True:
+            batch = [dict(zip(('id', 'name', 'area', 'genres'), row)) for _, row in zip(range(10000), documents)]
+            if not batch:
+                break
+            connection.execute(table.insert(), batch)
+        connection.execute(table.update().values(search_vector=tsvector_expression(
+            [('A', table.c.name), ('B', table.c.area), ('C', table.c.genres)])))
+        connection.exec_driver_sql('CREATE INDEX ix_bench_search ON bench_search USING gin (search_vector)')
+        connection.exec_driver_sql('ANALYZE bench_search')
+        clause, rank = fyyur.search.match(table.c, 'gold hall')
+        query = select(table.c.id, rank).where(clause).order_by(rank.desc(), table.c.id)
+        connection.execute(query).all()
+        benchmark(lambda: connection.execute(query).all())
+
+
+@pytest.fixture
+def matcher(fyyur):
+    pytest.importorskip('scipy')
+    with fyyur.app.app_context():
+        yield fyyur.matcher
+        fyyur.db.session.rollback()
+
+
+def bench_rebuild_matches(benchmark, matcher):
+    benchmark.pedantic(matcher.rebuild, rounds=3)
+
+
+def bench_refresh_matches(benchmark, fyyur, matcher):
+    # incremental refresh after one artist changed genres
+    matcher.refresh(rebuild=True)
+    fyyur.db.session.commit()
+    artist = fyyur.Artist.query.filter(fyyur.Artist.seeking_venue.is_(True)).first()
+    genres = fyyur.Genre.query.order_by(fyyur.Genre.id).limit(2).all()
+
+    def setup():
+        artist.genres = genres if artist.genres != genres else genres[:1]
+        fyyur.db.session.commit()
+    benchmark.pedantic(matcher.refresh, setup=setup, rounds=5)
+
+
+# entities for the read model memory measurement (tracing allocations makes building them slow)
+READ_MODEL_ENTITIES = int(os.environ.get('BENCH_READ_MODEL_ENTITIES', 1000000))
+
+
+@pytest.fixture(scope='module')
+def venue_collection():
+    # (Collection of READ_MODEL_ENTITIES venues, {part: bytes per venue})
+    import tracemalloc
+    from read_model import Collection, VenueRecord
+    from seed import ADJECTIVES, AREAS, GENRES, VENUE_NOUNS
+
+    rng = random.Random(0)
+    genre_names = dict(enumerate(GENRES, 1))
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        records = []
+        for i in range(1, READ_MODEL_ENTITIES + 1):
+            city, state = rng.choice(AREAS)
+            name = '{} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(VENUE_NOUNS), i)
+            records.append(VenueRecord(i, name, city, state, rng.randrange(10),
+                                       tuple(sorted(rng.sample(sorted(genre_names), 2)))))
+        after_records = tracemalloc.get_traced_memory()[0]
+        collection = Collection()
+        collection.load(records, genre_names)
+        del records
+        after_load = tracemalloc.get_traced_memory()[0]
+        index, collection.index = collection.index, None
+        del index
+        after_unindex = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    # index again for the search benchmark
+    collection.load(collection.records.values(), genre_names)
+    per_venue = {
+        'records': (after_records - start) / READ_MODEL_ENTITIES,
+        'listing': (after_unindex - after_records) / READ_MODEL_ENTITIES,
+        'search_index': (after_load - after_unindex) / READ_MODEL_ENTITIES
+    }
+    per_venue['total'] = sum(per_venue.values())
+    return collection, per_venue
+
+
+def bench_read_model_page(benchmark, fyyur, venue_collection):
+    # a directory page deep into READ_MODEL_ENTITIES in-memory venues; extra_info holds the
+    # bytes held per venue by the records, the listing order and the search index
+    collection, per_venue = venue_collection
+    benchmark.extra_info['bytes_per_venue'] = {part: round(size) for part, size in per_venue.items()}
+    from pagination import encode_cursor
+
+    middle = collection.order[len(collection.order) // 2]
+    args = {'after': encode_cursor(list(middle))}
+    benchmark(collection.page, [fyyur.Venue.state, fyyur.Venue.city, fyyur.Venue.name, fyyur.Venue.id], args)
+
+
+def bench_read_model_search(benchmark, venue_collection):
+    collection, _ = venue_collection
+    benchmark(collection.search, 'gold hall')
+
+
+@pytest.mark.parametrize('size', SIZES)
+def bench_genre_facet_counts(benchmark, size):
+    # every genre's count within a two-genre OR selection, over `size` ids with two genres each
+    from facets import bitset, popcount
+
+    rng = random.Random(0)
+    by_genre = {genre_id: [] for genre_id in range(20)}
+    for i in range(size):
+        for genre_id in rng.sample(range(20), 2):
+            by_genre[genre_id].append(i)
+    bits = {genre_id: bitset(ids) for genre_id, ids in by_genre.items()}
+
+    def counts():
+        selected = bits[0] | bits[1]
+        return [popcount(selected & genre_bits) for genre_bits in bits.values()]
+    benchmark(counts)
@@ -0,0 +1,192 @@
+import itertools
+from datetime import datetime, timedelta
+
+import pytest
+
+# One benchmark per view in app.py, through the test client with the page cache disabled.
+# extra_info['statements'] holds the SQL statements one request sends.
+
+
+def bench_index(client, measure):
+    measure(lambda: client.get('/'))
+
+
+def bench_venues(client, measure):
+    measure(lambda: client.get('/venues'))
+
+
+def bench_venues_middle_page(client, measure, sample):
+    measure(lambda: client.get('/venues', query_string={'after': sample['venue_cursor']}))
+
+
+def bench_search_venues(client, measure):
+    measure(lambda: client.post('/venues/search', data={'search_term': 'hall'}))
+
+
+@pytest.fixture(params=['sync', 'async'])
+def detail_mode(request, fyyur, statements):
+    # the detail pages with their queries run one after the other, or concurrently (ASYNC_DATABASE)
+    if request.param == 'sync':
+        yield
+        return
+    try:
+        async_db = fyyur.AsyncDatabase(fyyur.app.config['SQLALCHEMY_DATABASE_URI'],
+                                       instrument=statements.watch, **fyyur.app.config['ASYNC_ENGINE_OPTIONS'])
+    except (ImportError, KeyError) as e:
+        pytest.skip('no async driver: {}'.format(e))
+    fyyur.async_db = async_db
+    yield
+    fyyur.async_db = None
+    async_db.dispose()
+
+
+def bench_show_venue(client, measure, sample, detail_mode):
+    measure(lambda: client.get('/venues/{}'.format(sample['venue_id'])))
+
+
+def bench_show_artist(client, measure, sample, detail_mode):
+    measure(lambda: client.get('/artists/{}'.format(sample['artist_id'])))
+
+
+def bench_create_venue_form(client, measure):
+    measure(lambda: client.get('/venues/create'))
+
+
+def bench_edit_venue(client, measure, sample):
+    measure(lambda: client.get('/venues/{}/edit'.format(sample['venue_id'])))
+
+
+def venue_form(sample, name):
+    return {'name': name, 'city': sample['venue_city'], 'state': sample['venue_state'], 'address': '1 Main Street',
+            'phone': '415-555-0100', 'genres': ['Jazz', 'Blues'], 'website_link': 'https://example.com',
+            'seeking_talent': 'y', 'seeking_description': 'Looking for bands'}
+
+
+def bench_create_venue_submission(writer, measure, sample):
+    names = ('Benchmark Hall {}'.format(i) for i in itertools.count())
+    measure(lambda: writer.post('/venues/create', data=venue_form(sample, next(names))))
+
+
+def bench_edit_venue_submission(writer, measure, sample):
+    # a new name every round, so the update and the page invalidations really happen
+    names = ('Busiest Hall {}'.format(i) for i in itertools.count())
+    url = '/venues/{}/edit'.format(sample['venue_id'])
+    measure(lambda: writer.post(url, data=venue_form(sample, next(names))), status=302)
+
+
+def bench_delete_venue(fyyur, writer, measure, sample):
+    # each round deletes a venue added (untimed) just before it; venues with shows cannot be deleted
+    names = ('Closing Hall {}'.format(i) for i in itertools.count())
+
+    def add_venue():
+        with fyyur.app.app_context():
+            venue = fyyur.Venue(name=next(names), city=sample['venue_city'], state=sample['venue_state'],
+                                phone='4155550100')
+            fyyur.db.session.add(venue)
+            fyyur.db.session.commit()
+            return (venue.id,)
+    measure(lambda venue_id: writer.delete('/venues/{}'.format(venue_id)), setup=add_venue)
+
+
+def bench_artists(client, measure):
+    measure(lambda: client.get('/artists'))
+
+
+def bench_artists_by_genre(client, measure):
+    measure(lambda: client.get('/artists', query_string=[('genre', 'Jazz'), ('genre', 'Blues'), ('match', 'any')]))
+
+
+def bench_search_artists(client, measure):
+    measure(lambda: client.post('/artists/search', data={'search_term': 'band'}))
+
+
+def bench_artist_available_venues(client, measure, sample):
+    measure(lambda: client.get('/artists/{}/available-venues'.format(sample['artist_id']),
+                               query_string={'state': sample['venue_state'], 'match_genres': '0'}))
+
+
+def bench_create_artist_form(client, measure):
+    measure(lambda: client.get('/artists/create'))
+
+
+def bench_edit_artist(client, measure, sample):
+    measure(lambda: client.get('/artists/{}/edit'.format(sample['artist_id'])))
+
+
+def artist_form(sample, name):
+    return {'name': name, 'city': sample['artist_city'], 'state': sample['artist_state'], 'phone': '415-555-0101',
+            'genres': ['Rock', 'Folk'], 'website_link': 'https://example.com', 'seeking_venue': 'y',
+            'seeking_description': 'Looking for a stage'}
+
+
+def bench_create_artist_submission(writer, measure, sample):
+    names = ('Benchmark Band {}'.format(i) for i in itertools.count())
+    measure(lambda: writer.post('/artists/create', data=artist_form(sample, next(names))))
+
+
+def bench_edit_artist_submission(writer, measure, sample):
+    names = ('Busiest Band {}'.format(i) for i in itertools.count())
+    url = '/artists/{}/edit'.format(sample['artist_id'])
+    measure(lambda: writer.post(url, data=artist_form(sample, next(names))), status=302)
+
+
+def bench_shows(client, measure):
+    measure(lambda: client.get('/shows'))
+
+
+def bench_show_availability(client, measure, sample):
+    start_time = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=7)
+    measure(lambda: client.get('/shows/availability', query_string={
+        'venue_id': sample['venue_id'], 'artist_id': sample['artist_id'], 'start_time': start_time.isoformat()}))
+
+
+def bench_shows_calendar_month(client, measure, sample):
+    day = sample['first_show'] + timedelta(days=180)
+    measure(lambda: client.get('/shows/calendar', query_string={'date': day.date().isoformat()}))
+
+
+def bench_venue_feed(client, measure, sample):
+    measure(lambda: client.get('/venues/{}/shows.ics'.format(sample['venue_id'])))
+
+
+def bench_venue_feed_not_modified(client, measure, sample):
+    # a calendar client polling an unchanged feed
+    url = '/venues/{}/shows.ics'.format(sample['venue_id'])
+    last_modified = client.get(url).headers['Last-Modified']
+    measure(lambda: client.get(url, headers={'If-Modified-Since': last_modified}), status=304)
+
+
+def bench_create_show_form(client, measure):
+    measure(lambda: client.get('/shows/create'))
+
+
+def bench_create_show_submission(client, measure, sample):
+    # every round books a new slot, far past the seeded shows so it never conflicts
+    slots = itertools.count()
+    first = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=3 * 365)
+
+    def create():
+        start_time = first + next(slots) * timedelta(hours=3)
+        return client.post('/shows/create', data={'venue_id': sample['venue_id'], 'artist_id': sample['artist_id'],
+                                                  'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')})
+    measure(create)
+
+
+def bench_api_venues_stream(client, measure):
+    # the whole directory as NDJSON, body included
+    measure(lambda: client.get('/api/v1/venues', query_string={'format': 'ndjson'}, buffered=True))
+
+
+def bench_api_shows_window(client, measure, sample):
+    start = sample['first_show'] + timedelta(days=180)
+    measure(lambda: client.get('/api/v1/shows', query_string={
+        'from': start.isoformat(), 'to': (start + timedelta(days=30)).isoformat()}, buffered=True))
+
+
+def bench_api_not_modified(client, measure):
+    etag = client.get('/api/v1/venues', buffered=True).headers['ETag']
+    measure(lambda: client.get('/api/v1/venues', headers={'If-None-Match': etag}), status=304)
+
+
+def bench_internal_metrics(client, measure):
+    measure(lambda: client.get('/internal/metrics'))
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+from sqlalchemy import event
+
+# Every SELECT a view sends is run again under EXPLAIN, and any table it reads with a full
+# scan fails the check unless the view is expected to read that whole table. On Postgres the
+# plans are taken with enable_seqscan off, so a sequential scan means no index could serve
+# the query, whatever the table size.
+
+VIEWS = [
+    # (url, tables the view may scan in full)
+    ('/venues', set()),
+    ('/venues?after={venue_cursor}', set()),
+    ('/venues?state={venue_state}', set()),
+    ('/venues?state={venue_state}&city={venue_city}', set()),
+    ('/venues/{venue_id}', set()),
+    ('/venues/{venue_id}/edit', set()),
+    ('/venues?genre=Jazz&genre=Blues&match=any', set()),
+    ('/artists', set()),
+    ('/artists?genre=Jazz', set()),
+    ('/artists?genre=Jazz&genre=Blues', set()),
+    ('/artists/{artist_id}', set()),
+    ('/artists/{artist_id}/edit', set()),
+    ('/artists/{artist_id}/available-venues?state={venue_state}&city={venue_city}', set()),
+    ('/shows', set()),
+    ('/shows/calendar?date=2030-01-15', set()),
+    ('/shows/calendar?view=week&date=2030-01-15', set()),
+    ('/venues/{venue_id}/shows.ics', set()),
+    ('/artists/{artist_id}/shows.ics?from=2030-01-01&to=2031-01-01', set()),
+    ('/shows/availability?venue_id={venue_id}&artist_id={artist_id}&start_time=2030-01-01T20:00', set()),
+    ('/api/v1/venues?state={venue_state}&city={venue_city}', set()),
+    ('/api/v1/artists?state={venue_state}', set()),
+    ('/api/v1/shows?venue_id={venue_id}', set()),
+    ('/api/v1/shows?from=2030-01-01&to=2030-02-01', set()),
+    # exports read their whole table, in primary key order
+    ('/api/v1/venues', {'Venue'}),
+    ('/api/v1/artists', {'Artist'}),
+    ('/api/v1/genres', {'Genre'})
+]
+
+
+def full_scans(connection, statement, parameters, tables):
+    # names of the tables (of those in tables) the statement reads in full
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        (plan,), = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        nodes, scans = [plan[0]['Plan']], set()
+        while nodes:
+            node = nodes.pop()
+            if node['Node Type'] == 'Seq Scan':
+                scans.add(node['Relation Name'])
+            nodes.extend(node.get('Plans', []))
+        return scans
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+    # e.g. "SCAN Shows" (full scan), "SEARCH Shows USING INDEX ..." or "SCAN Venue USING INDEX ...";
+    # "SCAN CONSTANT ROW" and "SCAN (subquery-1)" (an empty IN ()) read no table
+    scans = {detail.split()[1].strip('"') for detail in (row[-1] for row in rows)
+             if detail.startswith('SCAN ') and ' INDEX ' not in detail and 'SUBQUERY' not in detail}
+    return scans & set(tables)
+
+
+@pytest.mark.parametrize('url, allowed', VIEWS, ids=[url for url, _ in VIEWS])
+def check_plan(fyyur, client, sample, url, allowed):
+    selects = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            selects.append((statement, parameters))
+
+    with fyyur.app.app_context():
+        engine = fyyur.db.engine
+        # the in-process copies read their whole tables once, when first used
+        fyyur.genre_facets.sync()
+    event.listen(engine, 'before_cursor_execute', collect)
+    try:
+        response = client.get(url.format(**sample), buffered=True)
+    finally:
+        event.remove(engine, 'before_cursor_execute', collect)
+    assert response.status_code in (200, 304)
+
+    with engine.connect() as connection, connection.begin():
+        for statement, parameters in selects:
+            scanned = full_scans(connection, statement, parameters, fyyur.db.metadata.tables) - allowed
+            assert not scanned, 'full scan of {} in:\n{}'.format(', '.join(sorted(scanned)), statement)
@@ -0,0 +1,139 @@
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# rounds of a benchmark whose every call needs a fresh row to work on (setup=)
+SETUP_ROUNDS = int(os.environ.get('BENCH_SETUP_ROUNDS', 50))
+
+# Scale of the seeded data; point DATABASE_URL at an empty (migrated) Postgres database to
+# benchmark against Postgres, otherwise a fresh SQLite file is used.
+SCALE = {
+    'venues': int(os.environ.get('BENCH_VENUES', 2000)),
+    'artists': int(os.environ.get('BENCH_ARTISTS', 2000)),
+    'shows': int(os.environ.get('BENCH_SHOWS', 20000)),
+    'seed': int(os.environ.get('BENCH_SEED', 0))
+}
+
+
+STATEMENTS = {}  # benchmark name -> statements per call
+
+
+def pytest_configure(config):
+    # the app reads DATABASE_URL when it is first imported
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'fyyur_bench.db'))
+
+
+def pytest_terminal_summary(terminalreporter):
+    if STATEMENTS:
+        terminalreporter.section('SQL statements per request')
+        for name, count in sorted(STATEMENTS.items()):
+            terminalreporter.write_line('{:<45} {:>5}'.format(name, count))
+
+
+class StatementCounter(object):
+    """Counts the statements sent while used as a context manager."""
+
+    def __init__(self, engine):
+        self.count = 0
+        self._active = False
+        self.watch(engine)
+
+    def watch(self, engine):
+        """Count engine's statements too (the async engine's sync_engine, say)."""
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+
+    def _before_execute(self, *args):
+        if self._active:
+            self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        self._active = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self._active = False
+
+
+@pytest.fixture(scope='session')
+def fyyur():
+    import app as fyyur
+    from cache import LRUBackend
+    from seed import seed
+
+    with fyyur.app.app_context():
+        if fyyur.db.engine.dialect.name == 'sqlite':
+            fyyur.db.create_all()
+        if not fyyur.db.session.query(fyyur.Venue.id).first():
+            seed(SCALE['venues'], SCALE['artists'], SCALE['shows'], SCALE['seed'])
+    # measure the views themselves, not the page cache
+    fyyur.cache.backend = LRUBackend(max_entries=0)
+    fyyur.app.config['WTF_CSRF_ENABLED'] = False
+    return fyyur
+
+
+@pytest.fixture(scope='session')
+def client(fyyur):
+    return fyyur.app.test_client()
+
+
+@pytest.fixture(scope='session')
+def writer(fyyur):
+    """A client for the form posts: without cookies, so their flash messages do not pile up."""
+    return fyyur.app.test_client(use_cookies=False)
+
+
+@pytest.fixture(scope='session')
+def statements(fyyur):
+    with fyyur.app.app_context():
+        return StatementCounter(fyyur.db.engine)
+
+
+@pytest.fixture(scope='session')
+def sample(fyyur):
+    """Ids and keys the benchmarks ask for: the busiest venue and artist, and so on."""
+    from pagination import encode_cursor
+
+    db, Show, Venue, Artist = fyyur.db, fyyur.Show, fyyur.Venue, fyyur.Artist
+    with fyyur.app.app_context():
+        busiest = lambda column: db.session.query(column).group_by(column) \
+            .order_by(db.func.count(Show.id).desc(), column).limit(1).scalar()
+        venue = Venue.query.get(busiest(Show.venue_id))
+        artist = Artist.query.get(busiest(Show.artist_id))
+        # a page from the middle of the venue directory
+        middle = db.session.query(Venue.state, Venue.city, Venue.name, Venue.id) \
+            .order_by(Venue.state, Venue.city, Venue.name, Venue.id) \
+            .offset(db.session.query(Venue.id).count() // 2).limit(1).one()
+        first_show = db.session.query(db.func.min(Show.start_time)).scalar()
+        return {
+            'venue_id': venue.id,
+            'venue_state': venue.state,
+            'venue_city': venue.city,
+            'artist_id': artist.id,
+            'artist_state': artist.state,
+            'artist_city': artist.city,
+            'venue_cursor': encode_cursor(middle),
+            'first_show': first_show
+        }
+
+
+@pytest.fixture
+def measure(request, benchmark, statements):
+    """measure(call) benchmarks call() and records the statements one call sends.
+
+    With setup, every call is call(*setup()) and setup runs untimed before it.
+    """
+    def run(call, status=200, setup=None):
+        with statements:
+            response = call(*setup()) if setup else call()
+        assert response.status_code == status
+        benchmark.extra_info['statements'] = STATEMENTS[request.node.name] = statements.count
+        if setup:
+            return benchmark.pedantic(call, setup=lambda: (setup(), {}), rounds=SETUP_ROUNDS)
+        return benchmark(call)
+    return run
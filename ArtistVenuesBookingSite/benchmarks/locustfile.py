@@ -0,0 +1,70 @@
+"""HTTP load profile for a running server:
+
+    locust -f benchmarks/locustfile.py --host http://localhost:5000 --headless -u 200 -r 20 -t 2m
+
+Browsing dominates, as on the live site; a few users search, check slots or book shows.
+BENCH_VENUES / BENCH_ARTISTS should match the seeded data (benchmarks/seed.py). Run it once
+with ASYNC_DATABASE=0 and once with ASYNC_DATABASE=1 on the server to compare the modes.
+"""
+import os
+import random
+from datetime import datetime, timedelta
+
+from locust import HttpUser, between, task
+
+VENUES = int(os.environ.get('BENCH_VENUES', 2000))
+ARTISTS = int(os.environ.get('BENCH_ARTISTS', 2000))
+TERMS = ['hall', 'blue', 'jazz', 'club', 'san', 'band', 'neon', 'rock']
+
+
+class Visitor(HttpUser):
+    wait_time = between(0.5, 2)
+
+    @task(6)
+    def venues(self):
+        response = self.client.get('/venues')
+        # follow the pager now and then
+        if 'after=' in response.text and random.random() < 0.3:
+            cursor = response.text.split('after=', 1)[1].split('&', 1)[0].split('"', 1)[0]
+            self.client.get('/venues?after=' + cursor, name='/venues?after=[cursor]')
+
+    @task(10)
+    def venue(self):
+        self.client.get('/venues/{}'.format(random.randint(1, VENUES)), name='/venues/[id]')
+
+    @task(3)
+    def artists(self):
+        self.client.get('/artists')
+
+    @task(10)
+    def artist(self):
+        self.client.get('/artists/{}'.format(random.randint(1, ARTISTS)), name='/artists/[id]')
+
+    @task(3)
+    def shows(self):
+        self.client.get('/shows')
+
+    @task(2)
+    def search_venues(self):
+        self.client.post('/venues/search', data={'search_term': random.choice(TERMS)})
+
+    @task(2)
+    def search_artists(self):
+        self.client.post('/artists/search', data={'search_term': random.choice(TERMS)})
+
+    @task(1)
+    def availability(self):
+        start_time = datetime.now().replace(minute=0, second=0, microsecond=0) + \
+            timedelta(hours=random.randint(1, 24 * 90))
+        self.client.get('/shows/availability', name='/shows/availability', params={
+            'venue_id': random.randint(1, VENUES), 'artist_id': random.randint(1, ARTISTS),
+            'start_time': start_time.isoformat()})
+
+    @task(1)
+    def book(self):
+        # a far-future slot; taken slots are refused and show up as a flash, not an error
+        start_time = datetime.now().replace(minute=0, second=0, microsecond=0) + \
+            timedelta(days=800, hours=3 * random.randint(0, 10000))
+        self.client.post('/shows/create', data={
+            'venue_id': random.randint(1, VENUES), 'artist_id': random.randint(1, ARTISTS),
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')})
@@ -0,0 +1,137 @@
+"""Seeded synthetic venues, artists, genres and shows for the benchmarks.
+
+    DATABASE_URL=postgresql://localhost/fyyur_bench python benchmarks/seed.py --venues 100000 --shows 1000000
+
+The same --seed always gives the same rows. Rows go through the bulk import path
+(`flask import`), so search vectors, genre links, show counters and the change log are
+filled in as in production. Show times are laid out on a grid around --anchor (default:
+today at midnight) so every venue and artist has past and upcoming shows and none overlap.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from forms import VenueForm  # noqa: E402
+
+GENRES = [name for name, _ in VenueForm.genres.kwargs['choices']]
+AREAS = [('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('San Diego', 'CA'), ('New York', 'NY'),
+         ('Brooklyn', 'NY'), ('Austin', 'TX'), ('Houston', 'TX'), ('Chicago', 'IL'), ('Seattle', 'WA'),
+         ('Portland', 'OR'), ('Denver', 'CO'), ('Nashville', 'TN'), ('Atlanta', 'GA'), ('Miami', 'FL'),
+         ('Boston', 'MA'), ('Philadelphia', 'PA'), ('Detroit', 'MI'), ('Minneapolis', 'MN'),
+         ('New Orleans', 'LA'), ('Phoenix', 'AZ')]
+ADJECTIVES = ['Blue', 'Golden', 'Velvet', 'Electric', 'Silent', 'Crimson', 'Wild', 'Lucky', 'Hidden',
+              'Midnight', 'Rusty', 'Northern', 'Neon', 'Little', 'Grand', 'Broken', 'Silver', 'Howling']
+VENUE_NOUNS = ['Hall', 'Lounge', 'Room', 'Tavern', 'Club', 'Theatre', 'Garden', 'Cellar', 'Barn', 'Stage']
+ARTIST_NOUNS = ['Band', 'Trio', 'Collective', 'Orchestra', 'Quartet', 'Project', 'Sound', 'Choir', 'Ensemble']
+
+# shows last SHOW_LENGTH and start on a SLOT grid, so a venue or an artist booked at most once
+# per slot never overlaps itself
+SLOT = timedelta(hours=3)
+SHOW_LENGTH = timedelta(hours=2)
+HORIZON = timedelta(days=365)
+
+
+def catalog_record(rng, i, nouns):
+    city, state = rng.choice(AREAS)
+    name = '{} {} {}'.format(rng.choice(ADJECTIVES), rng.choice(nouns), i)
+    return {
+        'name': name,
+        'city': city,
+        'state': state,
+        'address': '{} {} Street'.format(rng.randint(1, 9999), rng.choice(ADJECTIVES)),
+        'phone': '{:03d}{:03d}{:04d}'.format(rng.randint(200, 999), rng.randint(100, 999), rng.randint(0, 9999)),
+        'genres': rng.sample(GENRES, rng.randint(1, 3)),
+        'seeking_talent': rng.random() < 0.3,
+        'seeking_venue': rng.random() < 0.3,
+        'seeking_description': 'Looking for {} acts'.format(rng.choice(GENRES)),
+        'image_link': 'https://images.example.com/{}.jpg'.format(i),
+        'website_link': 'https://example.com/{}'.format(i),
+        'facebook_link': 'https://www.facebook.com/{}'.format(i)
+    }
+
+
+def show_records(rng, count, venue_ids, artist_ids, anchor):
+    # count shows on distinct (venue, slot) and (artist, slot) pairs, spread over anchor +- HORIZON
+    slots = int(2 * HORIZON / SLOT)
+    if count > len(venue_ids) * slots // 2 or count > len(artist_ids) * slots // 2:
+        raise ValueError('too many shows for {} venues and {} artists'.format(len(venue_ids), len(artist_ids)))
+    first = anchor - HORIZON
+    venue_slots, artist_slots = set(), set()
+    made = 0
+    while made < count:
+        venue_id, artist_id, slot = rng.choice(venue_ids), rng.choice(artist_ids), rng.randrange(slots)
+        if (venue_id, slot) in venue_slots or (artist_id, slot) in artist_slots:
+            continue
+        venue_slots.add((venue_id, slot))
+        artist_slots.add((artist_id, slot))
+        start_time = first + slot * SLOT
+        made += 1
+        yield {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time.isoformat(),
+               'end_time': (start_time + SHOW_LENGTH).isoformat()}
+
+
+def write_jsonl(path, records):
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+    return path
+
+
+def seed(venues=1000, artists=1000, shows=10000, seed=0, anchor=None, chunk_size=5000, echo=print):
+    """Adds the rows to the database the app is configured for and returns what it added."""
+    import app as fyyur
+
+    rng = random.Random(seed)
+    anchor = anchor or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    quiet = lambda message: None
+    with fyyur.app.app_context(), tempfile.TemporaryDirectory() as directory:
+        kinds = [
+            ('venues', venues, VENUE_NOUNS, fyyur.Venue, fyyur.venue_genre_table, 'venue_id', fyyur.venue_values),
+            ('artists', artists, ARTIST_NOUNS, fyyur.Artist, fyyur.artist_genre_table, 'artist_id',
+             fyyur.artist_values)
+        ]
+        ids = {}
+        for kind, count, nouns, model, genre_table, key, values in kinds:
+            first_id = (fyyur.db.session.query(fyyur.db.func.max(model.id)).scalar() or 0) + 1
+            path = write_jsonl(os.path.join(directory, kind + '.jsonl'),
+                               (catalog_record(rng, i, nouns) for i in range(count)))
+            fyyur.run_import(fyyur.db.session, path, values, fyyur.insert_catalog(model, genre_table, key),
+                             chunk_size, echo=quiet)
+            ids[kind] = [i for (i,) in fyyur.db.session.query(model.id).filter(model.id >= first_id)
+                         .order_by(model.id)]
+            echo('{}: {} rows'.format(kind, len(ids[kind])))
+        path = write_jsonl(os.path.join(directory, 'shows.jsonl'),
+                           show_records(rng, shows, ids['venues'], ids['artists'], anchor))
+        result = fyyur.run_import(fyyur.db.session, path, fyyur.show_values, fyyur.insert_shows, chunk_size,
+                                  echo=quiet)
+        echo('shows: {} rows'.format(result['imported']))
+        return {'venues': ids['venues'], 'artists': ids['artists'], 'shows': result['imported'],
+                'anchor': anchor}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--anchor', type=datetime.fromisoformat, help='centre of the show window (ISO time)')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--create-tables', action='store_true',
+                        help='create the schema with create_all (SQLite); use `flask db upgrade` on Postgres')
+    args = parser.parse_args()
+    if args.create_tables:
+        import app as fyyur
+        with fyyur.app.app_context():
+            fyyur.db.create_all()
+    seed(args.venues, args.artists, args.shows, args.seed, args.anchor, args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
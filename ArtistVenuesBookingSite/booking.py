@@ -0,0 +1,53 @@
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import timedelta
+
+# Shows may not last longer than this. Bounding the duration turns "which bookings overlap
+# [start, end)?" into a range scan over start times: only bookings starting after
+# start - MAX_SHOW_DURATION can still be running at start.
+MAX_SHOW_DURATION = timedelta(hours=24)
+
+
+class Bookings(object):
+    """Booked intervals per key (a venue or an artist), kept sorted by start time."""
+
+    def __init__(self):
+        self._intervals = defaultdict(list)  # key -> [(start, end, show id)]
+
+    def add(self, key, start, end, show_id=0):
+        insort(self._intervals[key], (start, end, show_id))
+
+    def intervals(self, key):
+        return self._intervals.get(key, [])
+
+    def conflict(self, key, start, end):
+        # the first booking of key overlapping [start, end), or None
+        intervals = self._intervals.get(key)
+        if not intervals:
+            return None
+        i = bisect_left(intervals, (start - MAX_SHOW_DURATION,))
+        while i < len(intervals) and intervals[i][0] < end:
+            if intervals[i][1] > start:
+                return intervals[i]
+            i += 1
+        return None
+
+
+def free_gaps(busy, start, end, min_length):
+    """Free [gap start, gap end) intervals of at least min_length inside [start, end).
+
+    busy holds (start, end, ...) intervals sorted by start (several sorted lists can be
+    combined with heapq.merge) and is swept once.
+    """
+    gaps = []
+    cursor = start
+    for interval in busy:
+        busy_start, busy_end = interval[0], interval[1]
+        if busy_start >= end:
+            break
+        if busy_start - cursor >= min_length:
+            gaps.append((cursor, busy_start))
+        cursor = max(cursor, busy_end)
+    if end - cursor >= min_length:
+        gaps.append((cursor, end))
+    return gaps
@@ -0,0 +1,162 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, g, make_response, request, session
+
+# Rendered-page cache for the read-heavy views.
+#
+# Every cached page is filed under one or more tags ('venues', 'venue:3', ...). Each tag has a
+# generation number that is part of the page key, so invalidating a tag only bumps its
+# generation: stale pages are never looked up again and age out of the backend on their own.
+# Backends only need get / set / incr, which a Redis client also provides.
+#
+# With read replicas, a page rendered just after an invalidation could be read from a replica
+# that has not replayed the write yet, and cached under the new generation. For
+# CACHE_SETTLE_SECONDS after any invalidation a miss sets g.read_primary, which the replica
+# router honours, so the page that fills the cache is rendered from the primary.
+
+
+class LRUBackend(object):
+    """In-process backend: least recently used entries are evicted past max_entries.
+
+    Counters are kept apart from the entries and never evicted, so a tag generation cannot
+    fall back to an older value and resurrect stale pages.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires at, value)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl if ttl else None, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class RedisBackend(object):
+    """Backend over a redis-py compatible client (shared by every worker)."""
+
+    def __init__(self, client, prefix='fyyur:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl or None)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class Cache(object):
+    """Caches whole GET responses of the decorated views, with hit / miss counters.
+
+    Configured by CACHE_BACKEND (a backend instance), or CACHE_REDIS_URL for a RedisBackend;
+    an LRUBackend of CACHE_MAX_ENTRIES pages by default. CACHE_TTL and CACHE_SETTLE_SECONDS
+    are in seconds.
+    """
+
+    def __init__(self, app):
+        self.backend = app.config.get('CACHE_BACKEND')
+        if self.backend is None and app.config.get('CACHE_REDIS_URL'):
+            import redis
+            self.backend = RedisBackend(redis.Redis.from_url(app.config['CACHE_REDIS_URL']))
+        if self.backend is None:
+            self.backend = LRUBackend(app.config.get('CACHE_MAX_ENTRIES', 1024))
+        self.ttl = app.config.get('CACHE_TTL', 60)
+        self.settle = app.config.get('CACHE_SETTLE_SECONDS', 0)
+        self.invalidated_at = 0.0  # by this process; the shared backend keeps the latest of all
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _key(self, tags):
+        generations = [str(self.backend.get('generation:' + tag) or 0) for tag in tags]
+        return 'page:{}:{}:{}'.format(','.join(tags), ','.join(generations), request.full_path)
+
+    def cached(self, *tags):
+        """Cache the view's page under tags, formatted with the view arguments ('venue:{venue_id}')."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                # a pending flash message is rendered into the page, so it must not be cached or skipped
+                if request.method != 'GET' or session.get('_flashes'):
+                    return view(**kwargs)
+                key = self._key([tag.format(**kwargs) for tag in tags])
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self.stats['hits'] += 1
+                    body, mimetype = entry
+                    return Response(body, mimetype=mimetype, headers={'X-Cache': 'HIT'})
+                self.stats['misses'] += 1
+                if self.settling():
+                    g.read_primary = True
+                response = make_response(view(**kwargs))
+                if response.status_code == 200:
+                    self.backend.set(key, [response.get_data(as_text=True), response.mimetype], self.ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    @property
+    def shared(self):
+        # whether invalidations made in one process reach the pages cached by the others
+        return not isinstance(self.backend, LRUBackend)
+
+    def settling(self):
+        """Whether the last invalidation is less than CACHE_SETTLE_SECONDS old."""
+        if not self.settle:
+            return False
+        invalidated_at = self.invalidated_at
+        if self.shared:
+            invalidated_at = max(invalidated_at, self.backend.get('invalidated_at') or 0.0)
+        return time.time() - invalidated_at < self.settle
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.incr('generation:' + tag)
+        self.stats['invalidations'] += len(tags)
+        if tags and self.settle:
+            self.invalidated_at = time.time()
+            if self.shared:
+                self.backend.set('invalidated_at', self.invalidated_at, int(self.settle) + 1)
+
+    def clear(self):
+        self.backend.clear()
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import event, func, select
+
+# Append-only log of writes to the catalog and show tables, written in the same transaction
+# as the change itself. Readers use the newest change id of a table as a cheap version
+# number (ETags, Last-Modified) and can replay changes after a known id to refresh
+# derived data incrementally.
+#
+# Both only work if change ids become visible in id order. A sequence alone does not promise
+# that: a transaction can take id 10, another id 11 and commit first, and a reader that saw
+# 11 would never look back for 10. So the change rows are only collected while the
+# transaction runs, and written just before it commits, under a transaction-scoped advisory
+# lock (Postgres; SQLite runs one writer at a time anyway). The lock is held from the change
+# ids' allocation to the commit, so the next writer's ids are allocated, and committed,
+# after them; writers queue on it for that moment only. It is taken after every other lock
+# the transaction holds, so it cannot take part in a lock-order deadlock. One lock covers
+# every table: followers and ETags read ids across several tables at once.
+
+# pg_advisory_xact_lock key of the change log
+LOCK_KEY = 0x4679797243686e67
+
+
+class ChangeLog(object):
+
+    def __init__(self, db, change_model, *models):
+        self.db = db
+        self.model = change_model
+        self.models = models
+        event.listen(db.session, 'before_flush', self._before_flush)
+        event.listen(db.session, 'after_flush', self._after_flush)
+        event.listen(db.session, 'before_commit', self._before_commit)
+        event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+
+    def _before_flush(self, session, flush_context, instances):
+        # attribute history is still intact here; new rows only get their ids during the flush
+        pending = session.info.setdefault('changes', [])
+        for op, objects in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+            for obj in objects:
+                if isinstance(obj, self.models) and (op != 'update' or session.is_modified(obj)):
+                    pending.append((obj, op))
+
+    def _after_flush(self, session, flush_context):
+        pending = session.info.pop('changes', None)
+        if pending:
+            self._write(session, [self._row(obj.__tablename__, obj.id, op) for obj, op in pending])
+
+    def _write(self, session, rows):
+        # queue rows for the commit; once the log is written (a flush during the commit), add them
+        if session.info.get('change_lock') is session.get_transaction():
+            session.execute(self.model.__table__.insert(), rows)
+        else:
+            session.info.setdefault('change_rows', []).extend(rows)
+
+    def _before_commit(self, session):
+        if session.in_nested_transaction():
+            return
+        session.flush()
+        rows = session.info.pop('change_rows', None)
+        if not rows:
+            return
+        if self.db.engine.dialect.name == 'postgresql':
+            session.execute(select(func.pg_advisory_xact_lock(LOCK_KEY)))
+        session.info['change_lock'] = session.get_transaction()
+        session.execute(self.model.__table__.insert(), rows)
+
+    def _after_rollback(self, session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop('changes', None)
+            session.info.pop('change_rows', None)
+
+    @staticmethod
+    def _row(table_name, row_id, op):
+        return {'table_name': table_name, 'row_id': row_id, 'op': op, 'changed_at': datetime.utcnow()}
+
+    def record(self, table_name, row_ids, op='insert'):
+        """Log writes made without the ORM (bulk imports); row_ids may be [None] for a whole batch."""
+        rows = [self._row(table_name, row_id, op) for row_id in row_ids]
+        if rows:
+            self._write(self.db.session(), rows)
+
+    def latest(self, *table_names):
+        # (newest change id, its time) across table_names, or (0, None) if nothing was logged.
+        # One index seek per table for its newest id, then one primary key lookup: the cost
+        # does not grow with the log, so a 304 stays cheap.
+        newest = [select(func.max(self.model.id)).where(self.model.table_name == table_name).scalar_subquery()
+                  for table_name in table_names]
+        row = self.db.session.query(self.model.id, self.model.changed_at) \
+            .filter(self.model.id.in_(newest)).order_by(self.model.id.desc()).first()
+        return (row.id, row.changed_at) if row else (0, None)
+
+
+class ChangeFollower(object):
+    """Base of in-process copies of tables kept current from the change log.
+
+    sync() loads the copy on first use; after that, at most every `interval` seconds (and
+    right after this process commits, or on every call with force) it passes the rows of `tables` changed since its last
+    look to apply() as {table name: set of row ids}. Changes logged without row ids (bulk
+    imports) reload the copy instead. Subclasses implement load() and apply(), and read
+    under self.lock.
+    """
+
+    def __init__(self, db, change_model, tables, interval):
+        self.db = db
+        self.change = change_model
+        self.tables = list(tables)
+        self.interval = interval
+        self.change_id = None  # newest change applied; None until loaded
+        self.checked_at = 0.0
+        self.stats = {'loads': 0, 'refreshes': 0}
+        self.lock = threading.RLock()
+        event.listen(db.session, 'after_commit', self._after_commit)
+
+    def _after_commit(self, session):
+        # our own write: look for it on the next read
+        self.checked_at = 0.0
+
+    def load(self):
+        raise NotImplementedError
+
+    def apply(self, changed):
+        raise NotImplementedError
+
+    def sync(self, force=False):
+        now = time.monotonic()
+        if not force and self.change_id is not None and now - self.checked_at < self.interval:
+            return
+        with self.lock:
+            if force or self.change_id is None or now - self.checked_at >= self.interval:
+                self._catch_up()
+                self.checked_at = now
+
+    def _catch_up(self):
+        if self.change_id is not None:
+            changes = self.db.session.query(self.change.id, self.change.table_name, self.change.row_id) \
+                .filter(self.change.id > self.change_id, self.change.table_name.in_(self.tables)) \
+                .order_by(self.change.id).all()
+            if not changes:
+                return
+            if all(row_id is not None for _, _, row_id in changes):
+                changed = defaultdict(set)
+                for _, table_name, row_id in changes:
+                    changed[table_name].add(row_id)
+                self.apply(dict(changed))
+                self.change_id = changes[-1].id
+                self.stats['refreshes'] += 1
+                return
+        # the change id is read first: changes made during the load are applied again after it
+        self.change_id = self.db.session.query(func.max(self.change.id)).scalar() or 0
+        self.load()
+        self.stats['loads'] += 1
@@ -1,14 +1,104 @@
 import os
-SECRET_KEY = os.urandom(32)
+SECRET_KEY = os.environ.get('SECRET_KEY', 'any secret string')
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 # Enable debug mode.
-DEBUG = True
+DEBUG = os.environ.get('FLASK_DEBUG') == '1'
 
 # Connect to the database
 
 
 # IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = "<postgresql://sissi@localhost:5432/fyyur>"
-SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://sissi@localhost:5432/fyyur')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Connection pool, per worker process. Size it so that
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays below the server's max_connections.
+if SQLALCHEMY_DATABASE_URI.startswith('postgresql'):
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        # seconds to wait for a free connection before giving up
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        # replace connections older than this, before the server or a proxy drops them
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+        'connect_args': {
+            'options': '-c statement_timeout={}'.format(int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000)))
+        }
+    }
+
+# Only these client addresses may read /internal/metrics
+METRICS_ALLOWED_ADDRS = os.environ.get('METRICS_ALLOWED_ADDRS', '127.0.0.1,::1').split(',')
+
+# also match misspelt names with pg_trgm similarity (needs the pg_trgm extension)
+SEARCH_TRIGRAM = os.environ.get('SEARCH_TRIGRAM') == '1'
+# length of a show when the form or an imported row gives no end time
+SHOW_DURATION_MINUTES = int(os.environ.get('SHOW_DURATION_MINUTES', 120))
+# recommended venues / artists kept for, and shown on, each artist / venue page
+MATCHES_PER_PAGE = int(os.environ.get('MATCHES_PER_PAGE', 6))
+# queue a match refresh after every venue / artist / show write, when job workers are configured
+# (otherwise run `flask refresh-matches` on a schedule)
+MATCHES_AUTO_REFRESH = os.environ.get('MATCHES_AUTO_REFRESH', '1') == '1'
+
+# serve the venue / artist listings and searches from an in-process copy of the catalog
+# (read_model.py), checked against the change log at most every READ_MODEL_REFRESH_SECONDS
+READ_MODEL = os.environ.get('READ_MODEL') == '1'
+READ_MODEL_REFRESH_SECONDS = float(os.environ.get('READ_MODEL_REFRESH_SECONDS', 1))
+
+# Background jobs (jobs.py): run by `flask worker` processes (JOB_WORKERS=1), or by this many
+# threads of the web process. With neither, no job is queued. Workers in their own processes
+# invalidate pages they change, so they need the shared cache (REDIS_URL).
+JOB_WORKERS = os.environ.get('JOB_WORKERS') == '1'
+JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 0))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+# first retry delay, doubled on every further attempt
+JOB_BACKOFF_SECONDS = int(os.environ.get('JOB_BACKOFF_SECONDS', 10))
+# a job running longer than this is taken to have lost its worker and is run again
+JOB_TIMEOUT_SECONDS = int(os.environ.get('JOB_TIMEOUT_SECONDS', 300))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1))
+# job workers move started shows from the upcoming to the past counts this often (0: never,
+# run `flask roll-counters` from cron instead)
+ROLL_COUNTERS_SECONDS = int(os.environ.get('ROLL_COUNTERS_SECONDS', 60))
+# seconds a rendered listing / detail page may be served from the page cache
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 60))
+# keep the page cache in Redis (needs redis-py), shared by every process, instead of in each one
+CACHE_REDIS_URL = os.environ.get('REDIS_URL')
+# run the independent queries of the detail pages concurrently on an async engine (needs asyncpg).
+# The views stay synchronous, so this shortens a detail page but does not let a worker serve more
+# requests at once. Its pool is separate from the one above, and there is one per replica: count
+# them in when sizing max_connections.
+ASYNC_DATABASE = os.environ.get('ASYNC_DATABASE') == '1'
+ASYNC_ENGINE_OPTIONS = {}
+if SQLALCHEMY_DATABASE_URI.startswith('postgresql'):
+    ASYNC_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('ASYNC_DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+        'connect_args': {
+            'server_settings': {'statement_timeout': os.environ.get('DB_STATEMENT_TIMEOUT_MS', '30000')}
+        }
+    }
+# per-request statement counts and timings: a Server-Timing header and one JSON line per
+# request in REQUEST_LOG; a statement repeated more than NPLUSONE_THRESHOLD times is logged too.
+# The log rotates at REQUEST_LOG_MAX_BYTES, keeping REQUEST_LOG_BACKUPS old files; an empty
+# REQUEST_LOG keeps the header only.
+REQUEST_METRICS = os.environ.get('REQUEST_METRICS') == '1'
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') == '1'
+NPLUSONE_THRESHOLD = int(os.environ.get('NPLUSONE_THRESHOLD', 5))
+REQUEST_LOG = os.environ.get('REQUEST_LOG', os.path.join(basedir, 'requests.log'))
+REQUEST_LOG = REQUEST_LOG and os.path.abspath(REQUEST_LOG)
+REQUEST_LOG_MAX_BYTES = int(os.environ.get('REQUEST_LOG_MAX_BYTES', 50 * 1024 * 1024))
+REQUEST_LOG_BACKUPS = int(os.environ.get('REQUEST_LOG_BACKUPS', 5))
+# read replicas for GET requests, comma-separated URLs; writes and the requests right after
+# them stay on the primary (see replicas.py)
+SQLALCHEMY_REPLICA_URIS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+REPLICA_CHECK_SECONDS = float(os.environ.get('REPLICA_CHECK_SECONDS', 1))
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+# after an invalidation, pages are re-rendered from the primary for this long, so a replica
+# that has not replayed the write cannot put the stale page back in the cache
+CACHE_SETTLE_SECONDS = float(os.environ.get(
+    'CACHE_SETTLE_SECONDS', REPLICA_MAX_LAG_SECONDS + REPLICA_CHECK_SECONDS if SQLALCHEMY_REPLICA_URIS else 0))
@@ -0,0 +1,94 @@
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import bindparam, func
+
+# Upcoming / past show counts stored on the venue and artist rows, so listings read them
+# instead of counting shows.
+#
+# The split is made against a watermark (rolled_at), not the clock: a show counts as upcoming
+# while start_time > rolled_at. Adding shows bumps the counters in the caller's transaction;
+# roll() advances the watermark and moves the shows it passes from upcoming to past. Writers
+# hold a share lock on the watermark row and roll() an exclusive one, so a show cannot be
+# counted against a watermark that moves before it commits.
+
+
+class ShowCounters(object):
+
+    def __init__(self, db, show_model, clock_model, owners):
+        # owners: {Venue: 'venue_id', Artist: 'artist_id'}, each model with
+        # upcoming_shows_count and past_shows_count columns
+        self.db = db
+        self.show = show_model
+        self.clock = clock_model
+        self.owners = owners
+
+    def watermark(self, lock=None):
+        """The current rolled_at; lock is None, 'share' (writers) or 'update' (roll)."""
+        query = self.db.session.query(self.clock).filter(self.clock.id == 1)
+        if lock and self.db.engine.dialect.name == 'postgresql':
+            query = query.with_for_update(read=lock == 'share')
+        clock = query.one_or_none()
+        if clock is None:
+            # a database made with create_all rather than the migrations
+            clock = self.clock(id=1, rolled_at=datetime.now())
+            self.db.session.add(clock)
+            self.db.session.flush()
+        return clock.rolled_at
+
+    def _update(self, owner, deltas):
+        # deltas: {owner id: (upcoming delta, past delta)}, applied with one executemany
+        table = owner.__table__
+        statement = table.update().where(table.c.id == bindparam('owner_id')).values(
+            upcoming_shows_count=table.c.upcoming_shows_count + bindparam('upcoming'),
+            past_shows_count=table.c.past_shows_count + bindparam('past'))
+        self.db.session.execute(statement, [{'owner_id': owner_id, 'upcoming': upcoming, 'past': past}
+                                            for owner_id, (upcoming, past) in deltas.items()])
+
+    def add(self, shows):
+        """Count new shows (dicts with start_time and the owner ids); call before commit."""
+        if not shows:
+            return
+        rolled_at = self.watermark(lock='share')
+        for owner, key in self.owners.items():
+            upcoming = Counter(show[key] for show in shows if show['start_time'] > rolled_at)
+            past = Counter(show[key] for show in shows if show['start_time'] <= rolled_at)
+            self._update(owner, {owner_id: (upcoming[owner_id], past[owner_id])
+                                 for owner_id in set(upcoming) | set(past)})
+
+    def roll(self, now=None):
+        """Move shows that started since the last roll from upcoming to past.
+
+        Returns {owner model: set of changed ids}; the caller commits.
+        """
+        now = now or datetime.now()
+        rolled_at = self.watermark(lock='update')
+        changed = {}
+        if now <= rolled_at:
+            return changed
+        for owner, key in self.owners.items():
+            column = getattr(self.show, key)
+            rows = self.db.session.query(column, func.count(self.show.id)) \
+                .filter(self.show.start_time > rolled_at, self.show.start_time <= now) \
+                .group_by(column)
+            deltas = {owner_id: (-count, count) for owner_id, count in rows}
+            if deltas:
+                self._update(owner, deltas)
+            changed[owner] = set(deltas)
+        self.db.session.query(self.clock).filter(self.clock.id == 1).update({'rolled_at': now})
+        return changed
+
+    def rebuild(self, now=None):
+        """Recount every owner from the show table (after manual edits, or to repair drift)."""
+        now = now or datetime.now()
+        self.watermark(lock='update')
+        for owner, key in self.owners.items():
+            column = getattr(self.show, key)
+            owned = column == owner.id
+            upcoming = self.db.session.query(func.count(self.show.id)) \
+                .filter(owned, self.show.start_time > now).correlate(owner).scalar_subquery()
+            past = self.db.session.query(func.count(self.show.id)) \
+                .filter(owned, self.show.start_time <= now).correlate(owner).scalar_subquery()
+            self.db.session.query(owner).update({'upcoming_shows_count': upcoming, 'past_shows_count': past},
+                                                synchronize_session=False)
+        self.db.session.query(self.clock).filter(self.clock.id == 1).update({'rolled_at': now})
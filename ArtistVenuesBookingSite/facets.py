@@ -0,0 +1,140 @@
+from changes import ChangeFollower
+
+# Genre facets of the venue and artist listings.
+#
+# For every genre, the ids of its venues (and of its artists) are held as one Python int used
+# as a bitset: bit i is set when entity i has the genre. A multi-genre filter is a handful of
+# big-int ANDs / ORs, and the count of every genre within the filtered set is one AND and one
+# popcount per genre. Each (state, city) area has a bitset too, so the counts of a drilled-down
+# directory are those of its area. The bitsets are loaded from the genre link tables on first
+# use and kept current from the change log, like the read model.
+
+IN_CHUNK = 1000
+
+
+def bitset(ids):
+    # int with the bits of ids set, built in one pass over a byte buffer
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        buffer[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def popcount(bits):
+    return bits.bit_count() if hasattr(bits, 'bit_count') else bin(bits).count('1')
+
+
+def members(bits):
+    """The ids set in bits, ascending."""
+    ids = []
+    for offset, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, 'little')):
+        while byte:
+            low = byte & -byte
+            ids.append(offset * 8 + low.bit_length() - 1)
+            byte ^= low
+    return ids
+
+
+class Membership(object):
+    """Fast `id in bits` tests for one request, without shifting the big int each time."""
+
+    def __init__(self, bits):
+        self.bytes = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+    def __contains__(self, i):
+        return (i >> 3) < len(self.bytes) and bool(self.bytes[i >> 3] >> (i & 7) & 1)
+
+
+class GenreFacets(ChangeFollower):
+
+    def __init__(self, app, db, change_model, genre_model, owners):
+        # owners: {'venue': (Venue, venue_genre_table), 'artist': (Artist, artist_genre_table)}
+        ChangeFollower.__init__(self, db, change_model, [model.__tablename__ for model, _ in owners.values()],
+                                app.config.get('READ_MODEL_REFRESH_SECONDS', 1))
+        self.genre = genre_model
+        self.owners = owners
+        self.genre_ids = {}  # name -> id
+        self.all = {kind: 0 for kind in owners}  # every existing id
+        self.bits = {kind: {} for kind in owners}  # genre id -> ids with that genre
+        self.areas = {kind: {} for kind in owners}  # (state, city) -> ids in that area
+
+    def _links(self, kind, ids=None):
+        model, genre_table = self.owners[kind]
+        owner_column = getattr(genre_table.c, kind + '_id')
+        existing, links = self.db.session.query(model.id, model.state, model.city), \
+            self.db.session.query(owner_column, genre_table.c.genre_id)
+        if ids is not None:
+            existing, links = existing.filter(model.id.in_(ids)), links.filter(owner_column.in_(ids))
+        return existing.all(), links.all()
+
+    @staticmethod
+    def _group(pairs):
+        # {group: bitset of the ids} from (id, group) pairs
+        groups = {}
+        for owner_id, group in pairs:
+            groups.setdefault(group, []).append(owner_id)
+        return {group: bitset(ids) for group, ids in groups.items()}
+
+    def load(self):
+        self.genre_ids = {name: genre_id for genre_id, name in self.db.session.query(self.genre.id, self.genre.name)}
+        for kind in self.owners:
+            existing, links = self._links(kind)
+            self.all[kind] = bitset(owner_id for owner_id, _, _ in existing)
+            self.areas[kind] = self._group((owner_id, (state, city)) for owner_id, state, city in existing)
+            self.bits[kind] = self._group(links)
+
+    def apply(self, changed):
+        for kind, (model, _) in self.owners.items():
+            ids = list(changed.get(model.__tablename__, ()))
+            for start in range(0, len(ids), IN_CHUNK):
+                chunk = ids[start:start + IN_CHUNK]
+                existing, links = self._links(kind, chunk)
+                # clear the chunk everywhere, then set what the rows say now
+                keep = ~bitset(chunk)
+                self.all[kind] = self.all[kind] & keep | bitset(owner_id for owner_id, _, _ in existing)
+                for groups, pairs in ((self.bits[kind], links),
+                                      (self.areas[kind], [(owner_id, (state, city)) for owner_id, state, city
+                                                          in existing])):
+                    for group in list(groups):
+                        groups[group] &= keep
+                        if not groups[group]:
+                            del groups[group]
+                    for group, group_bits in self._group(pairs).items():
+                        groups[group] = groups.get(group, 0) | group_bits
+                if set(self.bits[kind]) - set(self.genre_ids.values()):
+                    self.genre_ids = {name: genre_id for genre_id, name
+                                      in self.db.session.query(self.genre.id, self.genre.name)}
+
+    def select(self, kind, genre_names, match_all=True, state=None, city=None, fresh=False):
+        """(bitset of the matching ids, [(genre name, count within them)] by name).
+
+        With no genre names every entity matches. Unknown genre names match nothing. state
+        (and city) keep the ids of one area. fresh catches up with the change log first,
+        instead of at most every interval.
+        """
+        self.sync(force=fresh)
+        with self.lock:
+            bits, everything, names = self.bits[kind], self.all[kind], self.genre_ids
+            if state:
+                everything = 0
+                for (area_state, area_city), area_bits in self.areas[kind].items():
+                    if area_state == state and (not city or area_city == city):
+                        everything |= area_bits
+            if not genre_names:
+                selected = everything
+            else:
+                sets = [bits.get(names.get(name), 0) for name in genre_names]
+                selected = 0
+                if match_all:
+                    selected = everything
+                    for genre_bits in sets:
+                        selected &= genre_bits
+                else:
+                    for genre_bits in sets:
+                        selected |= genre_bits
+                    selected &= everything
+            counts = [(name, popcount(selected & bits.get(genre_id, 0))) for name, genre_id in sorted(names.items())]
+        return selected, counts
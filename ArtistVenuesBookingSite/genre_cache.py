@@ -0,0 +1,76 @@
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import make_transient_to_detached
+
+
+class GenreCache(object):
+    """In-process genre name -> id map with a bulk get-or-create.
+
+    Names inserted by a transaction only become visible to the cache once it commits, so a
+    rolled back submission cannot leave ids of genres that were never written. Genres
+    inserted through the ORM elsewhere clear the cache.
+    """
+
+    def __init__(self, db, model):
+        self.db = db
+        self.model = model
+        self.ids = {}
+        event.listen(model, 'after_insert', self.invalidate)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+
+    def invalidate(self, *args):
+        self.ids.clear()
+
+    def _after_commit(self, session):
+        self.ids.update(session.info.pop('genre_pending', {}))
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop('genre_pending', None)
+
+    def _upsert(self, names):
+        # name -> id for names, inserting the missing ones: at most two statements
+        session = self.db.session
+        table = self.model.__table__
+        rows = [{'name': name} for name in names]
+        found = {}
+        if self.db.engine.dialect.name == 'postgresql':
+            insert = postgresql.insert(table).values(rows) \
+                .on_conflict_do_nothing(index_elements=['name']) \
+                .returning(table.c.id, table.c.name)
+            found.update((name, genre_id) for genre_id, name in session.execute(insert))
+        else:
+            session.execute(sqlite.insert(table).values(rows).on_conflict_do_nothing(index_elements=['name']))
+        # names that already existed (or were just inserted by a concurrent submission)
+        existing = [name for name in names if name not in found]
+        if existing:
+            query = select(table.c.id, table.c.name).where(table.c.name.in_(existing))
+            found.update((name, genre_id) for genre_id, name in session.execute(query))
+        return found
+
+    def ids_for(self, names):
+        """name -> id for names, creating any genres that do not exist yet.
+
+        Cached names cost no statements; the rest cost at most two however many there are.
+        """
+        ids = {name: self.ids[name] for name in names if name in self.ids}
+        missing = [name for name in names if name not in ids]
+        if missing:
+            found = self._upsert(missing)
+            self.db.session.info.setdefault('genre_pending', {}).update(found)
+            ids.update(found)
+        return ids
+
+    def resolve(self, names):
+        """Genre instances for names, in order, creating any that do not exist yet."""
+        names = list(dict.fromkeys(name for name in names if name))
+        session = self.db.session
+        ids = self.ids_for(names)
+
+        genres = []
+        for name in names:
+            # attach by identity, without loading the row
+            genre = self.model(id=ids[name], name=name)
+            make_transient_to_detached(genre)
+            genres.append(session.merge(genre, load=False))
+        return genres
@@ -0,0 +1,65 @@
+from datetime import datetime
+
+# Just enough iCalendar (RFC 5545) to publish show feeds that calendar clients subscribe to.
+#
+# Show times are stored as the venue's local wall-clock time without a zone, so they are
+# written as "floating" times (no Z, no TZID) and every client shows them as stored. Lines
+# end in CRLF and are folded at 75 octets; text values are escaped.
+
+MIME_TYPE = 'text/calendar'
+PRODID = '-//Fyyur//Shows//EN'
+MAX_LINE = 75  # octets, CRLF excluded
+
+
+def escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,') \
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def fold(line):
+    # split a content line into chunks of at most MAX_LINE octets, never inside a UTF-8 character
+    data = line.encode('utf-8')
+    if len(data) <= MAX_LINE:
+        return line + '\r\n'
+    chunks, start, limit = [], 0, MAX_LINE
+    while start < len(data):
+        end = min(start + limit, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1  # continuation byte: cut before its character
+        chunks.append(data[start:end].decode('utf-8'))
+        start, limit = end, MAX_LINE - 1  # continuation lines start with a space
+    return '\r\n '.join(chunks) + '\r\n'
+
+
+def floating(value):
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def utc(value):
+    # value is a naive UTC datetime
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def event(uid, start, end, summary, location=None, url=None, stamp=None):
+    """The VEVENT lines of one show."""
+    lines = ['BEGIN:VEVENT',
+             'UID:' + uid,
+             'DTSTAMP:' + utc(stamp or datetime.utcnow()),
+             'DTSTART:' + floating(start),
+             'DTEND:' + floating(end),
+             'SUMMARY:' + escape(summary)]
+    if location:
+        lines.append('LOCATION:' + escape(location))
+    if url:
+        lines.append('URL:' + url)
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def calendar(name, events):
+    """A VCALENDAR named name around the VEVENT strings in events, as an iterable of strings."""
+    yield ''.join(fold(line) for line in ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:' + PRODID,
+                                          'CALSCALE:GREGORIAN', 'METHOD:PUBLISH', 'X-WR-CALNAME:' + escape(name)])
+    for text in events:
+        yield text
+    yield 'END:VCALENDAR\r\n'
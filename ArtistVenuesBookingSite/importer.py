@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+# Streaming bulk import: records are read lazily from CSV or JSONL, normalized and inserted
+# one chunk (and one transaction) at a time, so memory stays flat however big the file is.
+
+
+def read_records(path):
+    """Yield (line number, record, error) for each row of a .csv or .jsonl file."""
+    with open(path, newline='') as f:
+        if path.lower().endswith('.csv'):
+            for line_no, record in enumerate(csv.DictReader(f), start=2):
+                yield line_no, record, None
+        else:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_no, json.loads(line), None
+                except ValueError as e:
+                    yield line_no, line.rstrip('\n'), 'invalid JSON: {}'.format(e)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def copy_rows(connection, table, columns, rows):
+    # Postgres COPY ... FROM STDIN of rows (in `columns` order) on the DBAPI connection behind `connection`
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    column_list = ', '.join('"{}"'.format(column) for column in columns)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(table, column_list), buffer)
+    finally:
+        cursor.close()
+
+
+class RejectLog(object):
+    """Writes rejected records, with the reason, next to the input as <input>.rejected.jsonl."""
+
+    def __init__(self, path):
+        self.path = path + '.rejected.jsonl'
+        self.count = 0
+        self._file = None
+
+    def write(self, line_no, record, reason):
+        if self._file is None:
+            self._file = open(self.path, 'w')
+        self._file.write(json.dumps({'line': line_no, 'error': reason, 'record': record}, default=str) + '\n')
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def run_import(session, path, prepare, insert, chunk_size=1000, echo=print):
+    """Import path chunk by chunk and return {'imported', 'rejected', 'seconds'}.
+
+    prepare(record) returns the normalized row or raises ValueError (KeyError, TypeError,
+    OverflowError) to reject it. insert(rows) writes one chunk and returns [(index in rows,
+    reason)] for rows it refused; a database error rejects the whole chunk.
+    """
+    rejects = RejectLog(path)
+    if os.path.exists(rejects.path):
+        os.remove(rejects.path)
+    imported = 0
+    started = time.perf_counter()
+    try:
+        for chunk in chunked(read_records(path), chunk_size):
+            rows, sources = [], []
+            for line_no, record, error in chunk:
+                if error is None:
+                    try:
+                        rows.append(prepare(record))
+                        sources.append((line_no, record))
+                        continue
+                    except (ValueError, KeyError, TypeError, OverflowError) as e:
+                        error = str(e) or type(e).__name__
+                rejects.write(line_no, record, error)
+            if not rows:
+                continue
+            try:
+                refused = insert(rows)
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                refused = [(i, 'database error: {}'.format(e)) for i in range(len(rows))]
+            for i, reason in refused:
+                rejects.write(sources[i][0], sources[i][1], reason)
+            imported += len(rows) - len(refused)
+            elapsed = time.perf_counter() - started
+            echo('{} rows imported, {} rejected ({:.0f} rows/s)'.format(
+                imported, rejects.count, imported / elapsed if elapsed else 0))
+    finally:
+        rejects.close()
+        session.close()
+
+    seconds = time.perf_counter() - started
+    echo('Imported {} rows in {:.1f}s ({:.0f} rows/s).'.format(imported, seconds, imported / seconds if seconds else 0))
+    if rejects.count:
+        echo('{} rejected rows written to {}'.format(rejects.count, rejects.path))
+    return {'imported': imported, 'rejected': rejects.count, 'seconds': seconds}
@@ -0,0 +1,183 @@
+import logging
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Background jobs for the follow-up work of a write, queued in a database table so no broker
+# is needed.
+#
+# enqueue() inserts the job in the caller's transaction: it exists only if the write commits,
+# and no worker sees it earlier. A worker claims the oldest due job with
+# SELECT ... FOR UPDATE SKIP LOCKED (Postgres), so concurrent workers never take the same one,
+# and leases it for JOB_TIMEOUT_SECONDS; a job whose worker died is claimed again once the
+# lease runs out. The handler's database work commits together with the job's removal. A
+# failing job is retried with exponential backoff, JOB_MAX_ATTEMPTS times in all, then kept
+# with status 'failed' and its traceback. A job enqueued with a key is dropped while a job
+# with the same key is still waiting, so a burst of writes asks for one refresh, not many.
+# A periodic job (every()) queues its next run, keyed by its name, in the transaction that
+# removes the finished one; starting workers queues the first run, so exactly one is waiting.
+#
+# Workers run as `flask worker` processes (JOB_WORKERS), or as JOB_WORKER_THREADS threads of
+# the web process. Without either, `enabled` is false and callers do not queue work that
+# nothing would run. SQLite has no row locks: run a single worker there.
+
+log = logging.getLogger('fyyur.jobs')
+
+
+class JobQueue(object):
+
+    def __init__(self, app, db, job_model):
+        self.app = app
+        self.db = db
+        self.model = job_model
+        self.handlers = {}
+        self.periodic = {}
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', 5)
+        self.backoff = app.config.get('JOB_BACKOFF_SECONDS', 10)
+        self.timeout = app.config.get('JOB_TIMEOUT_SECONDS', 300)
+        self.poll = app.config.get('JOB_POLL_SECONDS', 1)
+        self.enabled = bool(app.config.get('JOB_WORKERS') or app.config.get('JOB_WORKER_THREADS'))
+        self.stats = {'done': 0, 'retried': 0, 'failed': 0}
+        self._wake = threading.Event()
+        self._threads = []
+        app.extensions['jobs'] = self
+        event.listen(db.session, 'after_commit', self._after_commit)
+        if app.config.get('JOB_WORKER_THREADS'):
+            app.before_first_request(lambda: self.start(app.config['JOB_WORKER_THREADS']))
+
+    def task(self, name):
+        """Register the decorated function as the handler of jobs called name."""
+        def register(handler):
+            self.handlers[name] = handler
+            return handler
+        return register
+
+    def every(self, name, seconds):
+        """Register the decorated function as the handler of a job called name run every seconds."""
+        def register(handler):
+            def run(**args):
+                handler(**args)
+                self.enqueue(name, key=name, delay=seconds)
+            self.handlers[name] = run
+            self.periodic[name] = seconds
+            return handler
+        return register
+
+    def enqueue(self, name, key=None, delay=0, **args):
+        """Queue a job in the current transaction; args must be JSON serialisable."""
+        table = self.model.__table__
+        dialect = postgresql if self.db.engine.dialect.name == 'postgresql' else sqlite
+        statement = dialect.insert(table).values(name=name, key=key, args=args, status='queued', attempts=0,
+                                                 run_at=datetime.utcnow() + timedelta(seconds=delay),
+                                                 created_at=datetime.utcnow())
+        if key is not None:
+            statement = statement.on_conflict_do_nothing(index_elements=['key'], index_where=self.waiting(table.c))
+        self.db.session.execute(statement)
+        self.db.session.info['jobs_queued'] = True
+
+    @staticmethod
+    def waiting(columns):
+        # queued and not claimed by a worker: the rows the key is unique among
+        return (columns.status == 'queued') & columns.locked_at.is_(None)
+
+    def _after_commit(self, session):
+        if session.info.pop('jobs_queued', False):
+            self._wake.set()
+
+    def _claim(self):
+        # lease the oldest due job in its own short transaction
+        session = self.db.session
+        query = session.query(self.model) \
+            .filter(self.model.status == 'queued', self.model.run_at <= datetime.utcnow()) \
+            .order_by(self.model.run_at, self.model.id).limit(1)
+        if self.db.engine.dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+        job = query.first()
+        if job is None:
+            session.rollback()
+            return None
+        job.locked_at = datetime.utcnow()
+        job.run_at = job.locked_at + timedelta(seconds=self.timeout)
+        claimed = (job.id, job.name, job.key, job.args, job.attempts)
+        session.commit()
+        return claimed
+
+    def run_one(self):
+        """Run one due job, if there is one; returns whether a job was run."""
+        claimed = self._claim()
+        if claimed is None:
+            return False
+        job_id, name, key, args, attempts = claimed
+        session = self.db.session
+        try:
+            self.handlers[name](**args)
+            session.query(self.model).filter(self.model.id == job_id).delete(synchronize_session=False)
+            session.commit()
+            self.stats['done'] += 1
+        except Exception:
+            session.rollback()
+            self._failed(job_id, key, attempts + 1, traceback.format_exc())
+        return True
+
+    def _failed(self, job_id, key, attempts, error):
+        session = self.db.session
+        jobs = session.query(self.model)
+        failed = attempts >= self.max_attempts
+        if not failed and key is not None and jobs.filter(self.waiting(self.model), self.model.key == key).first():
+            # an identical job is already waiting; it does the work
+            jobs.filter(self.model.id == job_id).delete(synchronize_session=False)
+        else:
+            jobs.filter(self.model.id == job_id).update({
+                'status': 'failed' if failed else 'queued',
+                'attempts': attempts,
+                'locked_at': None,
+                'run_at': datetime.utcnow() + timedelta(seconds=self.backoff * 2 ** (attempts - 1)),
+                'last_error': error
+            }, synchronize_session=False)
+        session.commit()
+        self.stats['failed' if failed else 'retried'] += 1
+        log.warning('job %s failed (attempt %s of %s)\n%s', job_id, attempts, self.max_attempts, error)
+
+    def work(self, stop=None, burst=False):
+        """Run jobs until stop (a threading.Event) is set, or with burst until none is due."""
+        while stop is None or not stop.is_set():
+            with self.app.app_context():
+                try:
+                    ran = self.run_one()
+                finally:
+                    self.db.session.remove()
+            if not ran:
+                if burst:
+                    return
+                self._wake.wait(self.poll)
+                self._wake.clear()
+
+    def schedule(self):
+        """Queue the first run of every periodic job not already waiting."""
+        if not self.periodic:
+            return
+        with self.app.app_context():
+            try:
+                for name in self.periodic:
+                    self.enqueue(name, key=name)
+                self.db.session.commit()
+            finally:
+                self.db.session.remove()
+
+    def start(self, threads, stop=None, burst=False):
+        """Run workers in daemon threads of this process; returns the threads."""
+        self.schedule()
+        started = [threading.Thread(target=self.work, args=(stop, burst), name='job-worker-{}'.format(i), daemon=True)
+                   for i in range(threads)]
+        for thread in started:
+            thread.start()
+        self._threads.extend(started)
+        return started
+
+    def counts(self):
+        # {'queued': n, 'failed': n}
+        return dict(self.db.session.query(self.model.status, self.db.func.count(self.model.id))
+                    .group_by(self.model.status).all())
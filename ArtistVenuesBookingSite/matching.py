@@ -0,0 +1,291 @@
+from datetime import datetime
+
+from sqlalchemy import func
+
+# Recommended matches between seeking artists and seeking venues.
+#
+# A pair is scored on three signals, and only pairs that share a genre are scored at all:
+#   genres    Jaccard similarity of the two genre sets                     (weight 0.6)
+#   location  1 in the same city, 0.5 in the same state                    (weight 0.25)
+#   history   shows the artist has booked at the venue, capped at 3        (weight 0.15)
+# Scores are computed in blocks of rows: the genre sets are sparse 0/1 matrices (artists x
+# genres, venues x genres), so one sparse product gives the genre intersections of a block of
+# artists against every venue. The best K matches of every artist and of every venue are kept
+# in the Matches table, where a detail page reads its list with one indexed query.
+#
+# refresh() replays the change log since the previous run and recomputes only the lists a
+# change can reach: the lists of the changed artists and venues, the lists naming them, and
+# the lists they now score high enough to enter. Show deletes and bulk show imports, which the
+# log does not tie to an artist and venue, fall back to a full rebuild. Needs NumPy and SciPy,
+# imported by the refresh only; the views just read the table.
+
+WEIGHTS = {'genres': 0.6, 'location': 0.25, 'history': 0.15}
+HISTORY_CAP = 3
+# upper bound on one block of scores (rows x columns)
+BLOCK_CELLS = 4000000
+# past this share of changed artists or venues, a full rebuild is cheaper than the bookkeeping
+REBUILD_SHARE = 0.2
+IN_CHUNK = 1000
+
+
+def _chunks(items, size=IN_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Side(object):
+    """The seeking artists or venues: ids, sparse genre matrix and location codes, by position."""
+
+    def __init__(self, ids, genres, states, cities):
+        import numpy as np
+
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.position = {owner_id: i for i, owner_id in enumerate(ids)}
+        self.genres = genres
+        self.sizes = np.asarray(genres.sum(axis=1), dtype=np.float32).ravel()
+        self.states = np.asarray(states, dtype=np.int64)
+        self.cities = np.asarray(cities, dtype=np.int64)
+
+
+class Matcher(object):
+
+    def __init__(self, db, match_model, watermark_model, change_model, show_model, sides, k=10):
+        # sides: {'artist': (Artist, Artist.seeking_venue, artist_genre_table),
+        #         'venue': (Venue, Venue.seeking_talent, venue_genre_table)}
+        self.db = db
+        self.match = match_model
+        self.watermark = watermark_model
+        self.change = change_model
+        self.show = show_model
+        self.sides = sides
+        self.k = k
+
+    @staticmethod
+    def other(side):
+        return 'venue' if side == 'artist' else 'artist'
+
+    # reading
+
+    def statement(self, side, owner_id, model):
+        """SELECT of the owner's matches joined to model (the other side), best first."""
+        other_key = getattr(self.match, self.other(side) + '_id')
+        return self.db.select(model.id, model.name, model.city, model.state, model.image_link, self.match.score) \
+            .join(model, model.id == other_key) \
+            .where(self.match.owner == side, getattr(self.match, side + '_id') == owner_id) \
+            .order_by(self.match.rank)
+
+    # loading
+
+    def _load(self):
+        import numpy as np
+        from scipy import sparse
+
+        session = self.db.session
+        locations = {}
+        loaded = {}
+        genre_count = max(session.query(func.max(genre_table.c.genre_id)).scalar() or 0
+                          for _, _, genre_table in self.sides.values()) + 1
+        for side, (model, seeking, genre_table) in self.sides.items():
+            rows = session.query(model.id, model.state, model.city).filter(seeking.is_(True)).order_by(model.id).all()
+            ids = [row.id for row in rows]
+            position = {owner_id: i for i, owner_id in enumerate(ids)}
+            owner_column = getattr(genre_table.c, side + '_id')
+            links = session.query(owner_column, genre_table.c.genre_id) \
+                .join(model, model.id == owner_column).filter(seeking.is_(True)).all()
+            genres = sparse.csr_matrix(
+                (np.ones(len(links), dtype=np.float32),
+                 ([position[owner_id] for owner_id, _ in links], [genre_id for _, genre_id in links])),
+                shape=(len(ids), genre_count))
+            # the same state (or city) gets the same code on both sides; a missing one never matches
+            missing = -1 if side == 'artist' else -2
+            states = [locations.setdefault(row.state, len(locations)) if row.state else missing for row in rows]
+            cities = [locations.setdefault((row.state, row.city), len(locations)) if row.state and row.city
+                      else missing for row in rows]
+            loaded[side] = Side(ids, genres, states, cities)
+        return loaded
+
+    def _history(self, side, owner_ids, others):
+        # (len(owner_ids), len(others)) matrix of shows booked between each owner and each other
+        import numpy as np
+
+        played = np.zeros((len(owner_ids), len(others.ids)), dtype=np.float32)
+        owner_column = getattr(self.show, side + '_id')
+        other_column = getattr(self.show, self.other(side) + '_id')
+        row_of = {owner_id: i for i, owner_id in enumerate(owner_ids)}
+        for chunk in _chunks(owner_ids):
+            counts = self.db.session.query(owner_column, other_column, func.count(self.show.id)) \
+                .filter(owner_column.in_(chunk)).group_by(owner_column, other_column)
+            for owner_id, other_id, count in counts:
+                if other_id in others.position:
+                    played[row_of[owner_id], others.position[other_id]] = count
+        return played
+
+    def _scores(self, side, loaded, positions):
+        """Scores of the owners at positions against every seeking entity of the other side."""
+        import numpy as np
+
+        rows, others = loaded[side], loaded[self.other(side)]
+        shared = (rows.genres[positions] @ others.genres.T).toarray()
+        union = rows.sizes[positions, None] + others.sizes[None, :] - shared
+        jaccard = np.divide(shared, union, out=np.zeros_like(shared), where=shared > 0)
+        location = np.where(rows.cities[positions, None] == others.cities[None, :], 1.0,
+                            np.where(rows.states[positions, None] == others.states[None, :], 0.5, 0.0))
+        played = self._history(side, rows.ids[positions].tolist(), others)
+        history = np.minimum(played, HISTORY_CAP) / HISTORY_CAP
+        scores = WEIGHTS['genres'] * jaccard + WEIGHTS['location'] * location + WEIGHTS['history'] * history
+        scores[shared == 0] = 0
+        return scores
+
+    def _blocks(self, side, loaded, positions):
+        # (positions, scores) in blocks of at most BLOCK_CELLS scores
+        size = max(1, BLOCK_CELLS // max(1, len(loaded[self.other(side)].ids)))
+        for block in _chunks(positions, size):
+            yield block, self._scores(side, loaded, block)
+
+    def _top(self, scores):
+        # per row: [(column, score)] of the k best positive scores, best first
+        import numpy as np
+
+        k = min(self.k, scores.shape[1])
+        if not k:
+            return [[] for _ in range(scores.shape[0])]
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        tops = []
+        for row, columns in zip(scores, best):
+            columns = columns[np.argsort(-row[columns], kind='stable')]
+            tops.append([(column, row[column]) for column in columns if row[column] > 0])
+        return tops
+
+    # writing
+
+    def _delete(self, side, owner_ids=None):
+        table = self.match.__table__
+        if owner_ids is None:
+            self.db.session.execute(table.delete().where(table.c.owner == side))
+            return
+        owner_column = getattr(table.c, side + '_id')
+        for chunk in _chunks(owner_ids):
+            self.db.session.execute(table.delete().where(table.c.owner == side, owner_column.in_(chunk)))
+
+    def _write(self, side, loaded, owner_ids):
+        # recompute and insert the lists of owner_ids that are still seeking
+        rows, others = loaded[side], loaded[self.other(side)]
+        positions = sorted(rows.position[owner_id] for owner_id in owner_ids if owner_id in rows.position)
+        other_key = self.other(side) + '_id'
+        for block, scores in self._blocks(side, loaded, positions):
+            matches = []
+            for position, top in zip(block, self._top(scores)):
+                for rank, (column, score) in enumerate(top, 1):
+                    matches.append({'owner': side, side + '_id': int(rows.ids[position]),
+                                    other_key: int(others.ids[column]), 'rank': rank, 'score': float(score)})
+            if matches:
+                self.db.session.execute(self.match.__table__.insert(), matches)
+
+    # refreshing
+
+    def _watermark(self):
+        query = self.db.session.query(self.watermark).filter(self.watermark.id == 1)
+        if self.db.engine.dialect.name == 'postgresql':
+            # one refresh at a time
+            query = query.with_for_update()
+        watermark = query.one_or_none()
+        if watermark is None:
+            watermark = self.watermark(id=1, change_id=0)
+            self.db.session.add(watermark)
+            self.db.session.flush()
+        return watermark
+
+    def _changed(self, after, upto):
+        """({'artist': ids, 'venue': ids} changed in (after, upto]), or None if a rebuild is needed."""
+        changed = {'artist': set(), 'venue': set()}
+        tables = {model.__tablename__: side for side, (model, _, _) in self.sides.items()}
+        show_ids = []
+        rows = self.db.session.query(self.change.table_name, self.change.row_id, self.change.op) \
+            .filter(self.change.id > after, self.change.id <= upto,
+                    self.change.table_name.in_(list(tables) + [self.show.__tablename__]))
+        for table_name, row_id, op in rows:
+            if op == 'counts':
+                continue  # show counters rolled; scores do not use them
+            if table_name in tables:
+                changed[tables[table_name]].add(row_id)
+            elif row_id is None or op != 'insert':
+                return None
+            else:
+                show_ids.append(row_id)
+        for chunk in _chunks(show_ids):
+            found = self.db.session.query(self.show.artist_id, self.show.venue_id).filter(self.show.id.in_(chunk)).all()
+            if len(found) < len(set(chunk)):
+                return None
+            for artist_id, venue_id in found:
+                changed['artist'].add(artist_id)
+                changed['venue'].add(venue_id)
+        return changed
+
+    def _listing(self, side, other_ids):
+        # owners on side whose lists name one of other_ids
+        table = self.match.__table__
+        owner_column, other_column = getattr(table.c, side + '_id'), getattr(table.c, self.other(side) + '_id')
+        owners = set()
+        for chunk in _chunks(other_ids):
+            rows = self.db.session.execute(self.db.select(owner_column).distinct()
+                                           .where(table.c.owner == side, other_column.in_(chunk)))
+            owners.update(owner_id for (owner_id,) in rows)
+        return owners
+
+    def _entering(self, side, loaded, changed_ids):
+        # owners on the other side whose lists one of changed_ids (on side) now scores into
+        import numpy as np
+
+        rows, others = loaded[side], loaded[self.other(side)]
+        best = np.zeros(len(others.ids), dtype=np.float32)
+        positions = sorted(rows.position[owner_id] for owner_id in changed_ids if owner_id in rows.position)
+        for _, scores in self._blocks(side, loaded, positions):
+            best = np.maximum(best, scores.max(axis=0))
+        candidates = {int(others.ids[column]): best[column] for column in np.flatnonzero(best > 0)}
+        table = self.match.__table__
+        owner_column = getattr(table.c, self.other(side) + '_id')
+        entering = set()
+        for chunk in _chunks(candidates):
+            lists = dict((owner_id, (count, lowest)) for owner_id, count, lowest in self.db.session.execute(
+                self.db.select(owner_column, func.count(), func.min(table.c.score))
+                .where(table.c.owner == self.other(side), owner_column.in_(chunk)).group_by(owner_column)))
+            for owner_id in chunk:
+                count, lowest = lists.get(owner_id, (0, 0))
+                if count < self.k or candidates[owner_id] > lowest:
+                    entering.add(owner_id)
+        return entering
+
+    def rebuild(self, loaded=None):
+        """Recompute every list; the caller commits."""
+        loaded = loaded or self._load()
+        for side in self.sides:
+            self._delete(side)
+            self._write(side, loaded, loaded[side].ids.tolist())
+
+    def refresh(self, rebuild=False):
+        """Bring the Matches table up to date with the change log; the caller commits.
+
+        Returns {'artist': ids, 'venue': ids} of the owners whose lists were recomputed.
+        """
+        watermark = self._watermark()
+        latest = self.db.session.query(func.max(self.change.id)).scalar() or 0
+        loaded = self._load()
+        changed = None if rebuild or not watermark.change_id else self._changed(watermark.change_id, latest)
+        if changed is not None and any(len(changed[side]) > REBUILD_SHARE * max(1, len(loaded[side].ids))
+                                       for side in self.sides):
+            changed = None
+        if changed is None:
+            self.rebuild(loaded)
+            affected = {side: loaded[side].ids.tolist() for side in self.sides}
+        else:
+            affected = {side: set(ids) for side, ids in changed.items()}
+            for side, ids in changed.items():
+                other = self.other(side)
+                affected[other] |= self._listing(other, ids) | self._entering(side, loaded, ids)
+            for side, owner_ids in affected.items():
+                self._delete(side, owner_ids)
+                self._write(side, loaded, owner_ids)
+        watermark.change_id = latest
+        watermark.refreshed_at = datetime.now()
+        return affected
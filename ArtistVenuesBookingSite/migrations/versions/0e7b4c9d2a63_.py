@@ -0,0 +1,29 @@
+"""change log lock row
+
+Revision ID: 0e7b4c9d2a63
+Revises: d5f3a9c27e18
+Create Date: 2026-10-18 19:40:08.552190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0e7b4c9d2a63'
+down_revision = 'd5f3a9c27e18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    lock = op.create_table('ChangeLock',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(lock, [{'id': 1, 'locked_at': None}])
+
+
+def downgrade():
+    op.drop_table('ChangeLock')
@@ -0,0 +1,37 @@
+"""keyset pagination indexes
+
+Revision ID: 3f1c9a2d8b47
+Revises: 7692f3b16ba3
+Create Date: 2026-10-18 12:55:02.311406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a2d8b47'
+down_revision = '7692f3b16ba3'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_Shows_start_time_id', 'Shows', ['start_time', 'id']),
+    ('ix_Artist_name_id', 'Artist', ['name', 'id']),
+    ('ix_Venue_state_city_name_id', 'Venue', ['state', 'city', 'name', 'id'])
+]
+
+
+def upgrade():
+    # built CONCURRENTLY, outside a transaction, so the live tables keep taking writes
+    # (see b7e2c94f0d13)
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,30 @@
+"""drop the change log lock row
+
+Revision ID: 4c8e1b7d3f25
+Revises: 0e7b4c9d2a63
+Create Date: 2026-10-18 21:05:31.840127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c8e1b7d3f25'
+down_revision = '0e7b4c9d2a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the change log takes an advisory lock at commit instead (changes.py)
+    op.drop_table('ChangeLock')
+
+
+def downgrade():
+    lock = op.create_table('ChangeLock',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(lock, [{'id': 1, 'locked_at': None}])
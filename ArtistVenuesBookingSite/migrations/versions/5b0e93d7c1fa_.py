@@ -0,0 +1,57 @@
+"""show end times and booking conflict constraints
+
+Revision ID: 5b0e93d7c1fa
+Revises: c2d7e5b19a60
+Create Date: 2026-10-18 14:12:36.702915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b0e93d7c1fa'
+down_revision = 'c2d7e5b19a60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing shows get the default SHOW_DURATION_MINUTES length
+    op.add_column('Shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute('UPDATE "Shows" SET end_time = start_time + interval \'120 minutes\'')
+    op.alter_column('Shows', 'end_time', nullable=False)
+    # booking.MAX_SHOW_DURATION: conflict lookups rely on it to bound their range scans
+    op.create_check_constraint('ck_Shows_duration', 'Shows',
+                               "end_time > start_time AND end_time <= start_time + interval '24 hours'")
+
+    # built CONCURRENTLY, outside a transaction, so Shows keeps taking writes (see b7e2c94f0d13)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Shows_venue_id_start_time', 'Shows', ['venue_id', 'start_time'], unique=False,
+                        postgresql_concurrently=True)
+        op.create_index('ix_Shows_artist_id_start_time', 'Shows', ['artist_id', 'start_time'], unique=False,
+                        postgresql_concurrently=True)
+
+    # A venue or an artist cannot be booked twice at overlapping times. Creating these fails
+    # if the existing data already has overlapping bookings; resolve those first. An
+    # exclusion constraint cannot be built concurrently: Shows is locked while its GiST
+    # indexes are built.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute('''
+        ALTER TABLE "Shows" ADD CONSTRAINT "ex_Shows_venue_overlap"
+        EXCLUDE USING gist (venue_id WITH =, tsrange(start_time, end_time) WITH &&)
+    ''')
+    op.execute('''
+        ALTER TABLE "Shows" ADD CONSTRAINT "ex_Shows_artist_overlap"
+        EXCLUDE USING gist (artist_id WITH =, tsrange(start_time, end_time) WITH &&)
+    ''')
+
+
+def downgrade():
+    op.drop_constraint('ex_Shows_artist_overlap', 'Shows')
+    op.drop_constraint('ex_Shows_venue_overlap', 'Shows')
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_Shows_artist_id_start_time', table_name='Shows', postgresql_concurrently=True)
+        op.drop_index('ix_Shows_venue_id_start_time', table_name='Shows', postgresql_concurrently=True)
+    op.drop_constraint('ck_Shows_duration', 'Shows')
+    op.drop_column('Shows', 'end_time')
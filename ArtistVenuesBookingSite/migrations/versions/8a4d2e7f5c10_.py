@@ -0,0 +1,41 @@
+"""background job queue
+
+Revision ID: 8a4d2e7f5c10
+Revises: c6e1f08b4a29
+Create Date: 2026-10-18 17:58:21.736402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4d2e7f5c10'
+down_revision = 'c6e1f08b4a29'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Jobs',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('key', sa.String(length=120), nullable=True),
+    sa.Column('args', sa.JSON(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_Jobs_status_run_at', 'Jobs', ['status', 'run_at'], unique=False)
+    op.create_index('ix_Jobs_key', 'Jobs', ['key'], unique=True,
+                    postgresql_where=sa.text("status = 'queued' AND locked_at IS NULL"))
+
+
+def downgrade():
+    op.drop_index('ix_Jobs_key', table_name='Jobs')
+    op.drop_index('ix_Jobs_status_run_at', table_name='Jobs')
+    op.drop_table('Jobs')
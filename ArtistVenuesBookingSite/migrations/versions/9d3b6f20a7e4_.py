@@ -0,0 +1,43 @@
+"""upcoming and past show counters on venues and artists
+
+Revision ID: 9d3b6f20a7e4
+Revises: e41a7c3d9b02
+Create Date: 2026-10-18 15:47:12.530184
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3b6f20a7e4'
+down_revision = 'e41a7c3d9b02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('CounterWatermark',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # count existing shows against the watermark they start from
+    op.execute('INSERT INTO "CounterWatermark" (id, rolled_at) VALUES (1, LOCALTIMESTAMP)')
+    for table, key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute(
+            'UPDATE "{table}" SET '
+            'upcoming_shows_count = (SELECT count(*) FROM "Shows" s WHERE s.{key} = "{table}".id '
+            'AND s.start_time > (SELECT rolled_at FROM "CounterWatermark")), '
+            'past_shows_count = (SELECT count(*) FROM "Shows" s WHERE s.{key} = "{table}".id '
+            'AND s.start_time <= (SELECT rolled_at FROM "CounterWatermark"))'.format(table=table, key=key))
+
+
+def downgrade():
+    op.drop_table('CounterWatermark')
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
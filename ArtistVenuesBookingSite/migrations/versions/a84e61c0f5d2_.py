@@ -0,0 +1,57 @@
+"""full-text search vectors for venues and artists
+
+Revision ID: a84e61c0f5d2
+Revises: 3f1c9a2d8b47
+Create Date: 2026-10-18 13:20:47.529013
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a84e61c0f5d2'
+down_revision = '3f1c9a2d8b47'
+branch_labels = None
+depends_on = None
+
+
+# Same weighting as search.document_parts(): name A, city/state B, genre names C
+BACKFILL = '''
+UPDATE "{table}" AS e SET search_vector =
+    setweight(to_tsvector('simple', coalesce(e.name, '')), 'A') ||
+    setweight(to_tsvector('simple', concat_ws(' ', e.city, e.state)), 'B') ||
+    setweight(to_tsvector('simple', coalesce((
+        SELECT string_agg(g.name, ' ')
+        FROM {genre_table} AS link JOIN "Genre" AS g ON g.id = link.genre_id
+        WHERE link.{fk} = e.id
+    ), '')), 'C')
+'''
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, genre_table, fk in (('Venue', 'venue_genre_table', 'venue_id'),
+                                   ('Artist', 'artist_genre_table', 'artist_id')):
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+        op.execute(BACKFILL.format(table=table, genre_table=genre_table, fk=fk))
+    # built CONCURRENTLY, outside a transaction, so the tables keep taking writes (see
+    # b7e2c94f0d13)
+    with op.get_context().autocommit_block():
+        for table in ('Venue', 'Artist'):
+            op.create_index('ix_{}_search_vector'.format(table), table, ['search_vector'], unique=False,
+                            postgresql_using='gin', postgresql_concurrently=True)
+            # backs the optional SEARCH_TRIGRAM similarity match on names
+            op.create_index('ix_{}_name_trgm'.format(table), table, ['name'], unique=False,
+                            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'},
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in ('Artist', 'Venue'):
+            op.drop_index('ix_{}_name_trgm'.format(table), table_name=table, postgresql_concurrently=True)
+            op.drop_index('ix_{}_search_vector'.format(table), table_name=table, postgresql_concurrently=True)
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'search_vector')
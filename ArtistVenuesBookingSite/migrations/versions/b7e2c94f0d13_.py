@@ -0,0 +1,37 @@
+"""indexes for genre lookups by artist / venue and the artist area filter
+
+Revision ID: b7e2c94f0d13
+Revises: 9d3b6f20a7e4
+Create Date: 2026-10-18 16:21:09.144537
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c94f0d13'
+down_revision = '9d3b6f20a7e4'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_artist_genre_table_artist_id_genre_id', 'artist_genre_table', ['artist_id', 'genre_id']),
+    ('ix_venue_genre_table_venue_id_genre_id', 'venue_genre_table', ['venue_id', 'genre_id']),
+    ('ix_Artist_state_city_id', 'Artist', ['state', 'city', 'id'])
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY does not block writes, so this can run against a live
+    # database; it cannot run inside a transaction. A failed build leaves an INVALID
+    # index behind: drop it and run the upgrade again.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,44 @@
+"""unique genre names
+
+Revision ID: c2d7e5b19a60
+Revises: a84e61c0f5d2
+Create Date: 2026-10-18 13:41:09.184522
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2d7e5b19a60'
+down_revision = 'a84e61c0f5d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fold duplicate genres (created by concurrent submissions) into the lowest id first
+    op.execute('''
+        CREATE TEMPORARY TABLE genre_dupes ON COMMIT DROP AS
+        SELECT g.id, keep.id AS keep_id
+        FROM "Genre" AS g
+        JOIN (SELECT name, min(id) AS id FROM "Genre" GROUP BY name) AS keep
+          ON keep.name = g.name AND keep.id <> g.id
+    ''')
+    for table, fk in (('venue_genre_table', 'venue_id'), ('artist_genre_table', 'artist_id')):
+        # drop links that would collide with an existing link to the kept genre, then repoint
+        op.execute('''
+            DELETE FROM {table} AS link USING genre_dupes AS d
+            WHERE link.genre_id = d.id AND EXISTS (
+                SELECT 1 FROM {table} AS other WHERE other.genre_id = d.keep_id AND other.{fk} = link.{fk}
+            )
+        '''.format(table=table, fk=fk))
+        op.execute('''
+            UPDATE {table} AS link SET genre_id = d.keep_id FROM genre_dupes AS d WHERE link.genre_id = d.id
+        '''.format(table=table))
+    op.execute('DELETE FROM "Genre" AS g USING genre_dupes AS d WHERE g.id = d.id')
+    op.create_index('ix_Genre_name', 'Genre', ['name'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_Genre_name', table_name='Genre')
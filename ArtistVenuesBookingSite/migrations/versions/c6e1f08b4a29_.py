@@ -0,0 +1,46 @@
+"""precomputed artist / venue matches
+
+Revision ID: c6e1f08b4a29
+Revises: f2a8d5c61e37
+Create Date: 2026-10-18 17:32:05.284913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6e1f08b4a29'
+down_revision = 'f2a8d5c61e37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Matches',
+    sa.Column('owner', sa.String(length=6), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('owner', 'artist_id', 'venue_id')
+    )
+    op.create_index('ix_Matches_owner_artist_id_rank', 'Matches', ['owner', 'artist_id', 'rank'], unique=False)
+    op.create_index('ix_Matches_owner_venue_id_rank', 'Matches', ['owner', 'venue_id', 'rank'], unique=False)
+    op.create_table('MatchWatermark',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('change_id', sa.BigInteger(), nullable=False),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # change_id 0: the first `flask refresh-matches` fills the table
+    op.execute('INSERT INTO "MatchWatermark" (id, change_id) VALUES (1, 0)')
+
+
+def downgrade():
+    op.drop_table('MatchWatermark')
+    op.drop_index('ix_Matches_owner_venue_id_rank', table_name='Matches')
+    op.drop_index('ix_Matches_owner_artist_id_rank', table_name='Matches')
+    op.drop_table('Matches')
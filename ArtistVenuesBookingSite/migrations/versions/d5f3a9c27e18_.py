@@ -0,0 +1,35 @@
+"""listing indexes on coalesced sort keys
+
+Revision ID: d5f3a9c27e18
+Revises: 8a4d2e7f5c10
+Create Date: 2026-10-18 19:12:47.318265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f3a9c27e18'
+down_revision = '8a4d2e7f5c10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # built CONCURRENTLY, outside a transaction, so the live tables keep taking writes
+    # (see b7e2c94f0d13)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Venue_listing', 'Venue', [sa.text("coalesce(state, '')"), sa.text("coalesce(city, '')"),
+                                                      sa.text("coalesce(name, '')"), 'id'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_Artist_listing', 'Artist', [sa.text("coalesce(name, '')"), 'id'],
+                        unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_Artist_name_id', table_name='Artist', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_Artist_listing', table_name='Artist', postgresql_concurrently=True)
+        op.drop_index('ix_Venue_listing', table_name='Venue', postgresql_concurrently=True)
@@ -0,0 +1,33 @@
+"""change log for venues, artists and shows
+
+Revision ID: e41a7c3d9b02
+Revises: 5b0e93d7c1fa
+Create Date: 2026-10-18 15:03:51.218406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41a7c3d9b02'
+down_revision = '5b0e93d7c1fa'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Changes',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('table_name', sa.String(length=40), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=True),
+    sa.Column('op', sa.String(length=10), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_Changes_table_name_id', 'Changes', ['table_name', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Changes_table_name_id', table_name='Changes')
+    op.drop_table('Changes')
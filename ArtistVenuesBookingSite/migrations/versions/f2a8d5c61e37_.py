@@ -0,0 +1,38 @@
+"""areas of the venue directory with their venue counts
+
+Revision ID: f2a8d5c61e37
+Revises: b7e2c94f0d13
+Create Date: 2026-10-18 16:58:40.611820
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a8d5c61e37'
+down_revision = 'b7e2c94f0d13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Area',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('venue_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_Area_state_city', 'Area', ['state', 'city'], unique=True)
+    op.execute('''
+        INSERT INTO "Area" (state, city, venue_count)
+        SELECT state, city, count(*) FROM "Venue"
+        WHERE state IS NOT NULL AND city IS NOT NULL
+        GROUP BY state, city
+    ''')
+
+
+def downgrade():
+    op.drop_index('ix_Area_state_city', table_name='Area')
+    op.drop_table('Area')
@@ -0,0 +1,174 @@
+import base64
+import json
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from sqlalchemy import String, func, literal_column, tuple_
+from werkzeug.exceptions import BadRequest
+
+# Listings are paginated with keyset (seek) cursors instead of OFFSET, so the
+# cost of fetching a page does not grow with how deep into the listing it is.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# the listing filters page links carry over. Only these: the links are built with url_for,
+# which would take other keys (endpoint, _external, ...) as its own arguments
+LINK_ARGS = ('state', 'city', 'genre', 'match')
+
+
+def page_size(args):
+    # per_page from the query string, clamped to [1, MAX_PAGE_SIZE]
+    try:
+        size = int(args.get('per_page', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        size = DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def sort_key(column):
+    """column as the listings sort it: a nullable text column is read as coalesce(column, '').
+
+    A NULL would make the row-value comparison with a cursor unknown, so every row after a
+    cursor holding one would be unreachable; '' sorts NULLs first, like read_model's key().
+    The '' is a literal so that the expression indexes on these keys match.
+    """
+    expression = getattr(column, 'expression', column)
+    if isinstance(expression.type, String) and getattr(expression, 'nullable', False):
+        return func.coalesce(column, literal_column("''"))
+    return column
+
+
+class BadCursor(BadRequest):
+    """An after / before cursor the listing did not hand out; answered with a 400."""
+    description = 'The page cursor is not valid for this listing.'
+
+
+def encode_cursor(values):
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(token, columns):
+    # Returns the key values for the given sort columns, or None without a token. Raises
+    # BadCursor if the token is malformed or a value is not of its column's type, which
+    # would otherwise only fail in the database.
+    if not token:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        raise BadCursor()
+    if not isinstance(payload, list) or len(payload) != len(columns):
+        raise BadCursor()
+    try:
+        return [_cursor_value(column, value) for column, value in zip(columns, payload)]
+    except (TypeError, ValueError):
+        raise BadCursor()
+
+
+def _cursor_value(column, value):
+    # a JSON cursor value as the column's Python type
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if isinstance(value, bool) is not (python_type is bool) or not isinstance(value, python_type):
+        raise TypeError('{!r} is not a {} value'.format(value, python_type.__name__))
+    return value
+
+
+def keyset_page(query, columns, args, fixed=0):
+    """Fetch one page of query ordered by columns, which must end in a unique column.
+
+    The first `fixed` columns are held to one value by the query's filters (a drilled-down
+    area) and are left out of the ORDER BY, which SQLite could otherwise not read in index
+    order.
+
+    args is the request's query string: `after` / `before` hold the cursor of the page
+    boundary and `per_page` the page size. The returned dict carries the page's items
+    and the `next` / `prev` cursors (None at either end of the listing), plus the
+    query string `args` (the LINK_ARGS filters) that page links must carry over.
+    """
+    per_page = page_size(args)
+    after = decode_cursor(args.get('after'), columns)
+    before = decode_cursor(args.get('before'), columns) if after is None else None
+    keys = [sort_key(column) for column in columns]
+    coalesced = [key is not column for key, column in zip(keys, columns)]
+    key = tuple_(*keys)
+
+    def filled(values):
+        # key values as the sort keys see them
+        return ['' if value is None and null else value for value, null in zip(values, coalesced)]
+
+    if before is not None:
+        # walk backwards from the cursor, then restore ascending order
+        rows = query.filter(key < tuple_(*filled(before))) \
+            .order_by(*[key.desc() for key in keys[fixed:]]) \
+            .limit(per_page + 1).all()
+        has_prev, has_next = len(rows) > per_page, True
+        rows = rows[:per_page][::-1]
+    else:
+        if after is not None:
+            query = query.filter(key > tuple_(*filled(after)))
+        rows = query.order_by(*keys[fixed:]).limit(per_page + 1).all()
+        has_prev, has_next = after is not None, len(rows) > per_page
+        rows = rows[:per_page]
+
+    def cursor(row):
+        return encode_cursor(filled([getattr(row, column.key) for column in columns]))
+
+    return _page(rows, per_page, has_prev, has_next, cursor, args)
+
+
+def sorted_page(keys, columns, args, lo=0, hi=None, keep=None):
+    """keyset_page over keys[lo:hi], an in-memory sorted list of key tuples for columns.
+
+    The items are key tuples; cursors are interchangeable with keyset_page's where the keys
+    hold the column values. keep, if given, filters the keys (walked in order until the
+    page is full).
+    """
+    per_page = page_size(args)
+    hi = len(keys) if hi is None else hi
+    after = decode_cursor(args.get('after'), columns)
+    before = decode_cursor(args.get('before'), columns) if after is None else None
+    try:
+        start = bisect_left(keys, tuple(before), lo, hi) if before is not None else \
+            bisect_right(keys, tuple(after), lo, hi) if after is not None else lo
+    except TypeError:
+        # a cursor whose values do not compare with the keys: start over
+        after = before = None
+        start = lo
+
+    if before is not None:
+        rows = _walk(keys, range(start - 1, lo - 1, -1), keep, per_page + 1)
+        has_prev, has_next = len(rows) > per_page, True
+        rows = rows[:per_page][::-1]
+    else:
+        rows = _walk(keys, range(start, hi), keep, per_page + 1)
+        has_prev, has_next = after is not None, len(rows) > per_page
+        rows = rows[:per_page]
+    return _page(rows, per_page, has_prev, has_next, lambda key: encode_cursor(list(key)), args)
+
+
+def _walk(keys, positions, keep, count):
+    # up to count keys at positions that keep accepts
+    rows = []
+    for i in positions:
+        if keep is None or keep(keys[i]):
+            rows.append(keys[i])
+            if len(rows) == count:
+                break
+    return rows
+
+
+def _page(rows, per_page, has_prev, has_next, cursor, args):
+    # repeated query args (?genre=a&genre=b) are carried over as lists
+    lists = args.lists() if hasattr(args, 'lists') else ((key, [value]) for key, value in args.items())
+    return {
+        "items": rows,
+        "per_page": per_page,
+        "next": cursor(rows[-1]) if rows and has_next else None,
+        "prev": cursor(rows[0]) if rows and has_prev else None,
+        "args": {key: values if len(values) > 1 else values[0] for key, values in lists
+                 if key in LINK_ARGS}
+    }
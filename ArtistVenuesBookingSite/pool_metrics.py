@@ -0,0 +1,93 @@
+import threading
+import time
+
+from sqlalchemy import event, exc
+
+# Connection pool metrics: how long requests wait for a connection, how many are checked out,
+# and how often the pool has to go past pool_size (overflow) or gives up (timeout).
+
+
+class PoolMetrics(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = set()
+        self.checkouts = 0
+        self.checkout_seconds = 0.0
+        self.checkout_max_seconds = 0.0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.in_use = 0
+
+    def instrument(self, engine):
+        """Attach to engine's pool; calling it again for the same pool does nothing."""
+        pool = engine.pool
+        if id(pool) in self._pools:
+            return
+        with self._lock:
+            if id(pool) in self._pools:
+                return
+            self._pools.add(id(pool))
+            self.pool = pool
+        connect = pool.connect
+
+        def timed_connect(*args, **kwargs):
+            # pool.connect() blocks while the pool is exhausted, so its duration is the wait
+            started = time.perf_counter()
+            try:
+                return connect(*args, **kwargs)
+            except exc.TimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.checkout_seconds += elapsed
+                    self.checkout_max_seconds = max(self.checkout_max_seconds, elapsed)
+
+        pool.connect = timed_connect
+        event.listen(pool, 'connect', self._on_connect)
+        event.listen(pool, 'checkout', self._on_checkout)
+        event.listen(pool, 'checkin', self._on_checkin)
+        event.listen(pool, 'invalidate', self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        overflow = getattr(self.pool, 'overflow', None)
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            if overflow is not None and overflow() > 0:
+                self.overflow_events += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        pool = getattr(self, 'pool', None)
+        with self._lock:
+            return {
+                'pool_class': type(pool).__name__ if pool is not None else None,
+                'pool_size': pool.size() if hasattr(pool, 'size') else None,
+                'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else self.in_use,
+                'overflow': pool.overflow() if hasattr(pool, 'overflow') else None,
+                'checkouts': self.checkouts,
+                'checkout_seconds_total': round(self.checkout_seconds, 6),
+                'checkout_seconds_avg': round(self.checkout_seconds / self.checkouts, 6) if self.checkouts else 0.0,
+                'checkout_seconds_max': round(self.checkout_max_seconds, 6),
+                'overflow_events': self.overflow_events,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,206 @@
+import sys
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+
+from changes import ChangeFollower
+from pagination import sorted_page
+from search import SearchIndex, document_parts
+
+# Optional in-process copy of the catalog (READ_MODEL=1) that the venue / artist listings and
+# searches are served from without a query.
+#
+# Each venue and artist is a small __slots__ record; the listing order is a sorted list of key
+# tuples (paged with bisect, like the keyset cursors of the SQL listings) and each model has a
+# SearchIndex. The copy is loaded on first use and kept current from the change log: at most
+# every READ_MODEL_REFRESH_SECONDS, and straight after this process commits a write, the
+# changes past the last one seen are read with one indexed query and only the rows they name
+# are reloaded. Bulk imports (logged without row ids) reload everything. Every process keeps
+# its own copy; the change log keeps them, and `flask` commands, in step.
+
+LAST = '\U0010ffff'  # sorts after any real city / name, to bound a key prefix
+IN_CHUNK = 1000
+
+
+class VenueRecord(object):
+    __slots__ = ('id', 'name', 'city', 'state', 'num_upcoming_shows', 'genre_ids')
+
+    def __init__(self, id, name, city, state, num_upcoming_shows, genre_ids=()):
+        self.id = id
+        self.name = name
+        # few distinct values, shared between records
+        self.city = sys.intern(city) if city else city
+        self.state = sys.intern(state) if state else state
+        self.num_upcoming_shows = num_upcoming_shows
+        self.genre_ids = genre_ids
+
+    def key(self):
+        # listing order: state, city, name, id
+        return self.state or '', self.city or '', self.name or '', self.id
+
+
+class ArtistRecord(object):
+    __slots__ = ('id', 'name', 'city', 'state', 'genre_ids')
+
+    def __init__(self, id, name, city, state, genre_ids=()):
+        self.id = id
+        self.name = name
+        self.city = sys.intern(city) if city else city
+        self.state = sys.intern(state) if state else state
+        self.genre_ids = genre_ids
+
+    def key(self):
+        # listing order: name, id
+        return self.name or '', self.id
+
+
+class Collection(object):
+    """The records of one model by id, in listing order and in a search index."""
+
+    def __init__(self):
+        self.records = {}
+        self.order = []
+        self.index = SearchIndex()
+        self.areas = Counter()  # (state, city) -> records
+
+    def load(self, records, genre_names):
+        self.__init__()
+        for record in records:
+            self.records[record.id] = record
+            self._add(record, genre_names)
+        self.order.sort()
+
+    def _add(self, record, genre_names):
+        self.areas[(record.state, record.city)] += 1
+        self.index.add(record.id, document_parts(record.name, record.city, record.state,
+                                                 [genre_names.get(genre_id) for genre_id in record.genre_ids]))
+        self.order.append(record.key())
+
+    def put(self, record, genre_names):
+        self.discard(record.id)
+        self.records[record.id] = record
+        self._add(record, genre_names)
+        # keep order sorted: move the appended key into place
+        key = self.order.pop()
+        self.order.insert(bisect_left(self.order, key), key)
+
+    def discard(self, record_id):
+        record = self.records.pop(record_id, None)
+        if record is not None:
+            del self.order[bisect_left(self.order, record.key())]
+            self.areas[(record.state, record.city)] -= 1
+            if not self.areas[(record.state, record.city)]:
+                del self.areas[(record.state, record.city)]
+            self.index.remove(record_id)
+
+    def page(self, columns, args, prefix=(), keep=None):
+        """sorted_page of the records whose keys start with prefix; items are records."""
+        lo = bisect_left(self.order, prefix)
+        hi = bisect_right(self.order, prefix + (LAST,)) if prefix else len(self.order)
+        page = sorted_page(self.order, columns, args, lo, hi, keep and (lambda key: keep(key[-1])))
+        page['items'] = [self.records[key[-1]] for key in page['items']]
+        return page
+
+    def search(self, text):
+        # records matching text, best first (every record for an empty search)
+        scores = self.index.search(text) if text.strip() else dict.fromkeys(self.records, 0)
+        return [self.records[record_id] for record_id in sorted(scores, key=lambda i: (-scores[i], i))]
+
+
+class ReadModel(ChangeFollower):
+
+    def __init__(self, app, db, change_model, genre_model, show_model, venue, artist):
+        # venue: (Venue, venue_genre_table), artist: (Artist, artist_genre_table)
+        ChangeFollower.__init__(self, db, change_model, [venue[0].__tablename__, artist[0].__tablename__,
+                                                         show_model.__tablename__],
+                                app.config.get('READ_MODEL_REFRESH_SECONDS', 1))
+        self.genre = genre_model
+        self.show = show_model
+        self.models = {'venue': venue, 'artist': artist}
+        self.collections = {'venue': Collection(), 'artist': Collection()}
+        self.genre_names = {}
+        self.stats['rows_reloaded'] = 0
+
+    # loading
+
+    def _rows(self, kind, ids=None):
+        # records of kind with their genre ids, all of them or those in ids
+        model, genre_table = self.models[kind]
+        owner_column = getattr(genre_table.c, kind + '_id')
+        if kind == 'venue':
+            columns = [model.id, model.name, model.city, model.state, model.upcoming_shows_count]
+            make = VenueRecord
+        else:
+            columns = [model.id, model.name, model.city, model.state]
+            make = ArtistRecord
+        rows, links = self.db.session.query(*columns), self.db.session.query(owner_column, genre_table.c.genre_id)
+        if ids is not None:
+            rows, links = rows.filter(model.id.in_(ids)), links.filter(owner_column.in_(ids))
+        genre_ids = defaultdict(list)
+        for owner_id, genre_id in links:
+            genre_ids[owner_id].append(genre_id)
+        return [make(*row, genre_ids=tuple(sorted(genre_ids.get(row[0], ())))) for row in rows]
+
+    def load(self):
+        self.genre_names = dict(self.db.session.query(self.genre.id, self.genre.name))
+        for kind, collection in self.collections.items():
+            collection.load(self._rows(kind), self.genre_names)
+
+    def apply(self, changed):
+        ids = {kind: set(changed.get(model.__tablename__, ())) for kind, (model, _) in self.models.items()}
+        # a new show moves its venue's upcoming count
+        for chunk in _chunks(changed.get(self.show.__tablename__, ())):
+            ids['venue'].update(venue_id for (venue_id,) in self.db.session.query(self.show.venue_id)
+                                .filter(self.show.id.in_(chunk)))
+        genres_loaded = False
+        for kind, kind_ids in ids.items():
+            collection = self.collections[kind]
+            for chunk in _chunks(kind_ids):
+                records = self._rows(kind, chunk)
+                if not genres_loaded and any(genre_id not in self.genre_names
+                                             for record in records for genre_id in record.genre_ids):
+                    self.genre_names = dict(self.db.session.query(self.genre.id, self.genre.name))
+                    genres_loaded = True
+                for record_id in set(chunk) - {record.id for record in records}:
+                    collection.discard(record_id)  # deleted
+                for record in records:
+                    collection.put(record, self.genre_names)
+                self.stats['rows_reloaded'] += len(chunk)
+
+    # reading
+
+    def page(self, kind, columns, args, prefix=(), keep=None):
+        """One listing page of venues / artists, like keyset_page; items are records.
+
+        keep, if given, is called with each record id and drops the records it rejects.
+        """
+        self.sync()
+        with self.lock:
+            return self.collections[kind].page(columns, args, prefix, keep)
+
+    def search(self, kind, text):
+        self.sync()
+        with self.lock:
+            return self.collections[kind].search(text)
+
+    def area_counts(self, state=None):
+        """[(state, venue count)] in state order, or [(city, venue count)] of one state."""
+        self.sync()
+        with self.lock:
+            areas = list(self.collections['venue'].areas.items())
+        counts = Counter()
+        for (area_state, area_city), count in areas:
+            if state is None and area_state:
+                counts[area_state] += count
+            elif state is not None and area_state == state and area_city:
+                counts[area_city] += count
+        return sorted(counts.items())
+
+    def snapshot(self):
+        return dict(self.stats, venues=len(self.collections['venue'].records),
+                    artists=len(self.collections['artist'].records), change_id=self.change_id)
+
+
+def _chunks(items, size=IN_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
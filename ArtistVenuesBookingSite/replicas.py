@@ -0,0 +1,158 @@
+import random
+import threading
+import time
+
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, event, orm, text
+
+# Read replicas for GET requests.
+#
+# GET and HEAD requests read from a replica; everything else (form posts, deletes, CLI
+# commands) runs on the primary. A replica is skipped while its replay lag is above
+# REPLICA_MAX_LAG_SECONDS, or while it has not yet replayed the last write this client (or
+# this process) committed: after a commit the primary's WAL position is kept in the Flask
+# session, so a visitor always sees their own changes. Where no WAL position is available
+# (SQLite, a replica that is not in recovery) the client reads from the primary for
+# REPLICA_STICKY_SECONDS after a write instead. A request that sets g.read_primary (the page
+# cache, re-rendering a page it has just invalidated) reads from the primary too.
+
+LAG_QUERY = text(
+    'SELECT pg_last_wal_replay_lsn()::text, '
+    'CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END')
+
+
+def lsn_value(lsn):
+    # '16/B374D848' -> comparable int
+    if not lsn:
+        return None
+    high, low = lsn.split('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class Replica(object):
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.replayed = None  # WAL position replayed, as an int, or None if unknown
+        self.lag = 0.0
+        self.healthy = True
+        self.checked_at = None
+
+    def check(self):
+        self.checked_at = time.monotonic()
+        if self.engine.dialect.name != 'postgresql':
+            return
+        try:
+            with self.engine.connect() as connection:
+                lsn, lag = connection.execute(LAG_QUERY).one()
+        except Exception:
+            self.healthy = False
+            return
+        self.healthy = True
+        self.replayed = lsn_value(lsn)
+        self.lag = float(lag or 0)
+
+
+class ReplicaRouter(object):
+    """Picks the engine GET requests read from.
+
+    Configured by SQLALCHEMY_REPLICA_URIS (list of URLs, none by default),
+    REPLICA_MAX_LAG_SECONDS, REPLICA_CHECK_SECONDS (how long a lag reading is trusted) and
+    REPLICA_STICKY_SECONDS.
+    """
+
+    def __init__(self, app, db):
+        self.db = db
+        self.max_lag = app.config.get('REPLICA_MAX_LAG_SECONDS', 5)
+        self.check_interval = app.config.get('REPLICA_CHECK_SECONDS', 1)
+        self.sticky = app.config.get('REPLICA_STICKY_SECONDS', 5)
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        self.replicas = [Replica(create_engine(url, **options)) for url in app.config.get('SQLALCHEMY_REPLICA_URIS', [])]
+        self._lock = threading.Lock()
+        self._last_write = {'lsn': None, 'at': 0.0}  # this process's newest commit
+        self.stats = {'replica_reads': 0, 'primary_reads': 0, 'lagging': 0}
+        app.extensions['replica_router'] = self
+        if self.replicas:
+            event.listen(db.session, 'after_commit', self._after_commit)
+            app.after_request(self._remember_write)
+
+    @property
+    def engines(self):
+        return [replica.engine for replica in self.replicas]
+
+    def _after_commit(self, db_session):
+        if has_request_context() and request.method not in ('GET', 'HEAD'):
+            g.db_committed = True
+
+    def _remember_write(self, response):
+        if not g.pop('db_committed', False):
+            return response
+        lsn = None
+        if self.db.engine.dialect.name == 'postgresql':
+            with self.db.engine.connect() as connection:
+                lsn = connection.execute(text('SELECT pg_current_wal_lsn()::text')).scalar()
+        now = time.time()
+        session['db_write'] = [lsn, now]
+        with self._lock:
+            if lsn_value(lsn) and lsn_value(lsn) > lsn_value(self._last_write['lsn'] or '0/0'):
+                self._last_write['lsn'] = lsn
+            self._last_write['at'] = max(self._last_write['at'], now)
+        return response
+
+    def _caught_up(self, replica, lsn, written_at):
+        # has replica replayed the write at lsn / written_at?
+        if lsn_value(lsn) is not None and replica.replayed is not None:
+            if replica.replayed < lsn_value(lsn):
+                replica.check()
+            return replica.healthy and replica.replayed is not None and replica.replayed >= lsn_value(lsn)
+        return time.time() - written_at > self.sticky
+
+    def _choose(self):
+        client_lsn, client_at = session.get('db_write') or [None, 0.0]
+        with self._lock:
+            process_lsn, process_at = self._last_write['lsn'], self._last_write['at']
+        candidates = list(self.replicas)
+        random.shuffle(candidates)
+        for replica in candidates:
+            if replica.checked_at is None or time.monotonic() - replica.checked_at > self.check_interval:
+                replica.check()
+            if not replica.healthy or replica.lag > self.max_lag:
+                self.stats['lagging'] += 1
+                continue
+            if self._caught_up(replica, client_lsn, client_at) and self._caught_up(replica, process_lsn, process_at):
+                if client_lsn or client_at:
+                    # the replica has the client's writes; later requests need not check
+                    session.pop('db_write', None)
+                return replica.engine
+        return None
+
+    def read_engine(self):
+        """The replica engine for this request, or None to use the primary."""
+        if not self.replicas or not has_request_context() or request.method not in ('GET', 'HEAD'):
+            return None
+        if g.get('read_primary'):
+            return None
+        if 'db_read_engine' not in g:
+            g.db_read_engine = self._choose()
+            self.stats['replica_reads' if g.db_read_engine is not None else 'primary_reads'] += 1
+        return g.db_read_engine
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        router = self.app.extensions.get('replica_router')
+        if router is not None and not self._flushing:
+            engine = router.read_engine()
+            if engine is not None:
+                return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy whose session reads from a replica when ReplicaRouter says so."""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
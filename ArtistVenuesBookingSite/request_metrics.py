@@ -0,0 +1,127 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request, signals
+from sqlalchemy import event
+
+# Per-request SQL and template timings.
+#
+# Every statement run while a request is being handled is counted and timed through the
+# engine's cursor events; templates are timed through Flask's render signals. When the
+# response is ready, the totals go out as a Server-Timing header and one JSON log line on
+# the 'fyyur.requests' logger. A statement shape (the SQL with its IN lists collapsed) seen
+# more than NPLUSONE_THRESHOLD times in one request is logged as a likely N+1 pattern.
+# The async engine's statements count too (AsyncDatabase runs them in the request's context,
+# and passes its engines to instrument). A streamed body is still being read when the totals
+# are taken.
+
+logger = logging.getLogger('fyyur.requests')
+
+PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|%s|\$\d+|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|\$\d+|:\w+))*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    # the same query with any number of IN (...) parameters has one shape
+    return WHITESPACE.sub(' ', PLACEHOLDER_LIST.sub('(?)', statement)).strip()
+
+
+class RequestMetrics(object):
+    """Configured by REQUEST_METRICS (on/off), SERVER_TIMING (send the header) and
+    NPLUSONE_THRESHOLD (repeats of one statement shape before it is logged)."""
+
+    def __init__(self, app):
+        self.enabled = app.config.get('REQUEST_METRICS', False)
+        self.server_timing = app.config.get('SERVER_TIMING', True)
+        self.threshold = app.config.get('NPLUSONE_THRESHOLD', 5)
+        self._engines = set()
+        if not self.enabled:
+            return
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        if getattr(signals, 'signals_available', True):
+            signals.before_render_template.connect(self._before_render, app, weak=False)
+            signals.template_rendered.connect(self._after_render, app, weak=False)
+
+    def instrument(self, engine):
+        """Attach to engine's cursor events; calling it again for the same engine does nothing."""
+        if not self.enabled or id(engine) in self._engines:
+            return
+        self._engines.add(id(engine))
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    @staticmethod
+    def _current():
+        return g.get('request_metrics') if has_request_context() else None
+
+    def _start(self):
+        g.request_metrics = {'started': time.perf_counter(), 'statements': 0, 'db_seconds': 0.0,
+                             'slowest_seconds': 0.0, 'slowest': None, 'shapes': Counter(),
+                             'template_seconds': 0.0, 'templates': []}
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._current() is not None:
+            conn.info.setdefault('request_metrics_started', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        metrics = self._current()
+        started = conn.info.get('request_metrics_started')
+        if metrics is None or not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        shape = statement_shape(statement)
+        metrics['statements'] += 1
+        metrics['db_seconds'] += elapsed
+        metrics['shapes'][shape] += 1
+        if elapsed > metrics['slowest_seconds']:
+            metrics['slowest_seconds'] = elapsed
+            metrics['slowest'] = shape
+
+    def _before_render(self, sender, template, context, **extra):
+        metrics = self._current()
+        if metrics is not None:
+            metrics['templates'].append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        metrics = self._current()
+        if metrics is not None and metrics['templates']:
+            metrics['template_seconds'] += time.perf_counter() - metrics['templates'].pop()
+
+    def _finish(self, response):
+        metrics = g.pop('request_metrics', None)
+        if metrics is None:
+            return response
+        total = time.perf_counter() - metrics['started']
+        repeated = [(shape, count) for shape, count in metrics['shapes'].most_common()
+                    if count > self.threshold]
+        if self.server_timing:
+            response.headers.add('Server-Timing', 'db;dur={:.2f};desc="{} statements"'.format(
+                metrics['db_seconds'] * 1000, metrics['statements']))
+            response.headers.add('Server-Timing', 'tpl;dur={:.2f}'.format(metrics['template_seconds'] * 1000))
+            response.headers.add('Server-Timing', 'total;dur={:.2f}'.format(total * 1000))
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(metrics['db_seconds'] * 1000, 2),
+            'statements': metrics['statements'],
+            'slowest_ms': round(metrics['slowest_seconds'] * 1000, 2),
+            'slowest': metrics['slowest'] and metrics['slowest'][:300],
+            'template_ms': round(metrics['template_seconds'] * 1000, 2),
+            'cache': response.headers.get('X-Cache')
+        }))
+        for shape, count in repeated:
+            logger.warning(json.dumps({
+                'event': 'n_plus_one',
+                'endpoint': request.endpoint,
+                'path': request.path,
+                'count': count,
+                'statement': shape[:300]
+            }))
+        return response
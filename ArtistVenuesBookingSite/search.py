@@ -0,0 +1,188 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+from sqlalchemy import Text, case, event, false, func, literal, true
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+# Full-text search over venues and artists.
+#
+# On Postgres every searchable row carries a `search_vector` tsvector built from its name
+# (weight A), city and state (weight B) and genre names (weight C), indexed with GIN, and
+# queries are ranked with ts_rank. With SEARCH_TRIGRAM enabled, pg_trgm similarity on the
+# name also matches misspelt terms. On any other database (SQLite test runs) the column
+# holds the plain document text and matching is served by an in-process inverted index.
+
+SearchVector = TSVECTOR().with_variant(Text(), 'sqlite')
+
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2}
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return WORD.findall((text or '').lower())
+
+
+def document_parts(name, city, state, genre_names):
+    # (weight, text) pairs that make up a venue's or artist's search document
+    return [
+        ('A', name or ''),
+        ('B', ' '.join(filter(None, [city, state]))),
+        ('C', ' '.join(filter(None, genre_names)))
+    ]
+
+
+def entity_parts(entity):
+    return document_parts(entity.name, entity.city, entity.state, [genre.name for genre in entity.genres])
+
+
+def tsvector_expression(parts):
+    vector = None
+    for weight, text in parts:
+        weighted = func.setweight(func.to_tsvector('simple', text), weight)
+        vector = weighted if vector is None else vector.op('||')(weighted)
+    return vector
+
+
+class SearchIndex(object):
+    """Pure-Python inverted index used where Postgres full-text search is unavailable.
+
+    Terms are matched as prefixes of document tokens, every term must match, and documents
+    are ranked by the summed weight of the fields the terms matched in.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(dict)  # token -> {doc_id: weight}
+        self.documents = {}  # doc_id -> tuple of tokens, to unindex on update/delete
+        self._vocabulary = []
+        self._stale = False
+
+    def add(self, doc_id, parts):
+        self.remove(doc_id)
+        tokens = set()
+        for weight, text in parts:
+            for token in tokenize(text):
+                postings = self.postings[token]
+                postings[doc_id] = max(postings.get(doc_id, 0), WEIGHTS[weight])
+                tokens.add(token)
+        self.documents[doc_id] = tuple(tokens)
+        self._stale = True
+
+    def remove(self, doc_id):
+        for token in self.documents.pop(doc_id, ()):
+            postings = self.postings[token]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[token]
+                self._stale = True
+
+    def _prefixed(self, term):
+        if self._stale:
+            self._vocabulary = sorted(self.postings)
+            self._stale = False
+        i = bisect_left(self._vocabulary, term)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(term):
+            yield self._vocabulary[i]
+            i += 1
+
+    def search(self, text):
+        # {doc_id: score} of documents matching every term of text
+        scores = None
+        for term in tokenize(text):
+            term_scores = {}
+            for token in self._prefixed(term):
+                for doc_id, weight in self.postings[token].items():
+                    term_scores[doc_id] = max(term_scores.get(doc_id, 0), weight)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc_id: score + term_scores[doc_id]
+                          for doc_id, score in scores.items() if doc_id in term_scores}
+            if not scores:
+                break
+        return scores or {}
+
+
+class Search(object):
+    """Keeps the search vectors of the given models current and builds ranked match clauses."""
+
+    def __init__(self, db, *models):
+        self.db = db
+        self.models = models
+        self.indexes = {}  # model -> SearchIndex, for the fallback only
+        event.listen(db.session, 'before_flush', self._before_flush)
+        event.listen(db.session, 'after_flush', self._after_flush)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+
+    @property
+    def postgres(self):
+        return self.db.engine.dialect.name == 'postgresql'
+
+    def _searchable(self, objects):
+        return [obj for obj in objects if isinstance(obj, self.models)]
+
+    def vector(self, parts):
+        # value for the search_vector column: a tsvector expression, or the plain text elsewhere
+        if self.postgres:
+            return tsvector_expression(parts)
+        return '\n'.join(text for _, text in parts)
+
+    def _before_flush(self, session, flush_context, instances):
+        for obj in self._searchable(list(session.new) + list(session.dirty)):
+            obj.search_vector = self.vector(entity_parts(obj))
+
+    def _after_flush(self, session, flush_context):
+        if self.postgres:
+            return
+        pending = session.info.setdefault('search_pending', [])
+        for obj in self._searchable(list(session.new) + list(session.dirty)):
+            pending.append((type(obj), obj.id, entity_parts(obj)))
+        for obj in self._searchable(session.deleted):
+            pending.append((type(obj), obj.id, None))
+
+    def _after_commit(self, session):
+        for model, doc_id, parts in session.info.pop('search_pending', []):
+            index = self.indexes.get(model)
+            if index is None:
+                continue  # not built yet; it will read the committed row when it is
+            if parts is None:
+                index.remove(doc_id)
+            else:
+                index.add(doc_id, parts)
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop('search_pending', None)
+
+    def _index(self, model):
+        index = self.indexes.get(model)
+        if index is None:
+            index = SearchIndex()
+            for doc_id, document in self.db.session.query(model.id, model.search_vector):
+                lines = (document or '').split('\n')
+                index.add(doc_id, list(zip('ABC', lines)))
+            self.indexes[model] = index
+        return index
+
+    def match(self, model, text, trigram=False):
+        """(filter clause, rank expression) for rows of model matching text.
+
+        Order by the rank descending to get the best matches first. An empty search
+        matches every row.
+        """
+        terms = tokenize(text)
+        if not terms:
+            return true(), literal(0)
+        if not self.postgres:
+            scores = self._index(model).search(text)
+            if not scores:
+                return false(), literal(0)
+            return model.id.in_(scores), case(scores, value=model.id, else_=0)
+
+        query = func.to_tsquery('simple', ' & '.join(term + ':*' for term in terms))
+        clause = model.search_vector.op('@@')(query)
+        rank = func.ts_rank(model.search_vector, query)
+        if trigram:
+            clause = clause | model.name.op('%')(text)
+            rank = rank + func.similarity(model.name, text)
+        return clause, rank
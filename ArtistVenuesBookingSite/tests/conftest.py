@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# Functional tests through the test client, against a fresh SQLite database that lives for the
+# whole run. Each test adds the rows it needs, in a state of its own where counts matter.
+
+
+def pytest_configure(config):
+    # the app reads DATABASE_URL when it is first imported
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'fyyur_test.db')
+
+
+@pytest.fixture(scope='session')
+def fyyur():
+    import app as fyyur
+
+    with fyyur.app.app_context():
+        fyyur.db.create_all()
+    fyyur.app.config['WTF_CSRF_ENABLED'] = False
+    return fyyur
+
+
+@pytest.fixture
+def client(fyyur):
+    return fyyur.app.test_client()
+
+
+@pytest.fixture(scope='session')
+def add(fyyur):
+    """add(Model, **values) commits a new row and returns its id."""
+    def run(model, genres=(), **values):
+        with fyyur.app.app_context():
+            row = model(**values)
+            if genres:
+                row.genres = fyyur.genre_cache.resolve(list(genres))
+            fyyur.db.session.add(row)
+            fyyur.db.session.commit()
+            return row.id
+    return run
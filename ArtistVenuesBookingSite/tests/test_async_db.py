@@ -0,0 +1,47 @@
+import os
+import tempfile
+
+import pytest
+from flask import has_request_context, request
+from sqlalchemy import create_engine, event, text
+
+from async_db import AsyncDatabase
+
+
+@pytest.fixture
+def replica_url():
+    url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'fyyur_replica.db')
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE origin (name TEXT)"))
+        connection.execute(text("INSERT INTO origin VALUES ('replica')"))
+    return engine
+
+
+@pytest.fixture
+def async_db(fyyur, replica_url):
+    pytest.importorskip('aiosqlite')
+    seen = []
+
+    def instrument(engine):
+        # which request each statement ran in, by path
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_execute(*args):
+            seen.append(request.path if has_request_context() else None)
+    async_db = AsyncDatabase(fyyur.app.config['SQLALCHEMY_DATABASE_URI'], [str(replica_url.url)],
+                             instrument=instrument)
+    async_db.seen = seen
+    yield async_db
+    async_db.dispose()
+
+
+def test_reads_from_the_chosen_replica(fyyur, async_db, replica_url):
+    with fyyur.app.test_request_context('/venues/1'):
+        [(name,)], [(one,)] = async_db.all(text('SELECT name FROM origin'), text('SELECT 1'), bind=replica_url)
+    assert (name, one) == ('replica', 1)
+
+
+def test_statements_run_in_the_request(fyyur, async_db):
+    with fyyur.app.test_request_context('/artists/1'):
+        async_db.all(text('SELECT 1'), text('SELECT 2'))
+    assert async_db.seen == ['/artists/1', '/artists/1']
@@ -0,0 +1,45 @@
+def changes_of(fyyur, venue_id):
+    Change = fyyur.Change
+    return [op for (op,) in fyyur.db.session.query(Change.op)
+            .filter(Change.table_name == 'Venue', Change.row_id == venue_id).order_by(Change.id)]
+
+
+def test_writes_are_logged_when_they_commit(fyyur):
+    with fyyur.app.app_context():
+        venue = fyyur.Venue(name='Logged Hall', city='Dover', state='DE', phone='3025550100')
+        fyyur.db.session.add(venue)
+        fyyur.db.session.flush()
+        venue_id = venue.id
+        assert changes_of(fyyur, venue_id) == []  # written at commit, not at flush
+        fyyur.db.session.commit()
+        assert changes_of(fyyur, venue_id) == ['insert']
+
+        venue = fyyur.Venue.query.get(venue_id)
+        venue.name = 'Logged Hall II'
+        fyyur.db.session.commit()
+        assert changes_of(fyyur, venue_id) == ['insert', 'update']
+
+
+def test_rolled_back_writes_are_not_logged(fyyur):
+    with fyyur.app.app_context():
+        venue = fyyur.Venue(name='Unlogged Hall', city='Dover', state='DE', phone='3025550100')
+        fyyur.db.session.add(venue)
+        fyyur.db.session.flush()
+        venue_id = venue.id
+        fyyur.change_log.record('Venue', [venue_id], 'counts')
+        fyyur.db.session.rollback()
+
+        fyyur.db.session.add(fyyur.Genre(name='Changelog Test'))
+        fyyur.db.session.commit()
+        assert changes_of(fyyur, venue_id) == []
+
+
+def test_later_commits_get_higher_ids(fyyur, add):
+    first = add(fyyur.Venue, name='First Hall', city='Dover', state='DE', phone='3025550100')
+    second = add(fyyur.Venue, name='Second Hall', city='Dover', state='DE', phone='3025550100')
+    with fyyur.app.app_context():
+        Change = fyyur.Change
+        ids = dict(fyyur.db.session.query(Change.row_id, Change.id)
+                   .filter(Change.table_name == 'Venue', Change.row_id.in_([first, second])))
+        assert ids[first] < ids[second]
+        assert fyyur.change_log.latest('Venue')[0] >= ids[second]
@@ -0,0 +1,26 @@
+import pytest
+
+
+@pytest.fixture(scope='module')
+def venues(fyyur, add):
+    # one Jazz venue in Wyoming, two in Nevada (one of them also Blues)
+    add(fyyur.Venue, name='Cheyenne Cellar', city='Cheyenne', state='WY', phone='3075550100', genres=['Jazz'])
+    add(fyyur.Venue, name='Reno Room', city='Reno', state='NV', phone='7755550100', genres=['Jazz', 'Blues'])
+    add(fyyur.Venue, name='Vegas Vault', city='Las Vegas', state='NV', phone='7025550100', genres=['Jazz'])
+
+
+@pytest.mark.parametrize('match', ['all', 'any'])
+def test_genre_filter_within_state(client, venues, match):
+    page = client.get('/venues', query_string={'state': 'WY', 'genre': 'Jazz', 'match': match}).get_data(as_text=True)
+    assert 'Cheyenne Cellar' in page
+    assert 'Reno Room' not in page and 'Vegas Vault' not in page
+    assert '>Jazz</a> (1)' in page
+
+
+def test_any_genre_within_state_counts_only_the_state(client, venues):
+    page = client.get('/venues', query_string=[('state', 'NV'), ('genre', 'Jazz'), ('genre', 'Blues'),
+                                               ('match', 'any')]).get_data(as_text=True)
+    assert 'Reno Room' in page and 'Vegas Vault' in page
+    assert 'Cheyenne Cellar' not in page
+    assert '>Jazz</a> (2)' in page
+    assert '>Blues</a> (1)' in page
@@ -0,0 +1,24 @@
+import json
+from datetime import datetime, timedelta
+
+
+def test_import_shows_rejects_bad_rows(fyyur, add, tmp_path):
+    venue_id = add(fyyur.Venue, name='Import Hall', city='Helena', state='MT', phone='4065550100')
+    artist_id = add(fyyur.Artist, name='Import Band', city='Helena', state='MT', phone='4065550101')
+    start = (datetime.now() + timedelta(days=30)).replace(microsecond=0)
+    rows = [
+        {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start.isoformat()},
+        # the default end time lies past datetime.max
+        {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '9999-12-31 23:00'},
+        {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': 'not a date'},
+    ]
+    path = tmp_path / 'shows.jsonl'
+    path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+
+    result = fyyur.app.test_cli_runner().invoke(args=['import', 'shows', str(path)])
+
+    assert result.exit_code == 0, result.output
+    rejected = [json.loads(line) for line in (tmp_path / 'shows.jsonl.rejected.jsonl').read_text().splitlines()]
+    assert [reject['line'] for reject in rejected] == [2, 3]
+    with fyyur.app.app_context():
+        assert fyyur.Show.query.filter_by(venue_id=venue_id).count() == 1
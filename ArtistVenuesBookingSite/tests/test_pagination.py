@@ -0,0 +1,41 @@
+import base64
+import json
+
+import pytest
+
+
+def token(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+@pytest.fixture(scope='module')
+def venues(fyyur, add):
+    for i in range(3):
+        add(fyyur.Venue, name='Page Hall {}'.format(i), city='Salem', state='OR', phone='5035550100')
+
+
+def test_next_page_cursor(client, venues):
+    first = client.get('/venues', query_string={'state': 'OR', 'city': 'Salem', 'per_page': 2})
+    assert first.status_code == 200
+    page = first.get_data(as_text=True)
+    assert 'Page Hall 0' in page and 'Page Hall 2' not in page
+
+    cursor = page.split('after=')[1].split('"')[0].split('&')[0]
+    second = client.get('/venues?state=OR&city=Salem&per_page=2&after=' + cursor).get_data(as_text=True)
+    assert 'Page Hall 2' in second and 'Page Hall 0' not in second
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64 json',
+    token(['OR', 'Salem', 'Page Hall 0']),  # a key missing
+    token(['OR', 'Salem', 'Page Hall 0', 'one']),  # text for the integer id
+    token(['OR', 'Salem', ['Page Hall 0'], 1]),  # a list for a text key
+    token(['OR', 'Salem', 'Page Hall 0', True]),
+])
+def test_bad_cursor_is_a_400(client, venues, cursor):
+    assert client.get('/venues', query_string={'after': cursor}).status_code == 400
+    assert client.get('/artists', query_string={'before': cursor}).status_code == 400
+
+
+def test_bad_show_cursor_is_a_400(client):
+    assert client.get('/shows', query_string={'after': token(['yesterday', 1])}).status_code == 400
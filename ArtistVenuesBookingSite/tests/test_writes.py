@@ -0,0 +1,57 @@
+def venue_form(**values):
+    form = {'name': 'Edited Hall', 'city': 'Boise', 'state': 'ID', 'address': '1 Main Street',
+            'phone': '208-555-0100', 'genres': ['Jazz', 'Blues'], 'website_link': 'https://example.com',
+            'seeking_talent': 'y', 'seeking_description': 'Looking for bands'}
+    form.update(values)
+    return form
+
+
+def artist_form(**values):
+    form = {'name': 'Edited Band', 'city': 'Boise', 'state': 'ID', 'phone': '208-555-0101',
+            'genres': ['Rock'], 'website_link': 'https://example.com', 'seeking_venue': 'y',
+            'seeking_description': 'Looking for a stage'}
+    form.update(values)
+    return form
+
+
+def test_edit_venue(fyyur, client, add):
+    venue_id = add(fyyur.Venue, name='Old Hall', city='Boise', state='ID', phone='2085550100', genres=['Jazz'])
+    assert 'Old Hall' in client.get('/venues/{}'.format(venue_id)).get_data(as_text=True)
+
+    response = client.post('/venues/{}/edit'.format(venue_id), data=venue_form())
+    assert response.status_code == 302
+
+    with fyyur.app.app_context():
+        venue = fyyur.Venue.query.get(venue_id)
+        assert (venue.name, venue.city, venue.phone, venue.seeking_talent) == ('Edited Hall', 'Boise', '2085550100', True)
+        assert sorted(genre.name for genre in venue.genres) == ['Blues', 'Jazz']
+    # the cached detail page was invalidated
+    assert 'Edited Hall' in client.get('/venues/{}'.format(venue_id)).get_data(as_text=True)
+
+
+def test_edit_artist(fyyur, client, add):
+    artist_id = add(fyyur.Artist, name='Old Band', city='Boise', state='ID', phone='2085550101', genres=['Folk'])
+    assert 'Old Band' in client.get('/artists/{}'.format(artist_id)).get_data(as_text=True)
+
+    response = client.post('/artists/{}/edit'.format(artist_id), data=artist_form())
+    assert response.status_code == 302
+
+    with fyyur.app.app_context():
+        artist = fyyur.Artist.query.get(artist_id)
+        assert (artist.name, artist.website, artist.seeking_venue) == ('Edited Band', 'https://example.com', True)
+        assert [genre.name for genre in artist.genres] == ['Rock']
+    assert 'Edited Band' in client.get('/artists/{}'.format(artist_id)).get_data(as_text=True)
+
+
+def test_delete_venue(fyyur, client, add):
+    venue_id = add(fyyur.Venue, name='Closing Hall', city='Boise', state='ID', phone='2085550100')
+    assert 'Closing Hall' in client.get('/venues').get_data(as_text=True)
+
+    response = client.delete('/venues/{}'.format(venue_id))
+    assert response.status_code == 200
+    assert response.get_json() == {'success': True}
+
+    with fyyur.app.app_context():
+        assert fyyur.Venue.query.get(venue_id) is None
+    assert 'Closing Hall' not in client.get('/venues').get_data(as_text=True)
+    assert client.get('/venues/{}'.format(venue_id)).status_code != 200